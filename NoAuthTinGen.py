@@ -3,10 +3,10 @@ from pathlib import Path
 from TinGen.utils import CompressionFlag
 from TinGen.utils import create_tinfoil_index
 from TinGen import UTinGen
+from TinGen.utils import format_bytes
 from urllib3 import disable_warnings as disable_url_warnings
 
 if __name__ == "__main__":
-    disable_url_warnings()
     parser = ArgumentParser(
         description="Script that will allow you to easily generate an index " +
         "file with Google Drive file links for use with Tinfoil without " +
@@ -21,7 +21,17 @@ if __name__ == "__main__":
     parser.add_argument(
         "--index-path",
         default="index.tfl",
-        help="File path for unencrypted index file to update",
+        help="File path for index file to write, or to update with --merge",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Keeps the entries of the existing index file and only adds " +
+        "or updates the files found in the scanned folder IDs",
+    )
+    parser.add_argument(
+        "--private-key",
+        help="File path for private key to read an encrypted index with",
     )
     parser.add_argument(
         "--add-nsw-files-without-title-id",
@@ -34,6 +44,35 @@ if __name__ == "__main__":
         help="Adds files without valid NSW ROM extension(NSP/NSZ/XCI/XCZ) " +
         "to index",
     )
+    parser.add_argument(
+        "--no-recursion",
+        dest="recursion",
+        action="store_false",
+        help="Scans for files only in top directory for each folder ID",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of folders to list concurrently",
+    )
+    parser.add_argument(
+        "--host-concurrency",
+        type=int,
+        default=4,
+        help="Maximum concurrent requests to a single host",
+    )
+    parser.add_argument(
+        "--host-delay",
+        type=float,
+        default=0.0,
+        help="Minimum delay in seconds between requests to a single host",
+    )
+    parser.add_argument(
+        "--insecure",
+        action="store_true",
+        help="Skips TLS certificate verification for Google Drive requests",
+    )
     parser.add_argument(
         "--encrypt",
         action="store_true",
@@ -72,12 +111,32 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    generator = UTinGen()
+    if args.insecure:
+        disable_url_warnings()
+
+    generator = UTinGen(
+        workers=args.workers,
+        host_concurrency=args.host_concurrency,
+        host_interval=args.host_delay,
+        verify=not args.insecure,
+    )
+
+    if args.merge:
+        generator.read_index(
+            Path(args.index_path),
+            Path(args.private_key) if args.private_key else None,
+        )
+        print(
+            f"Merging into {len(generator.index['files']):,} entries " +
+            f"from {args.index_path}"
+        )
+
     generator.index_generator(
         args.folder_ids,
         add_non_nsw_files=args.add_non_nsw_files,
         add_nsw_files_without_title_id=args.add_nsw_files_without_title_id,
         success=args.success,
+        recursion=args.recursion,
     )
 
     compression_flag = CompressionFlag.ZSTD_COMPRESSION
@@ -103,3 +162,12 @@ if __name__ == "__main__":
             Path(args.index_path),
             compression_flag,
         )
+
+    transfer_stats = generator.gdrive_service.stats
+    received_fmt = format_bytes(transfer_stats["bytes_received"])
+    decoded_fmt = format_bytes(transfer_stats["bytes_decoded"])
+    print(
+        f"{transfer_stats['requests']:,} requests, " +
+        f"{received_fmt[0]} {received_fmt[1]} received " +
+        f"({decoded_fmt[0]} {decoded_fmt[1]} decoded)"
+    )
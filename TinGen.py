@@ -2,12 +2,136 @@
 # -*- coding: utf8 -*-
 from google.auth.credentials import Credentials
 from TinGen.utils import create_tinfoil_index
+from TinGen.utils import create_tinfoil_indexes
 from TinGen.utils import CompressionFlag
+from TinGen.utils import format_bytes
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from argparse import Namespace
+from TinGen.watch import IndexWatcher
+from TinGen.server import IndexServer
+from TinGen.diff import diff_index_entries
+from TinGen.diff import index_fingerprint
+from TinGen.diff import load_previous_index_state
+from TinGen.diff import save_index_state
+from functools import partial
 from TinGen import TinGen
+from TinGen.rules import CrawlRules
+from TinGen.credentials import CredentialPool
+from TinGen.pipeline import IndexPipeline
+from TinGen.budget import coverage_summary
+from TinGen.budget import load_root_entries
+from TinGen.budget import order_folders
+from TinGen.budget import save_root_entries
+from TinGen.frontier import CrawlFrontier
+from TinGen.frontier import run_crawl_worker
 from pathlib import Path
+from json import load as json_reader
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from time import sleep
+from multiprocessing import get_context
 
-if __name__ == '__main__':
+
+OUTPUT_FORMATS = {
+    'zstd': CompressionFlag.ZSTD_COMPRESSION,
+    'zlib': CompressionFlag.ZLIB_COMPRESSION,
+    'none': CompressionFlag.NO_COMPRESSION,
+    'json': None,
+}
+
+TARGET_OPTIONS = (
+    'folder_ids',
+    'index_file',
+    'outputs',
+    'add_nsw_files_without_title_id',
+    'add_non_nsw_files',
+    'extensions',
+    'latest_versions_only',
+    'verify',
+    'verify_report_only',
+    'verify_cache',
+    'verify_max_age',
+    'add_nsw_info_to_success',
+    'add_update_date_to_success',
+    'add_update_time_to_success',
+    'success',
+    'tinfoil_min_ver',
+    'theme_blacklist',
+    'theme_whitelist',
+    'theme_error',
+    'zstandard',
+    'zlib',
+    'no_compress',
+    'encrypt',
+    'public_key',
+    'vm_file',
+    'share_files',
+    'upload_folder_id',
+    'upload_to_my_drive',
+    'new_upload_id',
+    'share_uploaded_index',
+    'diff',
+    'diff_state',
+    'add_changes_to_success',
+    'skip_unchanged',
+)
+
+BATCH_OPTIONS = (
+    'token',
+    'credentials',
+    'headless',
+    'extra_tokens',
+    'service_accounts',
+    'requests_per_second',
+    'connection_pool_size',
+    'parents_batch_size',
+    'frontier',
+    'crawl_workers',
+    'frontier_worker',
+    'frontier_lease',
+    'flat_shared_drives',
+    'auth',
+    'generator',
+    'config',
+    'jobs',
+    'job_workers',
+    'targets',
+    'pipeline',
+    'pipeline_queue_size',
+    'watch',
+    'watch_min_interval',
+    'watch_max_interval',
+    'serve',
+    'serve_host',
+    'serve_port',
+)
+
+
+def output_spec(spec):
+    """Parses PATH,FORMAT[,encrypt] into (path, compression flag, encrypt)"""
+    spec_parts = spec.split(',')
+    if len(spec_parts) not in (2, 3) or \
+            spec_parts[1] not in OUTPUT_FORMATS or \
+            (len(spec_parts) == 3 and spec_parts[2] != 'encrypt'):
+        raise ArgumentTypeError(
+            f'Invalid output "{spec}", expected PATH,FORMAT[,encrypt] with ' +
+            'FORMAT one of ' + ', '.join(OUTPUT_FORMATS)
+        )
+
+    encrypt = len(spec_parts) == 3
+    if encrypt and spec_parts[1] == 'json':
+        raise ArgumentTypeError(f'JSON output "{spec}" can\'t be encrypted')
+
+    return (Path(spec_parts[0]), OUTPUT_FORMATS[spec_parts[1]], encrypt)
+
+
+def extension_name(extension):
+    """Normalizes an extension like ".NSP" to "nsp"."""
+    return extension.lower().lstrip('.')
+
+
+def build_parser():
     parser = ArgumentParser(
         description='Script that will allow you to generate an index file ' +
         'with Google Drive file links for use with Tinfoil',
@@ -30,6 +154,38 @@ if __name__ == '__main__':
         metavar='TOKEN_FILE_PATH',
         help='Path to Google OAuth2.0 User Token',
     )
+    parser.add_argument(
+        '--extra-token',
+        dest='extra_tokens',
+        action='append',
+        metavar='TOKEN_FILE_PATH',
+        help='Path to an additional Google OAuth2.0 User Token to spread ' +
+        'Drive requests over. Can be passed multiple times',
+    )
+    parser.add_argument(
+        '--service-account',
+        dest='service_accounts',
+        action='append',
+        metavar='SERVICE_ACCOUNT_FILE_PATH',
+        help='Path to a Google service account key to spread Drive ' +
+        'requests over. Can be passed multiple times',
+    )
+    parser.add_argument(
+        '--requests-per-second',
+        metavar='REQUESTS',
+        type=float,
+        help='Maximum Drive API requests per second for each token or ' +
+        'service account. Defaults to no limit for a single token and ' +
+        '10 when several credentials are pooled',
+    )
+    parser.add_argument(
+        '--connection-pool-size',
+        metavar='CONNECTIONS',
+        default=10,
+        type=int,
+        help='Number of kept-alive connections to Google Drive for each ' +
+        'token or service account',
+    )
     parser.add_argument(
         '--headless',
         action='store_true',
@@ -42,11 +198,47 @@ if __name__ == '__main__':
         default='index.tfl',
         help='Path to output index file',
     )
+    parser.add_argument(
+        '--output',
+        dest='outputs',
+        action='append',
+        type=output_spec,
+        metavar='PATH,FORMAT[,encrypt]',
+        help='Additional index variant to write from the same scan, with ' +
+        'FORMAT one of zstd, zlib, none or json. Can be passed multiple ' +
+        'times. Only INDEX_FILE_PATH is uploaded',
+    )
+    parser.add_argument(
+        '--output-workers',
+        metavar='WORKERS',
+        type=int,
+        help='Number of processes compressing index variants',
+    )
     parser.add_argument(
         '--share-files',
         action='store_true',
         help='Share all files inside the index file',
     )
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help='Keep the entries of the existing INDEX_FILE_PATH and only ' +
+        'add or update the files found in the scanned Folder IDs. ' +
+        'Encrypted indexes need --private-key',
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Serialize the index while the scan is still running',
+    )
+    parser.add_argument(
+        '--pipeline-queue-size',
+        metavar='ITEMS',
+        default=1024,
+        type=int,
+        help='Number of files the scan may run ahead of the index ' +
+        'serialization',
+    )
     parser.add_argument(
         '--no-recursion',
         dest='recursion',
@@ -54,6 +246,115 @@ if __name__ == '__main__':
         help='Scans for files only in top directory for each Folder ID ' +
         'entered',
     )
+    parser.add_argument(
+        '--include-folder',
+        dest='include_folders',
+        action='append',
+        metavar='PATTERN',
+        help='Only scan folders whose name, or path below the Folder ID ' +
+        'if PATTERN contains a "/", matches this glob. Can be passed ' +
+        'multiple times',
+    )
+    parser.add_argument(
+        '--exclude-folder',
+        dest='exclude_folders',
+        action='append',
+        metavar='PATTERN',
+        help='Never scan folders whose name, or path below the Folder ID ' +
+        'if PATTERN contains a "/", matches this glob. Can be passed ' +
+        'multiple times',
+    )
+    parser.add_argument(
+        '--max-depth',
+        metavar='DEPTH',
+        type=int,
+        help='Maximum folder depth below each Folder ID to scan',
+    )
+    parser.add_argument(
+        '--max-files-per-folder',
+        metavar='FILES',
+        type=int,
+        help='Maximum number of files to add from a single folder',
+    )
+    parser.add_argument(
+        '--parents-batch-size',
+        metavar='FOLDERS',
+        default=1,
+        type=int,
+        help='Number of folders to list with a single Drive query while ' +
+        'scanning recursively. Defaults to 1, which lists every folder ' +
+        'on its own. Batches Drive finds too complex are halved',
+    )
+    parser.add_argument(
+        '--frontier',
+        metavar='FRONTIER_FILE_PATH',
+        help='Crawl with separate worker processes sharing the folders ' +
+        'left to list through this SQLite file',
+    )
+    parser.add_argument(
+        '--crawl-workers',
+        metavar='WORKERS',
+        default=4,
+        type=int,
+        help='Number of local worker processes listing folders with ' +
+        '--frontier. 0 waits for workers started elsewhere',
+    )
+    parser.add_argument(
+        '--frontier-worker',
+        action='store_true',
+        help='Only list folders from an existing --frontier, e.g. on ' +
+        'another host sharing the file, and exit once none are left',
+    )
+    parser.add_argument(
+        '--frontier-lease',
+        metavar='SECONDS',
+        default=600.0,
+        type=float,
+        help='Time a worker has to list the folders it claimed before ' +
+        'they are handed to another worker',
+    )
+    parser.add_argument(
+        '--time-budget',
+        metavar='SECONDS',
+        type=float,
+        help='Stop scanning after SECONDS and write the index with the ' +
+        'files found so far',
+    )
+    parser.add_argument(
+        '--priority',
+        dest='priorities',
+        action='append',
+        metavar='FOLDER_ID',
+        help='Scan this Folder ID before the others. Can be passed ' +
+        'multiple times, the folders are scanned in the order given. ' +
+        'With --frontier, workers claim folders in that order',
+    )
+    parser.add_argument(
+        '--priority-by-activity',
+        action='store_true',
+        help='Scan the Folder IDs whose contents changed most recently ' +
+        'first',
+    )
+    parser.add_argument(
+        '--merge-unreached',
+        action='store_true',
+        help='With --time-budget, keep the entries of the previous run ' +
+        'for Folder IDs that weren\'t fully scanned',
+    )
+    parser.add_argument(
+        '--coverage-state',
+        metavar='STATE_FILE_PATH',
+        help='Path to file storing the entries found in each Folder ID ' +
+        'for --merge-unreached. Only written if given or with ' +
+        '--time-budget. Defaults to INDEX_FILE_PATH.roots.json',
+    )
+    parser.add_argument(
+        '--flat-shared-drive',
+        dest='flat_shared_drives',
+        action='store_true',
+        help='List folders on shared drives with one flat listing of the ' +
+        'whole shared drive instead of listing every folder',
+    )
     parser.add_argument(
         '--add-nsw-files-without-title-id',
         action='store_true',
@@ -65,6 +366,77 @@ if __name__ == '__main__':
         help='Adds files without valid NSW ROM extension(NSP/NSZ/XCI/XCZ) ' +
         'to index',
     )
+    parser.add_argument(
+        '--extensions',
+        nargs='+',
+        type=extension_name,
+        metavar='EXTENSION',
+        help='Only add NSW files with these extensions (e.g. nsp nsz) ' +
+        'instead of all of NSP/NSZ/XCI/XCZ',
+    )
+    parser.add_argument(
+        '--filter-pushdown',
+        action='store_true',
+        help='Filter NSW extensions in the Drive query instead of listing ' +
+        'all files. Drive matches names by word, so files whose extension ' +
+        'isn\'t a separate word (e.g. "Game[v0].nsp") may be missed',
+    )
+    parser.add_argument(
+        '--dedup-content',
+        action='store_true',
+        help='Fetch MD5 checksums while scanning and add only one entry ' +
+        'for files with identical content',
+    )
+    parser.add_argument(
+        '--prefer-root',
+        dest='preferred_roots',
+        action='append',
+        metavar='FOLDER_ID',
+        help='With --dedup-content, keep the copy found below this Folder ' +
+        'ID. Can be passed multiple times, earlier ones win. Otherwise ' +
+        'already shared copies are kept',
+    )
+    parser.add_argument(
+        '--latest-versions-only',
+        nargs='?',
+        const=1,
+        type=int,
+        metavar='VERSIONS_TO_KEEP',
+        help='Only keep the newest version (or the given number of newest ' +
+        'versions) of each base title, update and DLC',
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Check every index entry against Google Drive and drop ' +
+        'entries for files that were deleted, trashed or made private',
+    )
+    parser.add_argument(
+        '--verify-report-only',
+        action='store_true',
+        help='With --verify, only report dead entries instead of dropping ' +
+        'them',
+    )
+    parser.add_argument(
+        '--verify-cache',
+        metavar='CACHE_FILE_PATH',
+        help='Path to file storing when files were last verified. ' +
+        'Defaults to INDEX_FILE_PATH.verify.json',
+    )
+    parser.add_argument(
+        '--verify-max-age',
+        metavar='HOURS',
+        default=24.0,
+        type=float,
+        help='Skip files verified less than this many hours ago',
+    )
+    parser.add_argument(
+        '--verify-workers',
+        metavar='WORKERS',
+        default=4,
+        type=int,
+        help='Number of batch requests verifying files concurrently',
+    )
     parser.add_argument(
         '--add-nsw-info-to-success',
         action='store_true',
@@ -131,6 +503,107 @@ if __name__ == '__main__':
         help='Minimum Tinfoil client version to use index with',
     )
 
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        help='Compare the generated index with the previous run and ' +
+        'report added, removed and resized entries',
+    )
+    parser.add_argument(
+        '--diff-state',
+        metavar='STATE_FILE_PATH',
+        help='Path to file storing the previous index entries and ' +
+        'fingerprint. Defaults to INDEX_FILE_PATH.state.json',
+    )
+    parser.add_argument(
+        '--private-key',
+        metavar='PRIVATE_KEY_FILE_PATH',
+        help='Path to RSA Private Key to read previous encrypted index with',
+    )
+    parser.add_argument(
+        '--add-changes-to-success',
+        action='store_true',
+        help='Adds a summary of index changes since last run to index',
+    )
+    parser.add_argument(
+        '--skip-unchanged',
+        action='store_true',
+        help='Skip writing, sharing and uploading the index when its ' +
+        'content is unchanged since last run',
+    )
+    parser.add_argument(
+        '--targets',
+        metavar='TARGETS_FILE_PATH',
+        help='Path to JSON file with a list of index targets built from ' +
+        'one shared scan. Each target is an object of option overrides ' +
+        '(e.g. "index_file", "folder_ids", "extensions", ' +
+        '"add_non_nsw_files", "success") and needs an "index_file"',
+    )
+    parser.add_argument(
+        '--jobs',
+        metavar='JOBS_FILE_PATH',
+        help='Path to JSON file with a list of index jobs to run in this ' +
+        'process. Each job is an object of option overrides (e.g. ' +
+        '"folder_ids", "index_file", "success") and needs an ' +
+        '"index_file". Jobs share the Google Drive credentials and list ' +
+        'every folder at most once',
+    )
+    parser.add_argument(
+        '--job-workers',
+        metavar='WORKERS',
+        default=4,
+        type=int,
+        help='Number of jobs to run in parallel',
+    )
+    parser.add_argument(
+        '--config',
+        metavar='CONFIG_FILE_PATH',
+        help='Path to JSON file with default values for these options, ' +
+        'keyed by option name (e.g. "folder_ids", "success"). Reloaded on ' +
+        'SIGHUP in watch mode',
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running, poll Google Drive for changes and regenerate ' +
+        'and upload the index only when it changes',
+    )
+    parser.add_argument(
+        '--watch-min-interval',
+        metavar='SECONDS',
+        default=60.0,
+        type=float,
+        help='Shortest delay between change polls in watch mode',
+    )
+    parser.add_argument(
+        '--watch-max-interval',
+        metavar='SECONDS',
+        default=900.0,
+        type=float,
+        help='Longest delay between change polls in watch mode, reached ' +
+        'by doubling the delay after each poll without changes',
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Serve the generated index over HTTP with ETag and Range ' +
+        'support. Paths: /index.tfl (as configured), /index.zstd.tfl, ' +
+        '/index.zlib.tfl, /index.plain.tfl, /index.enc.tfl and /index.json',
+    )
+    parser.add_argument(
+        '--serve-host',
+        metavar='HOST',
+        default='0.0.0.0',
+        help='Address to serve the index on',
+    )
+    parser.add_argument(
+        '--serve-port',
+        metavar='PORT',
+        default=8080,
+        type=int,
+        help='Port to serve the index on',
+    )
+
     task_parser = parser.add_mutually_exclusive_group()
     task_parser.add_argument(
         '--auth',
@@ -178,28 +651,711 @@ if __name__ == '__main__':
         help='Error message to show if theme check fails',
     )
 
-    args = parser.parse_args()
+    return parser
+
+
+def load_option_sets(parser, args, config_path, kind, option_names):
+    """Reads a --targets or --jobs file into one set of options per entry.
+
+    Every entry is a dict of `option_names` values that override the
+    command line options, `kind` names an entry in error messages.
+    """
+    with open(config_path, 'r') as config_fp:
+        configs = json_reader(config_fp)
+
+    if not isinstance(configs, list) or not configs:
+        parser.error(f'{config_path} must hold a non-empty list of {kind}s')
+
+    option_sets = []
+    for config in configs:
+        unknown_options = [key for key in config if key not in option_names]
+        if unknown_options:
+            parser.error(
+                f'Unknown {kind} options in {config_path}: ' +
+                ', '.join(unknown_options)
+            )
+        if 'index_file' not in config:
+            parser.error(f'Every {kind} in {config_path} needs an index_file')
+
+        option_set = Namespace(**vars(args))
+        for (key, value) in config.items():
+            setattr(option_set, key, value)
+
+        try:
+            if config.get('outputs'):
+                option_set.outputs = [
+                    output_spec(spec) for spec in config['outputs']
+                ]
+        except ArgumentTypeError as error:
+            parser.error(str(error))
+
+        if option_set.extensions:
+            option_set.extensions = [
+                extension_name(extension)
+                for extension in option_set.extensions
+            ]
+
+        option_sets.append(option_set)
+
+    return option_sets
+
+
+def parse_args(argv=None):
+    """Parses options, using values from --config as defaults."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config, 'r') as config_fp:
+            config = json_reader(config_fp)
+        option_names = vars(args).keys()
+        unknown_options = [key for key in config if key not in option_names]
+        if unknown_options:
+            parser.error(
+                f'Unknown options in {args.config}: ' +
+                ', '.join(unknown_options)
+            )
+        parser.set_defaults(**config)
+        args = parser.parse_args(argv)
 
-    theme_msg = None
     if args.theme_error:
-        theme_msg = args.theme_error.replace('\\n', '\n').replace('\\t', '\t')
+        args.theme_error = args.theme_error.replace('\\n', '\n') \
+            .replace('\\t', '\t')
+
+    if args.success:
+        args.success = args.success.replace('\\n', '\n') \
+            .replace('\\t', '\t')
+
+    if args.parents_batch_size < 1:
+        parser.error('--parents-batch-size must be at least 1')
+
+    if args.pipeline:
+        pipeline_conflicts = [
+            option for (option, value) in (
+                ('--watch', args.watch),
+                ('--merge', args.merge),
+                ('--output', args.outputs),
+                ('--latest-versions-only', args.latest_versions_only),
+                ('--verify', args.verify),
+                ('--dedup-content', args.dedup_content),
+                ('--skip-unchanged', args.skip_unchanged),
+                ('--merge-unreached', args.merge_unreached),
+            )
+            if value
+        ]
+        if pipeline_conflicts:
+            parser.error(
+                '--pipeline can\'t be combined with ' +
+                ', '.join(pipeline_conflicts)
+            )
+
+    if args.merge and args.watch:
+        parser.error('--merge can\'t be combined with --watch')
+
+    if args.frontier or args.frontier_worker:
+        frontier_conflicts = [
+            option for (option, value) in (
+                ('--watch', args.watch),
+                ('--jobs', args.jobs),
+                ('--targets', args.targets),
+                ('--time-budget', args.time_budget),
+                ('--flat-shared-drive', args.flat_shared_drives),
+            )
+            if value
+        ]
+        if frontier_conflicts:
+            parser.error(
+                '--frontier can\'t be combined with ' +
+                ', '.join(frontier_conflicts)
+            )
+        if not args.frontier:
+            parser.error('--frontier-worker requires --frontier')
+
+    if args.time_budget and args.watch:
+        parser.error('--time-budget can\'t be combined with --watch')
+
+    if args.merge_unreached and not args.time_budget:
+        parser.error('--merge-unreached requires --time-budget')
+
+    if args.jobs:
+        job_conflicts = [
+            option for (option, value) in (
+                ('--watch', args.watch),
+                ('--serve', args.serve),
+                ('--pipeline', args.pipeline),
+                ('--targets', args.targets),
+            )
+            if value
+        ]
+        if job_conflicts:
+            parser.error(
+                '--jobs can\'t be combined with ' + ', '.join(job_conflicts)
+            )
+        args.jobs = load_option_sets(
+            parser,
+            args,
+            args.jobs,
+            'job',
+            [name for name in vars(args) if name not in BATCH_OPTIONS],
+        )
+
+    if args.targets:
+        target_conflicts = [
+            option for (option, value) in (
+                ('--watch', args.watch),
+                ('--serve', args.serve),
+                ('--pipeline', args.pipeline),
+                ('--merge', args.merge),
+                ('--time-budget', args.time_budget),
+            )
+            if value
+        ]
+        if target_conflicts:
+            parser.error(
+                '--targets can\'t be combined with ' +
+                ', '.join(target_conflicts)
+            )
+        args.targets = load_option_sets(
+            parser,
+            args,
+            args.targets,
+            'target',
+            TARGET_OPTIONS,
+        )
+
+    # A flat listing of a shared drive can't stop part way
+    if args.flat_shared_drives and any(
+        option_set.time_budget for option_set in [args] + (args.jobs or [])
+    ):
+        parser.error(
+            '--time-budget can\'t be combined with --flat-shared-drive'
+        )
+
+    if not args.theme_blacklist:
+        args.theme_blacklist = None
+
+    if not args.theme_whitelist:
+        args.theme_whitelist = None
+
+    return args
+
+
+def index_output_settings(args):
+    """Returns the compression flag, RSA public key and VM paths to use."""
+    compression_flag = CompressionFlag.ZSTD_COMPRESSION
+
+    if args.zstandard:
+        compression_flag = CompressionFlag.ZSTD_COMPRESSION
+    elif args.zlib:
+        compression_flag = CompressionFlag.ZLIB_COMPRESSION
+    elif args.no_compress:
+        compression_flag = CompressionFlag.NO_COMPRESSION
+
+    rsa_pub_key_path = None
+    vm_path = None
+    if args.encrypt:
+        if args.public_key:
+            rsa_pub_key_path = Path(args.public_key)
+
+        if args.vm_file:
+            vm_path = Path(args.vm_file)
+
+    return (compression_flag, rsa_pub_key_path, vm_path)
+
+
+def publish_index(generator, args, server=None, pipeline=None):
+    """Adds success messages, writes, shares and uploads the index."""
+    generator.reset_success_message()
+
+    if args.latest_versions_only:
+        print('Collapsing index to latest title versions')
+        generator.collapse_versions(args.latest_versions_only)
+
+    if args.verify:
+        print('Verifying index entries')
+        dead_entries = generator.prune_dead_files(
+            cache_path=Path(
+                args.verify_cache or f'{args.index_file}.verify.json'
+            ),
+            max_age=args.verify_max_age * 3600,
+            workers=args.verify_workers,
+            remove=not args.verify_report_only,
+        )
+        for (file_entry, status) in dead_entries:
+            print(f'{status.capitalize()}: {file_entry["url"]}')
+        if dead_entries and not args.verify_report_only:
+            print(f'Dropped {len(dead_entries)} dead entries from index')
+
+    track_changes = args.diff or args.add_changes_to_success or \
+        args.skip_unchanged
+    index_diff = None
+    fingerprint = None
+    unchanged = False
+
+    if track_changes:
+        state_path = Path(args.diff_state or f'{args.index_file}.state.json')
+        fingerprint = index_fingerprint(generator.index, extra=[
+            args.add_nsw_info_to_success,
+            args.success,
+            args.zstandard,
+            args.zlib,
+            args.no_compress,
+            args.encrypt,
+            args.public_key if args.encrypt else None,
+            args.vm_file if args.encrypt else None,
+            [
+                (str(out_path), output_flag, output_encrypt)
+                for (out_path, output_flag, output_encrypt)
+                in args.outputs or []
+            ],
+        ])
+        previous_state = load_previous_index_state(
+            state_path,
+            Path(args.index_file),
+            Path(args.private_key) if args.private_key else None,
+        )
+        index_diff = diff_index_entries(
+            previous_state['files'],
+            generator.index['files'],
+        )
+        print(index_diff.summary(), end='')
+        unchanged = previous_state['fingerprint'] == fingerprint and \
+            Path(args.index_file).is_file() and \
+            all(out_path.is_file() for (out_path, _, _) in args.outputs or [])
+
+    if args.add_nsw_info_to_success:
+        print('Adding NSW title information message to index')
+        generator.add_nsw_title_info_to_success()
+
+    if args.add_update_date_to_success or args.add_update_time_to_success:
+        print('Adding date/time information to index')
+        generator.add_datetime_to_success(
+            args.add_update_date_to_success,
+            args.add_update_time_to_success,
+        )
+
+    if args.add_changes_to_success and index_diff.changed:
+        print('Adding index changes message to index')
+        generator.update_index_success_message(index_diff.summary())
+
+    if args.success:
+        print('Adding success message to index')
+        generator.update_index_success_message(args.success)
+
+    compression_flag, rsa_pub_key_path, vm_path = index_output_settings(args)
+
+    if server is not None and not (unchanged and server.variants):
+        print('Updating served index')
+        server.update(
+            generator.index,
+            compression_flag,
+            rsa_pub_key_path=rsa_pub_key_path,
+            vm_path=vm_path,
+        )
+
+    if unchanged and args.skip_unchanged:
+        print('Index content unchanged, skipping write, share and upload')
+        return
+
+    if pipeline is not None:
+        print(f'Finishing pipelined index to {args.index_file}')
+        pipeline.finish(generator.index)
+    elif args.outputs:
+        outputs = [(Path(args.index_file), compression_flag, args.encrypt)]
+        outputs += args.outputs
+        for (out_path, _, _) in outputs:
+            print(f'Creating generated index to {out_path}')
+        create_tinfoil_indexes(
+            generator.index,
+            outputs,
+            rsa_pub_key_path=Path(args.public_key) if args.public_key
+            else None,
+            vm_path=Path(args.vm_file) if args.vm_file else None,
+            max_workers=args.output_workers,
+        )
+    else:
+        print(f'Creating generated index to {args.index_file}')
+        create_tinfoil_index(
+            generator.index,
+            Path(args.index_file),
+            compression_flag,
+            rsa_pub_key_path=rsa_pub_key_path,
+            vm_path=vm_path,
+        )
+
+    if track_changes:
+        save_index_state(state_path, fingerprint, generator.index['files'])
+
+    if args.share_files:
+        print('Sharing files in index')
+        for folder_id in args.folder_ids:
+            generator.gdrive_service.share_file(folder_id)
+        # generator.share_index_files()
+
+    if args.upload_folder_id:
+        print(f'Uploading {args.index_file} to {args.upload_folder_id}')
+        generator.gdrive_service.upload_file(
+            args.index_file,
+            args.upload_folder_id,
+            args.share_uploaded_index,
+            args.new_upload_id,
+        )
+
+    if args.upload_to_my_drive:
+        print(f'Uploading {args.index_file} to \"My Drive\"')
+        generator.gdrive_service.upload_file(
+            args.index_file,
+            None,
+            args.share_uploaded_index,
+            args.new_upload_id,
+        )
+
+
+def coverage_state_path(args):
+    """Returns where the entries found in each Folder ID are stored."""
+    return Path(args.coverage_state or f'{args.index_file}.roots.json')
+
+
+def saves_coverage_state(args):
+    """Checks whether the entries found in each Folder ID are stored."""
+    return bool(
+        args.time_budget or args.merge_unreached or args.coverage_state
+    )
+
+
+def prioritized_folder_ids(generator, args):
+    """Orders the Folder IDs by --priority and --priority-by-activity."""
+    if not args.priorities and not args.priority_by_activity:
+        return args.folder_ids
+
+    modified_times = None
+    if args.priority_by_activity:
+        modified_times = generator.gdrive_service.get_modified_times(
+            args.folder_ids
+        )
+    return order_folders(
+        args.folder_ids,
+        priorities=args.priorities,
+        modified_times=modified_times,
+    )
+
+
+def generate_index(generator, args):
+    """Scans the Folder IDs in priority order, within the time budget."""
+    folder_ids = prioritized_folder_ids(generator, args)
+
+    deadline = None
+    if args.time_budget:
+        deadline = monotonic() + args.time_budget
+
+    generator.index_generator(
+        folder_ids,
+        args.recursion,
+        args.add_nsw_files_without_title_id,
+        args.add_non_nsw_files,
+        extensions=args.extensions,
+        deadline=deadline,
+    )
+
+    state_path = coverage_state_path(args)
+    merged_entries = 0
+    if args.merge_unreached:
+        merged_entries = generator.merge_unfinished_roots(
+            load_root_entries(state_path)
+        )
+    root_entries = generator.entries_by_root()
+    if saves_coverage_state(args):
+        save_root_entries(state_path, root_entries)
+    if deadline is None:
+        return
+
+    print(
+        coverage_summary(
+            generator.scan_coverage,
+            root_entries,
+            merged_entries,
+        ),
+        end='',
+    )
+
+
+def frontier_gdrive_options(args, worker_index, workers):
+    """Returns the GDrive options of one crawl worker process.
+
+    With at least one token per worker and no service accounts, every
+    worker gets its own tokens. Otherwise all workers share every
+    credential and split the request rate between them.
+    """
+    token_paths = [args.token] + (args.extra_tokens or [])
+    requests_per_second = args.requests_per_second
+    if len(token_paths) >= workers and not args.service_accounts:
+        token_paths = token_paths[worker_index::workers]
+    else:
+        if requests_per_second is None and \
+                len(token_paths) + len(args.service_accounts or []) > 1:
+            requests_per_second = CredentialPool.POOLED_REQUESTS_PER_SECOND
+        if requests_per_second:
+            requests_per_second /= workers
+
+    return {
+        'credentials_path': args.credentials,
+        'token_path': token_paths[0],
+        'headless': args.headless,
+        'extra_token_paths': token_paths[1:],
+        'service_account_paths': args.service_accounts,
+        'requests_per_second': requests_per_second,
+        'content_hashes': args.dedup_content,
+        'pool_size': args.connection_pool_size,
+        'parents_batch_size': args.parents_batch_size,
+    }
+
+
+def run_frontier_worker(args, extensions, rules, worker_index=0, workers=1):
+    """Lists folders from the --frontier until none are left."""
+    return run_crawl_worker(
+        Path(args.frontier),
+        frontier_gdrive_options(args, worker_index, workers),
+        recursion=args.recursion,
+        extensions=extensions,
+        rules=rules,
+        lease_seconds=args.frontier_lease,
+        worker_index=worker_index,
+    )
+
+
+def frontier_crawl(generator, args):
+    """Seeds the --frontier, waits for the workers and adds their files."""
+    frontier = CrawlFrontier(
+        Path(args.frontier),
+        lease_seconds=args.frontier_lease,
+    )
+    frontier.seed(
+        prioritized_folder_ids(generator, args),
+        generator.crawl_rules,
+        prioritized=bool(args.priorities or args.priority_by_activity),
+    )
+
+    # Workers build their own Drive clients, spawn keeps them from
+    # inheriting the coordinator's connections
+    extensions = generator.scan_extensions(
+        args.add_non_nsw_files,
+        args.extensions,
+    )
+    context = get_context('spawn')
+    workers = [
+        context.Process(
+            target=run_frontier_worker,
+            args=(
+                args,
+                extensions,
+                generator.crawl_rules,
+                worker_index,
+                args.crawl_workers,
+            ),
+        )
+        for worker_index in range(args.crawl_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f'Started {len(workers)} crawl workers on {args.frontier}')
+
+    while not frontier.finished():
+        if workers and not any(worker.is_alive() for worker in workers):
+            break
+        sleep(1.0)
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            print(
+                f'WARNING: Crawl worker {worker.pid} exited with code ' +
+                f'{worker.exitcode}'
+            )
+
+    if not frontier.finished():
+        frontier.close()
+        raise RuntimeError(
+            'All crawl workers exited before the crawl finished.'
+        )
+
+    print(frontier.summary(), end='')
+    for (folder_id, error) in frontier.failed_folders():
+        print(f'WARNING: Unable to list folder {folder_id}: {error}')
+
+    # The workers' counters are added, so the usual summaries cover them
+    worker_stats = frontier.stats()
+    for name in generator.gdrive_service.stats:
+        generator.gdrive_service.stats[name] += worker_stats.get(name, 0)
+    if generator.crawl_rules is not None:
+        generator.crawl_rules.pruned_folders += \
+            worker_stats.get('pruned_folders', 0)
+        generator.crawl_rules.capped_folders += \
+            worker_stats.get('capped_folders', 0)
+        generator.crawl_rules.saved_calls += \
+            worker_stats.get('saved_calls', 0)
+
+    generator.add_frontier_files(
+        frontier,
+        args.folder_ids,
+        args.add_nsw_files_without_title_id,
+        args.add_non_nsw_files,
+        extensions=args.extensions,
+    )
+    frontier.close()
+    if saves_coverage_state(args):
+        save_root_entries(
+            coverage_state_path(args),
+            generator.entries_by_root(),
+        )
+
+
+def crawl_rules_from_args(args):
+    """Returns the crawl rules set by the options, None if there are none."""
+    crawl_rules = CrawlRules(
+        include=args.include_folders,
+        exclude=args.exclude_folders,
+        max_depth=args.max_depth,
+        max_files_per_folder=args.max_files_per_folder,
+    )
+    return crawl_rules if crawl_rules.active else None
 
-    theme_blacklist = None
-    if args.theme_blacklist:
-        theme_blacklist = args.theme_blacklist
 
-    theme_whitelist = None
-    if args.theme_whitelist:
-        theme_whitelist = args.theme_whitelist
+def print_transfer_stats(gdrive_service):
+    transfer_stats = gdrive_service.stats
+    received_fmt = format_bytes(transfer_stats['bytes_received'])
+    decoded_fmt = format_bytes(transfer_stats['bytes_decoded'])
+    print(
+        f'Drive API: {transfer_stats["requests"]:,} requests, ' +
+        f'{received_fmt[0]} {received_fmt[1]} received, ' +
+        f'{decoded_fmt[0]} {decoded_fmt[1]} of response data ' +
+        f'({transfer_stats["gzip_responses"]:,} gzip-encoded responses)'
+    )
+
+
+def publish_targets(generator, args):
+    """Builds and publishes every target from one scan of their folders."""
+    targets = args.targets
+    folder_ids = list(dict.fromkeys(
+        folder_id for target in targets for folder_id in target.folder_ids
+    ))
+    add_non_nsw_files = any(target.add_non_nsw_files for target in targets)
+    extensions = sorted({
+        extension for target in targets
+        for extension in target.extensions or generator.title_ext_infos
+    })
+
+    print(f'Scanning {len(folder_ids)} folder(s) for {len(targets)} targets')
+    generator.rescan_folders(
+        folder_ids,
+        args.recursion,
+        add_non_nsw_files,
+        extensions=extensions,
+    )
+
+    for target in targets:
+        print(f'Building target {target.index_file}')
+        generator.configure_index(
+            target.tinfoil_min_ver,
+            theme_blacklist=target.theme_blacklist or None,
+            theme_whitelist=target.theme_whitelist or None,
+            theme_error=target.theme_error,
+        )
+        generator.rebuild_index(
+            target.add_nsw_files_without_title_id,
+            target.add_non_nsw_files,
+            folder_ids=target.folder_ids,
+            extensions=target.extensions,
+        )
+        publish_index(generator, target)
+
+
+def run_job(gdrive_service, job):
+    """Generates and publishes the index of one job on a shared GDrive."""
+    generator = TinGen(
+        job.token,
+        job.credentials,
+        job.headless,
+        job.tinfoil_min_ver,
+        theme_blacklist=job.theme_blacklist or None,
+        theme_whitelist=job.theme_whitelist or None,
+        theme_error=job.theme_error,
+        filter_pushdown=job.filter_pushdown,
+        crawl_rules=crawl_rules_from_args(job),
+        dedup_content=job.dedup_content,
+        preferred_roots=job.preferred_roots,
+        gdrive_service=gdrive_service,
+    )
+
+    if job.merge:
+        generator.read_index(
+            job.index_file,
+            Path(job.private_key) if job.private_key else None,
+        )
+
+    generate_index(generator, job)
+    publish_index(generator, job)
+
+
+def run_jobs(gdrive_service, args):
+    """Runs the jobs in parallel, listing every folder at most once."""
+    jobs = args.jobs
+    if any(
+        job.add_non_nsw_files or not job.filter_pushdown for job in jobs
+    ):
+        listing_extensions = None
+    else:
+        listing_extensions = sorted({
+            extension for job in jobs
+            for extension in job.extensions or ('nsp', 'nsz', 'xci', 'xcz')
+        })
+
+    gdrive_service.enable_listing_cache(listing_extensions)
+    failed_jobs = []
+
+    with ThreadPoolExecutor(max_workers=args.job_workers) as executor:
+        job_futures = {
+            job.index_file: executor.submit(run_job, gdrive_service, job)
+            for job in jobs
+        }
+        for (index_file, job_future) in job_futures.items():
+            try:
+                job_future.result()
+                print(f'Job {index_file} complete')
+            except Exception as error:
+                print(f'WARNING: Job {index_file} failed: {error}')
+                failed_jobs.append(index_file)
+
+    gdrive_service.clear_listing_cache()
+
+    if failed_jobs:
+        raise RuntimeError(
+            f'{len(failed_jobs)} of {len(jobs)} jobs failed: ' +
+            ', '.join(failed_jobs)
+        )
+
+
+if __name__ == '__main__':
+    args = parse_args()
 
     generator = TinGen(
         args.token,
         args.credentials,
         args.headless,
         args.tinfoil_min_ver,
-        theme_blacklist=theme_blacklist,
-        theme_whitelist=theme_whitelist,
-        theme_error=theme_msg,
+        theme_blacklist=args.theme_blacklist,
+        theme_whitelist=args.theme_whitelist,
+        theme_error=args.theme_error,
+        flat_shared_drives=args.flat_shared_drives,
+        filter_pushdown=args.filter_pushdown,
+        extra_token_paths=args.extra_tokens,
+        service_account_paths=args.service_accounts,
+        requests_per_second=args.requests_per_second,
+        crawl_rules=crawl_rules_from_args(args),
+        dedup_content=args.dedup_content or any(
+            job.dedup_content for job in args.jobs or []
+        ),
+        preferred_roots=args.preferred_roots,
+        pool_size=args.connection_pool_size,
+        parents_batch_size=args.parents_batch_size,
     )
 
     if args.auth:
@@ -214,87 +1370,100 @@ if __name__ == '__main__':
             raise RuntimeError('Unable to generate OAuth2 user credentials. ' +
                                'Unable to continue!')
 
-    else:
-        print('Generating index')
-        generator.index_generator(
-            args.folder_ids,
-            args.recursion,
-            args.add_nsw_files_without_title_id,
-            args.add_non_nsw_files,
-        )
+    elif args.watch:
+        server = None
+        if args.serve:
+            server = IndexServer(args.serve_host, args.serve_port)
+            server.start()
+            print(f'Serving index on {args.serve_host}:{args.serve_port}')
 
-        if args.add_nsw_info_to_success:
-            print('Adding NSW title information message to index')
-            generator.add_nsw_title_info_to_success()
+        print('Watching for changes')
+        IndexWatcher(
+            generator,
+            parse_args,
+            partial(publish_index, server=server),
+            min_interval=args.watch_min_interval,
+            max_interval=args.watch_max_interval,
+        ).run()
 
-        if args.add_update_date_to_success or args.add_update_time_to_success:
-            print('Adding date/time information to index')
-            generator.add_datetime_to_success(
-                args.add_update_date_to_success,
-                args.add_update_time_to_success,
-            )
-
-        if args.success:
-            print('Adding success message to index')
-            generator.update_index_success_message(
-                args.success.replace('\\n', '\n').replace('\\t', '\t'),
-            )
+    elif args.frontier_worker:
+        folder_count = run_frontier_worker(
+            args,
+            generator.scan_extensions(
+                args.add_non_nsw_files,
+                args.extensions,
+            ),
+            generator.crawl_rules,
+        )
+        print(f'Listed {folder_count:,} folders from {args.frontier}')
 
-        compression_flag = CompressionFlag.ZSTD_COMPRESSION
+    elif args.jobs:
+        run_jobs(generator.gdrive_service, args)
+        print_transfer_stats(generator.gdrive_service)
+        print('Index Generation Complete')
 
-        if args.zstandard:
-            compression_flag = CompressionFlag.ZSTD_COMPRESSION
-        elif args.zlib:
-            compression_flag = CompressionFlag.ZLIB_COMPRESSION
-        elif args.no_compress:
-            compression_flag = CompressionFlag.NO_COMPRESSION
+    elif args.targets:
+        publish_targets(generator, args)
 
-        print(f'Creating generated index to {args.index_file}')
-        if args.encrypt:
-            rsa_pub_key_path = None
-            if args.public_key:
-                rsa_pub_key_path = Path(args.public_key)
+        if generator.crawl_rules is not None:
+            print(generator.crawl_rules.summary(), end='')
 
-            vm_path = None
-            if args.vm_file:
-                vm_path = Path(args.vm_file)
+        print_transfer_stats(generator.gdrive_service)
+        print('Index Generation Complete')
 
-            create_tinfoil_index(
-                generator.index,
+    else:
+        pipeline = None
+        if args.pipeline:
+            compression_flag, rsa_pub_key_path, vm_path = \
+                index_output_settings(args)
+            pipeline = IndexPipeline(
                 Path(args.index_file),
                 compression_flag,
                 rsa_pub_key_path=rsa_pub_key_path,
                 vm_path=vm_path,
+                max_queued=args.pipeline_queue_size,
             )
-        else:
-            create_tinfoil_index(
-                generator.index,
-                Path(args.index_file),
-                compression_flag,
-            )
+            generator.file_listeners.append(pipeline.file_added)
 
-        if args.share_files:
-            print('Sharing files in index')
-            for folder_id in args.folder_ids:
-                generator.gdrive_service.share_file(folder_id)
-            # generator.share_index_files()
-
-        if args.upload_folder_id:
-            print(f'Uploading {args.index_file} to {args.upload_folder_id}')
-            generator.gdrive_service.upload_file(
+        if args.merge:
+            generator.read_index(
                 args.index_file,
-                args.upload_folder_id,
-                args.share_uploaded_index,
-                args.new_upload_id,
+                Path(args.private_key) if args.private_key else None,
+            )
+            print(
+                f'Merging into {len(generator.index["files"]):,} entries ' +
+                f'from {args.index_file}'
             )
 
-        if args.upload_to_my_drive:
-            print(f'Uploading {args.index_file} to \"My Drive\"')
-            generator.gdrive_service.upload_file(
-                args.index_file,
-                None,
-                args.share_uploaded_index,
-                args.new_upload_id,
+        print('Generating index')
+        try:
+            if args.frontier:
+                frontier_crawl(generator, args)
+            else:
+                generate_index(generator, args)
+        except BaseException:
+            if pipeline is not None:
+                pipeline.abort()
+            raise
+
+        if generator.crawl_rules is not None:
+            print(generator.crawl_rules.summary(), end='')
+
+        if args.dedup_content:
+            print(
+                f'Skipped {generator.content_duplicates:,} duplicate ' +
+                'copies of indexed files'
             )
 
+        server = None
+        if args.serve:
+            server = IndexServer(args.serve_host, args.serve_port)
+
+        publish_index(generator, args, server=server, pipeline=pipeline)
+
+        print_transfer_stats(generator.gdrive_service)
         print('Index Generation Complete')
+
+        if server is not None:
+            print(f'Serving index on {args.serve_host}:{args.serve_port}')
+            server.serve_forever()
@@ -2,15 +2,23 @@ from tqdm import tqdm
 from typing import List
 from pathlib import Path
 from typing import Optional
-from json import JSONDecodeError
 from TinGen.gdrive import GDrive
 from TinGen.gdrive import UGdrive
-from json import dump as json_writer
-from json import load as json_reader
+from TinGen.rules import CrawlRules
+from TinGen.utils import file_extension
 from TinGen.utils import format_bytes
+from TinGen.utils import serialize_json
+from TinGen.utils import read_index as read_index_file
+from TinGen.utils import index_entry_file_id
+from TinGen.verify import load_verify_cache
+from TinGen.verify import save_verify_cache
+from TinGen.verify import unverified_file_ids
 from re import compile as regex_compile
 from datetime import datetime, timezone
+from time import monotonic
+from time import time
 from urllib.parse import quote as url_encode
+from urllib.parse import unquote as url_decode
 
 
 class TinGen:
@@ -23,9 +31,43 @@ class TinGen:
         theme_blacklist: Optional[List[str]] = None,
         theme_whitelist: Optional[List[str]] = None,
         theme_error: Optional[str] = None,
+        flat_shared_drives: bool = False,
+        filter_pushdown: bool = False,
+        extra_token_paths: Optional[List[str]] = None,
+        service_account_paths: Optional[List[str]] = None,
+        requests_per_second: Optional[float] = None,
+        crawl_rules: Optional[CrawlRules] = None,
+        dedup_content: bool = False,
+        preferred_roots: Optional[List[str]] = None,
+        pool_size: int = 10,
+        gdrive_service: Optional[GDrive] = None,
+        parents_batch_size: int = 1,
     ):
-        self.gdrive_service = GDrive(token_path, credentials_path, headless)
+        self.filter_pushdown = filter_pushdown
+        self.crawl_rules = crawl_rules
+        self.dedup_content = dedup_content
+        self.preferred_roots = preferred_roots or []
+        # Generators may share one GDrive, e.g. to reuse its listing cache
+        self.gdrive_service = gdrive_service or GDrive(
+            token_path,
+            credentials_path,
+            headless,
+            flat_shared_drives=flat_shared_drives,
+            extra_token_paths=extra_token_paths,
+            service_account_paths=service_account_paths,
+            requests_per_second=requests_per_second,
+            content_hashes=dedup_content,
+            pool_size=pool_size,
+            parents_batch_size=parents_batch_size,
+        )
         self.files_shared_status = {}
+        self.folder_files = {}
+        self.index_file_entries = {}
+        self.content_entries = {}
+        self.content_duplicates = 0
+        self.file_listeners = []
+        self.file_roots = {}
+        self.scan_coverage = {}
         self.title_ext_infos = {
             "nsp": {
                 "count": 0,
@@ -45,12 +87,31 @@ class TinGen:
             },
         }
 
-        self.index = {"files": [], "version": tinfoil_min_ver}
+        self.index = {"files": []}
+        self.configure_index(
+            tinfoil_min_ver,
+            theme_blacklist=theme_blacklist,
+            theme_whitelist=theme_whitelist,
+            theme_error=theme_error,
+        )
+
+    def configure_index(
+        self,
+        tinfoil_min_ver: str,
+        theme_blacklist: Optional[List[str]] = None,
+        theme_whitelist: Optional[List[str]] = None,
+        theme_error: Optional[str] = None,
+    ):
+        """Sets the index version and theme options, replacing old ones."""
+        for theme_key in ("themeBlackList", "themeWhitelist", "themeError"):
+            self.index.pop(theme_key, None)
+
+        self.index.update({"version": tinfoil_min_ver})
 
         if theme_blacklist:
             self.index.update({"themeBlackList": theme_blacklist})
 
-        if theme_blacklist:
+        if theme_whitelist:
             self.index.update({"themeWhitelist": theme_whitelist})
 
         if theme_error:
@@ -58,22 +119,24 @@ class TinGen:
 
     def read_index(
         self,
-        index_path
+        index_path,
+        rsa_priv_key_path: Optional[Path] = None
     ):
-        """Reads index file and updates the index for the instance."""
+        """Reads index file and updates the index for the instance.
+
+        Both JSON and Tinfoil (.tfl) indexes are understood, encrypted ones
+        need the RSA private key. Entries are merged by file ID, so files
+        scanned afterwards replace their old entries.
+        """
         pathlib_index = Path(index_path)
         if pathlib_index.exists() and pathlib_index.is_file():
-            with open(pathlib_index, "r") as index_fp:
-                try:
-                    file_json = json_reader(index_fp)
-                    if "files" in file_json:
-                        for file_entry in file_json["files"]:
-                            if file_entry not in self.index["files"]:
-                                self.index["files"].append(file_entry)
-                except JSONDecodeError:
-                    print(
-                        f"WARNING: {pathlib_index} is not a valid JSON file."
-                    )
+            try:
+                file_json = read_index_file(pathlib_index, rsa_priv_key_path)
+            except RuntimeError as error:
+                print(f"WARNING: Unable to read {pathlib_index}: {error}")
+                return
+            for file_entry in file_json.get("files", []):
+                self.add_index_file(file_entry)
 
     def write_index_to_file(
         self,
@@ -81,8 +144,8 @@ class TinGen:
     ):
         """Writes the instance index to index file"""
         Path(index_path).parent.resolve().mkdir(parents=True, exist_ok=True)
-        with open(index_path, "w") as index_fp:
-            json_writer(self.index, index_fp, indent=2)
+        with open(index_path, "wb") as index_fp:
+            index_fp.write(serialize_json(self.index))
 
     def scan_folder(
         self,
@@ -90,42 +153,493 @@ class TinGen:
         files_progress_bar: tqdm,
         recursion: bool,
         add_nsw_files_without_title_id: bool,
-        add_non_nsw_files: bool
+        add_non_nsw_files: bool,
+        extensions: Optional[List[str]] = None,
+        deadline: Optional[float] = None
     ):
-        """Scans the folder id for files and updates the instance index"""
-        title_id_pattern = r"\%5B[0-9A-Fa-f]{16}\%5D"
+        """Scans the folder id for files and updates the instance index.
 
-        files = self.gdrive_service.get_all_files_in_folder(
+        Files are added as each page of the listing arrives. Use
+        `rescan_folders` to keep the scan results for later rebuilds. The
+        scan stops once the `time.monotonic` deadline passes, whether it
+        finished is recorded in `scan_coverage`.
+        """
+        files = self.gdrive_service.iter_files_in_folder(
             folder_id,
             recursion,
-            files_progress_bar
+            files_progress_bar,
+            extensions=self.scan_extensions(add_non_nsw_files, extensions),
+            rules=self.crawl_rules,
+            deadline=deadline
         )
+        if deadline is not None:
+            files = self._files_until(files, deadline, folder_id)
+        else:
+            self.scan_coverage.update({folder_id: "complete"})
+
+        self.add_files(
+            files,
+            add_nsw_files_without_title_id,
+            add_non_nsw_files,
+            root_id=folder_id,
+            extensions=extensions
+        )
+
+    def _files_until(
+        self,
+        files,
+        deadline: float,
+        folder_id: str
+    ):
+        """Yields scanned files until the deadline passes.
+
+        The listing is closed before its next page is requested, so the
+        crawl stops without any call left running. The listing stops on its
+        own between folders, so it only counts as complete if it ended
+        before the deadline.
+        """
+        self.scan_coverage.update({folder_id: "partial"})
+        files = iter(files)
+        while monotonic() < deadline:
+            try:
+                scanned_file = next(files)
+            except StopIteration:
+                if monotonic() < deadline:
+                    self.scan_coverage.update({folder_id: "complete"})
+                return
+            yield scanned_file
+        files.close()
+
+    def scan_extensions(
+        self,
+        add_non_nsw_files: bool,
+        extensions: Optional[List[str]] = None
+    ):
+        """Extensions to filter listings by on Drive, None to list all.
+
+        Pushdown is opt-in, as Drive only matches name terms by prefix and
+        may leave out files whose extension isn't a separate word.
+        """
+        if add_non_nsw_files or not self.filter_pushdown:
+            return None
+        return list(extensions or self.title_ext_infos.keys())
+
+    def add_index_file(
+        self,
+        file_entry: dict
+    ) -> Optional[str]:
+        """Adds an entry to the index files unless its file is listed.
+
+        An entry for a listed file ID updates the listed entry instead, in
+        case the file was renamed or resized since. Returns "new" or
+        "updated", or None when the listed entry was already up to date.
+        """
+        file_id = index_entry_file_id(file_entry)
+        listed_entry = self.index_file_entries.get(file_id)
+        if listed_entry is None:
+            self.index_file_entries.update({file_id: file_entry})
+            self.index["files"].append(file_entry)
+            self.count_title_ext(file_entry)
+            return "new"
+        if listed_entry == file_entry:
+            return None
+        self.count_title_ext(listed_entry, -1)
+        listed_entry.update(file_entry)
+        self.count_title_ext(listed_entry)
+        return "updated"
+
+    def set_index_files(
+        self,
+        file_entries: list
+    ):
+        """Replaces the index files, keeping the dedup keys in sync"""
+        self.index.update({"files": file_entries})
+        self.index_file_entries = {
+            index_entry_file_id(file_entry): file_entry
+            for file_entry in file_entries
+        }
+        self.content_entries = {
+            content_key: content_entry
+            for (content_key, content_entry) in self.content_entries.items()
+            if content_entry[0] in self.index_file_entries
+        }
+
+    def content_rank(
+        self,
+        root_id: Optional[str],
+        shared: bool
+    ) -> tuple:
+        """Orders copies of the same content, the lowest rank is kept.
+
+        Copies in preferred roots come first, in the order the roots were
+        given, then copies that are already shared.
+        """
+        root_rank = self.preferred_roots.index(root_id) \
+            if root_id in self.preferred_roots else len(self.preferred_roots)
+        return (root_rank, not shared)
+
+    def add_content_file(
+        self,
+        file_entry: dict,
+        file_id: str,
+        file_details: dict,
+        root_id: Optional[str]
+    ) -> Optional[str]:
+        """Adds an entry unless a copy with the same content is listed.
 
+        A copy that ranks better than the listed one takes over its entry,
+        which counts as an update. Returns the same statuses as
+        `add_index_file`.
+        """
+        if "md5" not in file_details:
+            return self.add_index_file(file_entry)
+
+        content_key = (file_details["md5"], file_entry["size"])
+        rank = self.content_rank(root_id, file_details["shared"])
+        if content_key not in self.content_entries:
+            status = self.add_index_file(file_entry)
+            if status is not None:
+                self.content_entries.update({content_key: (file_id, rank)})
+            return status
+
+        (listed_file_id, listed_rank) = self.content_entries[content_key]
+        if listed_file_id == file_id:
+            return self.add_index_file(file_entry)
+
+        self.content_duplicates += 1
+        if rank >= listed_rank:
+            return None
+
+        listed_entry = self.index_file_entries.pop(listed_file_id)
+        # The copy's name, and so its extension, may differ
+        self.count_title_ext(listed_entry, -1)
+        listed_entry.update({"url": file_entry["url"]})
+        self.count_title_ext(listed_entry)
+        self.index_file_entries.update({file_id: listed_entry})
+        self.files_shared_status.pop(listed_file_id, None)
+        self.file_roots.pop(listed_file_id, None)
+        self.content_entries.update({content_key: (file_id, rank)})
+        return "updated"
+
+    def add_files(
+        self,
+        files,
+        add_nsw_files_without_title_id: bool,
+        add_non_nsw_files: bool,
+        root_id: Optional[str] = None,
+        extensions: Optional[List[str]] = None
+    ):
+        """Adds scanned (file ID, details) pairs that pass the filters.
+
+        Unless `add_non_nsw_files` is set, only files with one of the
+        `extensions`, by default all NSW ones, are added.
+        """
+        nsw_extensions = extensions or self.title_ext_infos.keys()
+        title_id_pattern = r"\%5B[0-9A-Fa-f]{16}\%5D"
         pattern = regex_compile(title_id_pattern)
-        for (file_id, file_details) in files.items():
+        for (file_id, file_details) in files:
             url_encoded_file_name = url_encode(file_details["name"], safe="")
-            file_ext = url_encoded_file_name[-3:]
+            file_ext = file_extension(url_encoded_file_name)
             file_valid_nsw_check = add_non_nsw_files or \
-                file_ext in self.title_ext_infos.keys()
+                file_ext in nsw_extensions
             file_title_id_check = add_nsw_files_without_title_id or \
                 pattern.search(url_encoded_file_name)
             if file_title_id_check and file_valid_nsw_check:
-                if file_ext in self.title_ext_infos:
-                    old_val_count = self.title_ext_infos[file_ext]["count"]
-                    old_val_size = self.title_ext_infos[file_ext]["size"]
-                    self.title_ext_infos[file_ext]["count"] = old_val_count + 1
-                    self.title_ext_infos[file_ext]["size"] = old_val_size + \
-                        int(file_details["size"])
-
                 file_entry_to_add = {
                     "url": f"gdrive:{file_id}#{url_encoded_file_name}",
                     "size": int(file_details["size"])
                 }
-                if file_entry_to_add not in self.index["files"]:
-                    self.index["files"].append(file_entry_to_add)
+                if self.dedup_content:
+                    status = self.add_content_file(
+                        file_entry_to_add,
+                        file_id,
+                        file_details,
+                        root_id
+                    )
+                else:
+                    status = self.add_index_file(file_entry_to_add)
+
+                if status is not None:
                     self.files_shared_status.update({
                         file_id: file_details["shared"]
                     })
+                    if root_id is not None:
+                        self.file_roots.update({file_id: root_id})
+                    for file_listener in self.file_listeners:
+                        file_listener(
+                            self.index_file_entries[file_id],
+                            file_id,
+                            file_details["shared"],
+                            updated=status == "updated",
+                        )
+
+    def rescan_folders(
+        self,
+        folder_ids: list,
+        recursion: bool,
+        add_non_nsw_files: bool,
+        extensions: Optional[List[str]] = None,
+    ):
+        """Crawls the folder ids again, replacing their previous results.
+
+        The index itself is left untouched, call `rebuild_index` afterwards.
+        """
+        files_progress_bar = tqdm(
+            desc="Files scanned",
+            unit="file",
+            unit_scale=True
+        )
+        self.gdrive_service.clear_drive_trees()
+
+        for folder_id in folder_ids:
+            self.folder_files.update({
+                folder_id: self.gdrive_service.get_all_files_in_folder(
+                    folder_id,
+                    recursion,
+                    files_progress_bar,
+                    extensions=self.scan_extensions(
+                        add_non_nsw_files,
+                        extensions
+                    ),
+                    rules=self.crawl_rules
+                )
+            })
+
+        files_progress_bar.close()
+
+    def add_frontier_files(
+        self,
+        frontier,
+        folder_ids: list,
+        add_nsw_files_without_title_id: bool,
+        add_non_nsw_files: bool,
+        extensions: Optional[List[str]] = None
+    ):
+        """Adds the files crawl workers stored in the frontier"""
+        for folder_id in folder_ids:
+            self.add_files(
+                frontier.iter_root_files(folder_id),
+                add_nsw_files_without_title_id,
+                add_non_nsw_files,
+                root_id=folder_id,
+                extensions=extensions
+            )
+
+    def drop_folders(
+        self,
+        folder_ids: list,
+    ):
+        """Forgets the scan results of the folder ids"""
+        for folder_id in folder_ids:
+            self.folder_files.pop(folder_id, None)
+
+    def rebuild_index(
+        self,
+        add_nsw_files_without_title_id: bool,
+        add_non_nsw_files: bool,
+        folder_ids: Optional[List[str]] = None,
+        extensions: Optional[List[str]] = None
+    ):
+        """Rebuilds the index files from the scan results kept in memory.
+
+        Only the scan results of `folder_ids` are used if given.
+        """
+        self.set_index_files([])
+        self.files_shared_status = {}
+        self.content_duplicates = 0
+        for ext_info in self.title_ext_infos.values():
+            ext_info.update({"count": 0, "size": 0})
+
+        for (folder_id, files) in self.folder_files.items():
+            if folder_ids is not None and folder_id not in folder_ids:
+                continue
+            self.add_files(
+                files.items(),
+                add_nsw_files_without_title_id,
+                add_non_nsw_files,
+                root_id=folder_id,
+                extensions=extensions
+            )
+
+    def entries_by_root(
+        self,
+    ) -> dict:
+        """Groups the index entries by the folder ID they were found in"""
+        root_entries = {}
+        for (file_id, file_entry) in self.index_file_entries.items():
+            root_id = self.file_roots.get(file_id)
+            if root_id is not None:
+                root_entries.setdefault(root_id, []).append(file_entry)
+        return root_entries
+
+    def merge_unfinished_roots(
+        self,
+        root_entries: dict,
+    ) -> int:
+        """Adds the previous entries of folders the last scan didn't finish.
+
+        Entries found by the scan take precedence, returns the number of
+        entries added.
+        """
+        merged_entries = 0
+        for (root_id, status) in self.scan_coverage.items():
+            if status == "complete":
+                continue
+            for file_entry in root_entries.get(root_id, []):
+                file_id = index_entry_file_id(file_entry)
+                if file_id in self.index_file_entries:
+                    continue
+                self.add_index_file(file_entry)
+                self.file_roots.update({file_id: root_id})
+                merged_entries += 1
+        return merged_entries
+
+    def count_title_ext(
+        self,
+        file_entry: dict,
+        count: int = 1
+    ):
+        """Adds an entry to the extension totals, or removes it with -1"""
+        file_ext = file_extension(file_entry["url"].rsplit("#", 1)[-1])
+        if file_ext in self.title_ext_infos:
+            self.title_ext_infos[file_ext]["count"] += count
+            self.title_ext_infos[file_ext]["size"] += \
+                count * file_entry["size"]
+
+    def recount_title_ext_infos(
+        self,
+    ):
+        """Recounts title extension info from the current index files"""
+        for ext_info in self.title_ext_infos.values():
+            ext_info.update({"count": 0, "size": 0})
+
+        for file_entry in self.index["files"]:
+            self.count_title_ext(file_entry)
+
+    def collapse_versions(
+        self,
+        keep_versions: int = 1,
+    ):
+        """Keeps only the newest versions of each title ID and type.
+
+        Entries are grouped by title ID and type (base, update or DLC) and
+        only entries carrying one of the `keep_versions` newest versions of
+        their group are kept. Entries without a title ID or version tag are
+        always kept.
+        """
+        title_id_pattern = regex_compile(r"\[([0-9A-Fa-f]{16})\]")
+        version_pattern = regex_compile(r"\[[vV](\d+)\]")
+        groups = {}
+        entry_groups = []
+
+        for file_entry in self.index["files"]:
+            file_name = url_decode(file_entry["url"].split("#", 1)[-1])
+            title_id_match = title_id_pattern.search(file_name)
+            version_match = version_pattern.search(file_name)
+            if title_id_match is None or version_match is None:
+                entry_groups.append(None)
+                continue
+
+            title_id = int(title_id_match.group(1), 16)
+            title_type = title_id & 0xFFF
+            if title_type not in (0x000, 0x800):
+                title_type = "dlc"
+            version = int(version_match.group(1))
+            group_key = (title_id, title_type)
+            groups.setdefault(group_key, set()).add(version)
+            entry_groups.append((group_key, version))
+
+        kept_versions = {
+            group_key: set(sorted(versions, reverse=True)[:keep_versions])
+            for (group_key, versions) in groups.items()
+        }
+
+        self.set_index_files([
+            file_entry for (file_entry, entry_group) in zip(
+                self.index["files"],
+                entry_groups,
+            )
+            if entry_group is None or
+            entry_group[1] in kept_versions[entry_group[0]]
+        ])
+        self.recount_title_ext_infos()
+
+    def prune_dead_files(
+        self,
+        cache_path: Optional[Path] = None,
+        max_age: float = 86400.0,
+        workers: int = 4,
+        remove: bool = True,
+    ) -> list:
+        """Checks the index entries against Drive and drops dead ones.
+
+        Entries whose file was deleted, trashed or is no longer readable are
+        removed unless `remove` is False. Files verified less than `max_age`
+        seconds ago according to the cache at `cache_path` aren't checked
+        again. Returns the dead entries with their status.
+        """
+        verify_cache = load_verify_cache(cache_path)
+        gdrive_file_ids = [
+            index_entry_file_id(file_entry)
+            for file_entry in self.index["files"]
+            if file_entry["url"].startswith("gdrive:")
+        ]
+        file_ids_to_verify = unverified_file_ids(
+            gdrive_file_ids,
+            verify_cache,
+            max_age,
+        )
+
+        verify_progress_bar = tqdm(
+            total=len(file_ids_to_verify),
+            desc="Files verified",
+            unit="file",
+            unit_scale=True
+        )
+        statuses = self.gdrive_service.verify_files(
+            file_ids_to_verify,
+            verify_progress_bar,
+            workers=workers,
+        )
+        verify_progress_bar.close()
+
+        checked = time()
+        for (file_id, status) in statuses.items():
+            if status == "ok":
+                verify_cache.update({file_id: checked})
+            else:
+                verify_cache.pop(file_id, None)
+
+        if cache_path is not None:
+            save_verify_cache(cache_path, verify_cache, max_age)
+
+        unknown_count = list(statuses.values()).count("unknown")
+        if unknown_count:
+            print(
+                f"WARNING: Unable to verify {unknown_count} file(s), " +
+                "keeping them in the index."
+            )
+
+        dead_entries = []
+        live_entries = []
+        for file_entry in self.index["files"]:
+            status = statuses.get(index_entry_file_id(file_entry), "ok")
+            if status in ("ok", "unknown"):
+                live_entries.append(file_entry)
+            else:
+                dead_entries.append((file_entry, status))
+
+        if remove and dead_entries:
+            self.set_index_files(live_entries)
+            self.recount_title_ext_infos()
+
+        return dead_entries
+
+    def reset_success_message(
+        self,
+    ):
+        """Removes the success message from the index"""
+        self.index.pop("success", None)
 
     def share_index_files(
         self,
@@ -195,29 +709,91 @@ class TinGen:
         recursion: bool,
         add_nsw_files_without_title_id: bool,
         add_non_nsw_files: bool,
+        extensions: Optional[List[str]] = None,
+        deadline: Optional[float] = None,
     ):
+        """Scans the folder ids in order, until the deadline if given.
+
+        Folders that weren't started before the deadline are recorded as
+        unreached in `scan_coverage`.
+        """
         files_progress_bar = tqdm(
             desc="Files scanned",
             unit="file",
             unit_scale=True
         )
+        self.scan_coverage = {}
 
         for folder_id in folder_ids:
+            if deadline is not None and monotonic() >= deadline:
+                self.scan_coverage.update({folder_id: "unreached"})
+                continue
             self.scan_folder(
                 folder_id,
                 files_progress_bar,
                 recursion,
                 add_nsw_files_without_title_id,
-                add_non_nsw_files
+                add_non_nsw_files,
+                extensions=extensions,
+                deadline=deadline
             )
 
+        files_progress_bar.close()
+
 
 class UTinGen:
     def __init__(
-        self
+        self,
+        workers: int = 8,
+        host_concurrency: int = 4,
+        host_interval: float = 0.0,
+        verify: bool = True,
     ):
         self.index = {"files": []}
-        self.gdrive_service = UGdrive()
+        self.index_file_entries = {}
+        self.gdrive_service = UGdrive(
+            workers=workers,
+            host_concurrency=host_concurrency,
+            host_interval=host_interval,
+            verify=verify,
+        )
+
+    def read_index(
+        self,
+        index_path: Path,
+        rsa_priv_key_path: Optional[Path] = None
+    ):
+        """Reads an existing index to merge the scanned files into.
+
+        The success message of the existing index is kept unless a new one
+        is passed to `index_generator`.
+        """
+        if not index_path.is_file():
+            return
+
+        try:
+            previous_index = read_index_file(index_path, rsa_priv_key_path)
+        except RuntimeError as error:
+            print(f"WARNING: Unable to read {index_path}: {error}")
+            return
+
+        for (key, value) in previous_index.items():
+            if key != "files":
+                self.index.update({key: value})
+        for file_entry in previous_index.get("files", []):
+            self.add_index_file(file_entry)
+
+    def add_index_file(
+        self,
+        file_entry: dict
+    ):
+        """Adds an entry, or updates the listed entry of the same file ID"""
+        file_id = index_entry_file_id(file_entry)
+        if file_id in self.index_file_entries:
+            self.index_file_entries[file_id].update(file_entry)
+        else:
+            self.index_file_entries.update({file_id: file_entry})
+            self.index["files"].append(file_entry)
 
     def index_generator(
         self,
@@ -225,27 +801,36 @@ class UTinGen:
         add_non_nsw_files: bool,
         add_nsw_files_without_title_id: bool,
         success: str = None,
+        recursion: bool = True,
     ) -> None:
         title_id_pattern = r"\%5B[0-9A-Fa-f]{16}\%5D"
         pattern = regex_compile(title_id_pattern)
-        for folder_id in folder_ids:
-            files = self.gdrive_service.get_files_in_folder_id(folder_id)
-            for (file_id, file_details) in files.items():
-                if add_non_nsw_files or file_details["name"][-4:] in (
-                    ".nsp",
-                    ".nsz",
-                    ".xci",
-                    ".xcz",
+        files_progress_bar = tqdm(
+            desc="Files scanned",
+            unit="file",
+            unit_scale=True
+        )
+        files = self.gdrive_service.get_all_files_in_folders(
+            folder_ids,
+            recursion=recursion,
+            progress_bar=files_progress_bar,
+        )
+        files_progress_bar.close()
+        for (file_id, file_details) in files.items():
+            if add_non_nsw_files or file_details["name"][-4:] in (
+                ".nsp",
+                ".nsz",
+                ".xci",
+                ".xcz",
+            ):
+                file_name = url_encode(file_details["name"], safe="")
+                if add_nsw_files_without_title_id or pattern.search(
+                    file_name,
                 ):
-                    file_name = url_encode(file_details["name"], safe="")
-                    if add_nsw_files_without_title_id or pattern.search(
-                        title_id_pattern,
-                        file_name,
-                    ):
-                        size = int(file_details["size"])
-                        self.index["files"].append({
-                            "url": f"gdrive:{file_id}#{file_name}",
-                            "size": size,
-                        })
+                    size = int(file_details["size"])
+                    self.add_index_file({
+                        "url": f"gdrive:{file_id}#{file_name}",
+                        "size": size,
+                    })
         if success is not None:
             self.index.update({"success": success})
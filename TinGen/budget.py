@@ -0,0 +1,78 @@
+from json import JSONDecodeError
+from json import dump as json_writer
+from json import load as json_reader
+from pathlib import Path
+from typing import List
+from typing import Optional
+
+
+def order_folders(
+    folder_ids: list,
+    priorities: Optional[List[str]] = None,
+    modified_times: Optional[dict] = None,
+) -> list:
+    """Orders folder IDs for a time-budgeted crawl.
+
+    Folders in `priorities` come first, in the order given. The rest follow
+    by most recent modification if `modified_times` is given and otherwise
+    keep their order.
+    """
+    priorities = [
+        folder_id for folder_id in priorities or []
+        if folder_id in folder_ids
+    ]
+    remaining = [
+        folder_id for folder_id in dict.fromkeys(folder_ids)
+        if folder_id not in priorities
+    ]
+    if modified_times:
+        remaining.sort(
+            key=lambda folder_id: modified_times.get(folder_id, ""),
+            reverse=True,
+        )
+    return list(dict.fromkeys(priorities)) + remaining
+
+
+def load_root_entries(
+    state_path: Path
+) -> dict:
+    """Loads the index entries of the last run, keyed by their folder ID"""
+    if state_path is None or not state_path.is_file():
+        return {}
+
+    with open(state_path, "r") as state_fp:
+        try:
+            return json_reader(state_fp)
+        except JSONDecodeError:
+            print(f"WARNING: {state_path} is not a valid JSON file.")
+            return {}
+
+
+def save_root_entries(
+    state_path: Path,
+    root_entries: dict,
+):
+    state_path.parent.resolve().mkdir(parents=True, exist_ok=True)
+    with open(state_path, "w") as state_fp:
+        json_writer(root_entries, state_fp)
+
+
+def coverage_summary(
+    coverage: dict,
+    root_entries: dict,
+    merged_entries: int = 0,
+) -> str:
+    statuses = list(coverage.values())
+    msg = "Crawl Coverage\n"
+    for status in ("complete", "partial", "unreached"):
+        folder_ids = [
+            folder_id for (folder_id, folder_status) in coverage.items()
+            if folder_status == status
+        ]
+        files = sum(
+            len(root_entries.get(folder_id, [])) for folder_id in folder_ids
+        )
+        msg += f"├─ {status.capitalize()}: {len(folder_ids):,} of " + \
+            f"{len(statuses):,} folders ({files:,} files)\n"
+    msg += f"└─ Kept from previous run: {merged_entries:,} files\n"
+    return msg
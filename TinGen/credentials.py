@@ -0,0 +1,160 @@
+from google.auth.credentials import Credentials
+from TinGen.transport import SessionHttp
+from threading import Lock
+from time import monotonic
+from time import sleep
+from typing import Optional
+
+
+class LockedCredentials(Credentials):
+    """Wraps credentials so concurrent requests refresh them only once.
+
+    It passes as google-auth credentials, so googleapiclient batches apply
+    and refresh them like the wrapped ones. The token is copied from the
+    wrapped credentials whenever they are refreshed.
+    """
+
+    def __init__(
+        self,
+        credentials
+    ):
+        super().__init__()
+        self.credentials = credentials
+        self.refresh_lock = Lock()
+        self._quota_project_id = getattr(
+            credentials,
+            "quota_project_id",
+            None,
+        )
+        self.copy_token()
+
+    def copy_token(
+        self
+    ):
+        self.token = self.credentials.token
+        self.expiry = self.credentials.expiry
+
+    def refresh(
+        self,
+        request
+    ):
+        with self.refresh_lock:
+            self.credentials.refresh(request)
+            self.copy_token()
+
+    def ensure_valid(
+        self,
+        request
+    ):
+        with self.refresh_lock:
+            if not self.valid:
+                self.credentials.refresh(request)
+                self.copy_token()
+
+    def before_request(
+        self,
+        request,
+        method,
+        url,
+        headers
+    ):
+        self.ensure_valid(request)
+        self.apply(headers)
+
+
+class PooledCredential:
+    def __init__(
+        self,
+        name: str,
+        credentials,
+        pool_size: int = 10,
+    ):
+        self.name = name
+        self.credentials = LockedCredentials(credentials)
+        self.http = SessionHttp(self.credentials, pool_size=pool_size)
+        self.next_request = 0.0
+        self.cooldown_until = 0.0
+        self.cooldown_count = 0
+        self.request_count = 0
+
+    def ready_at(
+        self
+    ) -> float:
+        return max(self.next_request, self.cooldown_until)
+
+
+class CredentialPool:
+    """Spreads requests over several credentials.
+
+    Each credential may send at most `requests_per_second` requests, and a
+    credential that hits a quota error is benched with an exponentially
+    growing cooldown while the others keep working. Without a rate, a
+    single credential is unlimited and pooled ones send at most
+    `POOLED_REQUESTS_PER_SECOND` each.
+    """
+
+    MAXIMUM_COOLDOWN = 64
+    POOLED_REQUESTS_PER_SECOND = 10.0
+
+    def __init__(
+        self,
+        credentials: list,
+        requests_per_second: Optional[float] = None,
+        pool_size: int = 10,
+    ):
+        if not credentials:
+            raise RuntimeError(
+                "Credential pool needs at least one credential."
+            )
+
+        self.members = [
+            PooledCredential(name, creds, pool_size=pool_size)
+            for (name, creds) in credentials
+        ]
+        if requests_per_second is None and len(self.members) > 1:
+            requests_per_second = CredentialPool.POOLED_REQUESTS_PER_SECOND
+        self.request_interval = 1.0 / requests_per_second \
+            if requests_per_second else 0.0
+        self.lock = Lock()
+
+    def __len__(
+        self
+    ) -> int:
+        return len(self.members)
+
+    def acquire(
+        self
+    ) -> PooledCredential:
+        """Waits for the credential with the earliest free budget"""
+        while True:
+            with self.lock:
+                now = monotonic()
+                member = min(self.members, key=PooledCredential.ready_at)
+                ready_at = member.ready_at()
+                if ready_at <= now:
+                    member.next_request = max(now, member.next_request) + \
+                        self.request_interval
+                    member.request_count += 1
+                    break
+            sleep(min(ready_at - now, 1.0))
+
+        return member
+
+    def report_success(
+        self,
+        member: PooledCredential
+    ):
+        with self.lock:
+            member.cooldown_count = 0
+
+    def report_quota_exceeded(
+        self,
+        member: PooledCredential
+    ):
+        with self.lock:
+            cooldown = min(
+                2 ** member.cooldown_count,
+                CredentialPool.MAXIMUM_COOLDOWN,
+            )
+            member.cooldown_count += 1
+            member.cooldown_until = monotonic() + cooldown
@@ -0,0 +1,150 @@
+from hashlib import sha256
+from json import JSONDecodeError
+from json import dump as json_writer
+from json import dumps as json_serialize
+from json import load as json_reader
+from pathlib import Path
+from TinGen.utils import format_bytes
+from TinGen.utils import index_entry_file_id
+from TinGen.utils import read_index
+
+
+class IndexDiff:
+    def __init__(
+        self,
+        added: list,
+        removed: list,
+        resized: list,
+    ):
+        self.added = added
+        self.removed = removed
+        self.resized = resized
+
+    @property
+    def changed(
+        self
+    ) -> bool:
+        return bool(self.added or self.removed or self.resized)
+
+    def summary(
+        self
+    ) -> str:
+        added_size = format_bytes(sum(e["size"] for e in self.added))
+        removed_size = format_bytes(sum(e["size"] for e in self.removed))
+        msg = "Changes Since Last Update\n"
+        msg += f"├─ Added: {len(self.added):,} " + \
+            f"({added_size[0]} {added_size[1]})\n"
+        msg += f"├─ Removed: {len(self.removed):,} " + \
+            f"({removed_size[0]} {removed_size[1]})\n"
+        msg += f"└─ Resized: {len(self.resized):,}\n"
+        return msg
+
+
+def index_entries_by_file_id(
+    index_entries: list
+) -> dict:
+    return {
+        index_entry_file_id(file_entry): file_entry
+        for file_entry in index_entries
+    }
+
+
+def diff_index_entries(
+    old_entries: list,
+    new_entries: list
+) -> IndexDiff:
+    """Compares index entries as sets keyed by file ID"""
+    old_by_id = index_entries_by_file_id(old_entries)
+    new_by_id = index_entries_by_file_id(new_entries)
+    old_ids = old_by_id.keys()
+    new_ids = new_by_id.keys()
+
+    return IndexDiff(
+        [new_by_id[file_id] for file_id in new_ids - old_ids],
+        [old_by_id[file_id] for file_id in old_ids - new_ids],
+        [
+            (old_by_id[file_id], new_by_id[file_id])
+            for file_id in new_ids & old_ids
+            if old_by_id[file_id]["size"] != new_by_id[file_id]["size"]
+        ],
+    )
+
+
+def index_fingerprint(
+    index: dict,
+    extra=None
+) -> str:
+    """Hashes the index content independent of entry order.
+
+    The success message is left out as it may carry a timestamp, anything
+    else that affects the written file can be passed in `extra`.
+    """
+    content = {
+        key: value for (key, value) in index.items()
+        if key not in ("files", "success")
+    }
+    content.update({
+        "files": sorted(
+            (file_entry["url"], file_entry["size"])
+            for file_entry in index.get("files", [])
+        ),
+        "extra": extra,
+    })
+    return sha256(
+        json_serialize(content, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def load_index_state(
+    state_path: Path
+):
+    """Loads the fingerprint and entries saved by `save_index_state`"""
+    if state_path is None or not state_path.is_file():
+        return None
+
+    with open(state_path, "r") as state_fp:
+        try:
+            return json_reader(state_fp)
+        except JSONDecodeError:
+            print(f"WARNING: {state_path} is not a valid JSON file.")
+            return None
+
+
+def save_index_state(
+    state_path: Path,
+    fingerprint: str,
+    index_entries: list,
+):
+    state_path.parent.resolve().mkdir(parents=True, exist_ok=True)
+    with open(state_path, "w") as state_fp:
+        json_writer(
+            {"fingerprint": fingerprint, "files": index_entries},
+            state_fp,
+        )
+
+
+def load_previous_index_state(
+    state_path: Path,
+    index_path: Path = None,
+    rsa_priv_key_path: Path = None,
+) -> dict:
+    """Loads the previous index state, falling back to the index file.
+
+    An index read back from disk has no fingerprint, so it can only be
+    diffed against and never lets the write be skipped.
+    """
+    state = load_index_state(state_path)
+    if state is not None:
+        return state
+
+    if index_path is not None and index_path.is_file():
+        try:
+            previous_index = read_index(index_path, rsa_priv_key_path)
+            return {
+                "fingerprint": None,
+                "files": previous_index.get("files", []),
+            }
+        except RuntimeError as error:
+            print(f"WARNING: Unable to read previous index: {error}")
+
+    return {"fingerprint": None, "files": []}
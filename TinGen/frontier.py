@@ -0,0 +1,461 @@
+from os import getpid
+from pathlib import Path
+from socket import gethostname
+from sqlite3 import connect as sqlite_connect
+from time import sleep
+from time import time
+from typing import List
+from typing import Optional
+from TinGen.gdrive import GDrive
+from TinGen.rules import CrawlRules
+
+
+class CrawlFrontier:
+    """Folders left to crawl and the files found, kept in a SQLite file.
+
+    Any number of workers, in this or other processes, claim pending folders
+    for a limited time (a lease), list them and hand back the files and
+    subfolders found. A folder whose lease ran out, e.g. because its worker
+    died, is handed to the next worker that asks. Folders are claimed by
+    priority, then by depth. Hosts sharing a frontier over a network
+    filesystem need one with working POSIX locks.
+    """
+
+    MAXIMUM_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        frontier_path: Path,
+        lease_seconds: float = 600.0,
+    ):
+        self.frontier_path = frontier_path
+        self.lease_seconds = lease_seconds
+        frontier_path.parent.resolve().mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite_connect(
+            str(frontier_path),
+            timeout=60.0,
+            isolation_level=None,
+        )
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS folders ("
+            "folder_id TEXT PRIMARY KEY, root_id TEXT, path TEXT, "
+            "depth INTEGER, included INTEGER, state TEXT, worker TEXT, "
+            "lease_expires REAL, attempts INTEGER DEFAULT 0, error TEXT, "
+            "priority INTEGER DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS folders_state ON folders (state);"
+            "CREATE TABLE IF NOT EXISTS files ("
+            "file_id TEXT PRIMARY KEY, root_id TEXT, name TEXT, "
+            "size INTEGER, shared INTEGER, md5 TEXT);"
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "worker TEXT, name TEXT, value INTEGER, "
+            "PRIMARY KEY (worker, name));"
+        )
+
+    def transaction(
+        self
+    ):
+        """Starts a write transaction, other workers wait until it ends"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def close(
+        self
+    ):
+        self.connection.close()
+
+    def seed(
+        self,
+        folder_ids: list,
+        rules: Optional[CrawlRules] = None,
+        prioritized: bool = False,
+    ):
+        """Starts a new crawl of the folder ids, dropping any earlier one.
+
+        If `prioritized` is set, each folder tree is crawled before the
+        trees of the folder ids following it.
+        """
+        connection = self.transaction()
+        try:
+            connection.execute("DELETE FROM folders")
+            connection.execute("DELETE FROM files")
+            connection.execute("DELETE FROM stats")
+            connection.executemany(
+                "INSERT OR IGNORE INTO folders (folder_id, root_id, path, "
+                "depth, included, state, priority) "
+                "VALUES (?, ?, '', 0, ?, 'pending', ?)",
+                [
+                    (
+                        folder_id,
+                        folder_id,
+                        int(rules is None or rules.root_included()),
+                        priority if prioritized else 0,
+                    )
+                    for (priority, folder_id) in enumerate(folder_ids)
+                ],
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def claim(
+        self,
+        worker: str,
+        count: int,
+    ) -> list:
+        """Leases up to count pending folders to the worker.
+
+        Returns their (folder ID, root ID, path, depth, included) rows.
+        """
+        now = time()
+        connection = self.transaction()
+        try:
+            connection.execute(
+                "UPDATE folders SET state = 'failed', worker = NULL, "
+                "error = 'Lease expired too often' WHERE state = 'leased' "
+                "AND lease_expires < ? AND attempts >= ?",
+                (now, CrawlFrontier.MAXIMUM_ATTEMPTS),
+            )
+            folder_rows = connection.execute(
+                "SELECT folder_id, root_id, path, depth, included "
+                "FROM folders WHERE state = 'pending' OR "
+                "(state = 'leased' AND lease_expires < ?) "
+                "ORDER BY priority, depth LIMIT ?",
+                (now, count),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE folders SET state = 'leased', worker = ?, "
+                "lease_expires = ?, attempts = attempts + 1 "
+                "WHERE folder_id = ?",
+                [
+                    (worker, now + self.lease_seconds, folder_row[0])
+                    for folder_row in folder_rows
+                ],
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+        return folder_rows
+
+    def complete(
+        self,
+        worker: str,
+        folder_rows: list,
+        files: list,
+        subfolder_states: dict,
+    ) -> int:
+        """Stores the results of folders the worker still holds leases on.
+
+        Results of folders whose lease was taken over by another worker are
+        dropped. Returns the number of folders completed.
+        """
+        root_ids = {folder_row[0]: folder_row[1] for folder_row in folder_rows}
+        connection = self.transaction()
+        try:
+            held_folder_ids = {
+                folder_row[0] for folder_row in connection.execute(
+                    "SELECT folder_id FROM folders WHERE state = 'leased' "
+                    "AND worker = ? AND folder_id IN (" +
+                    ", ".join("?" * len(root_ids)) + ")",
+                    (worker, *root_ids),
+                )
+            }
+            connection.executemany(
+                "INSERT OR IGNORE INTO files (file_id, root_id, name, size, "
+                "shared, md5) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        file_id,
+                        root_ids[parent_id],
+                        file_details["name"],
+                        int(file_details["size"]),
+                        int(file_details["shared"]),
+                        file_details.get("md5"),
+                    )
+                    for (parent_id, file_id, file_details) in files
+                    if parent_id in held_folder_ids
+                ],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO folders (folder_id, root_id, path, "
+                "depth, included, state, priority) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', "
+                "(SELECT priority FROM folders WHERE folder_id = ?))",
+                [
+                    (
+                        subfolder_id,
+                        root_ids[parent_id],
+                        path,
+                        depth,
+                        int(included),
+                        parent_id,
+                    )
+                    for (parent_id, states) in subfolder_states.items()
+                    if parent_id in held_folder_ids
+                    for (subfolder_id, path, depth, included) in states
+                ],
+            )
+            connection.executemany(
+                "UPDATE folders SET state = 'done', worker = NULL, "
+                "lease_expires = NULL WHERE folder_id = ?",
+                [(folder_id,) for folder_id in held_folder_ids],
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+        return len(held_folder_ids)
+
+    def release(
+        self,
+        worker: str,
+        folder_rows: list,
+        error: str,
+    ):
+        """Hands folders that failed to list back, or gives up on them"""
+        connection = self.transaction()
+        try:
+            connection.executemany(
+                "UPDATE folders SET worker = NULL, lease_expires = NULL, "
+                "error = ?, state = CASE WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END "
+                "WHERE folder_id = ? AND state = 'leased' AND worker = ?",
+                [
+                    (
+                        error,
+                        CrawlFrontier.MAXIMUM_ATTEMPTS,
+                        folder_row[0],
+                        worker,
+                    )
+                    for folder_row in folder_rows
+                ],
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def record_stats(
+        self,
+        worker: str,
+        stats: dict,
+    ):
+        """Stores the worker's running totals, e.g. of requests made"""
+        connection = self.transaction()
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO stats (worker, name, value) "
+                "VALUES (?, ?, ?)",
+                [(worker, name, value) for (name, value) in stats.items()],
+            )
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def stats(
+        self
+    ) -> dict:
+        """Returns the totals recorded by all workers"""
+        return dict(self.connection.execute(
+            "SELECT name, SUM(value) FROM stats GROUP BY name"
+        ).fetchall())
+
+    def counts(
+        self
+    ) -> dict:
+        """Returns the number of folders in each state"""
+        folder_counts = {
+            "pending": 0,
+            "leased": 0,
+            "done": 0,
+            "failed": 0,
+        }
+        folder_counts.update(dict(self.connection.execute(
+            "SELECT state, COUNT(*) FROM folders GROUP BY state"
+        ).fetchall()))
+        return folder_counts
+
+    def finished(
+        self
+    ) -> bool:
+        folder_counts = self.counts()
+        return not folder_counts["pending"] and not folder_counts["leased"]
+
+    def failed_folders(
+        self
+    ) -> list:
+        return self.connection.execute(
+            "SELECT folder_id, error FROM folders WHERE state = 'failed'"
+        ).fetchall()
+
+    def iter_root_files(
+        self,
+        root_id: str
+    ):
+        """Yields the (file ID, details) pairs found below a root folder"""
+        for (file_id, name, size, shared, md5) in self.connection.execute(
+            "SELECT file_id, name, size, shared, md5 FROM files "
+            "WHERE root_id = ?",
+            (root_id,),
+        ):
+            file_details = {
+                "size": size,
+                "name": name,
+                "shared": bool(shared),
+            }
+            if md5 is not None:
+                file_details.update({"md5": md5})
+            yield (file_id, file_details)
+
+    def summary(
+        self
+    ) -> str:
+        folder_counts = self.counts()
+        file_count = self.connection.execute(
+            "SELECT COUNT(*) FROM files"
+        ).fetchone()[0]
+        msg = "Crawl Frontier\n"
+        msg += f"├─ Folders listed: {folder_counts['done']:,}\n"
+        msg += f"├─ Folders failed: {folder_counts['failed']:,}\n"
+        msg += f"└─ Files found: {file_count:,}\n"
+        return msg
+
+
+def worker_name(
+    index: int
+) -> str:
+    return f"{gethostname()}-{getpid()}-{index}"
+
+
+def worker_stats(
+    gdrive_service: GDrive,
+    rules: Optional[CrawlRules] = None,
+) -> dict:
+    """Returns the counters a worker records in the frontier"""
+    stats = dict(gdrive_service.stats)
+    if rules is not None:
+        stats.update({
+            "pruned_folders": rules.pruned_folders,
+            "capped_folders": rules.capped_folders,
+            "saved_calls": rules.saved_calls,
+        })
+    return stats
+
+
+def list_leased_folders(
+    frontier: CrawlFrontier,
+    worker: str,
+    gdrive_service: GDrive,
+    folder_rows: list,
+    recursion: bool = True,
+    extensions: Optional[List[str]] = None,
+    rules: Optional[CrawlRules] = None,
+    backoff: float = 1.0,
+) -> int:
+    """Lists leased folders and stores the results in the frontier.
+
+    A batch that fails to list is split in halves, which are listed after
+    a growing delay, so one bad folder doesn't fail the whole batch. Only a
+    single folder failing is handed back. Returns the folders completed.
+    """
+    try:
+        (files, subfolder_states) = gdrive_service.list_folder_states(
+            [
+                (folder_id, path, depth, bool(included))
+                for (folder_id, _, path, depth, included) in folder_rows
+            ],
+            recursion,
+            extensions=extensions,
+            rules=rules,
+        )
+    except Exception as error:
+        if len(folder_rows) == 1:
+            print(
+                f"WARNING: {worker} failed to list folder " +
+                f"{folder_rows[0][0]}: {error}"
+            )
+            frontier.release(worker, folder_rows, str(error))
+            return 0
+
+        print(
+            f"WARNING: {worker} failed to list {len(folder_rows)} " +
+            f"folders, retrying them in halves: {error}"
+        )
+        sleep(backoff)
+        half = len(folder_rows) // 2
+        return sum(
+            list_leased_folders(
+                frontier,
+                worker,
+                gdrive_service,
+                half_rows,
+                recursion,
+                extensions,
+                rules,
+                backoff * 2,
+            )
+            for half_rows in (folder_rows[:half], folder_rows[half:])
+        )
+
+    return frontier.complete(
+        worker,
+        folder_rows,
+        files,
+        subfolder_states,
+    )
+
+
+def run_crawl_worker(
+    frontier_path: Path,
+    gdrive_options: dict,
+    recursion: bool = True,
+    extensions: Optional[List[str]] = None,
+    rules: Optional[CrawlRules] = None,
+    lease_seconds: float = 600.0,
+    poll_interval: float = 1.0,
+    worker_index: int = 0,
+):
+    """Lists folders from the frontier until none are left.
+
+    The worker builds its own `GDrive` from `gdrive_options`, so it can run
+    in a process of its own. Folders leased to other workers are waited
+    for, as listing them may still add new folders. Its request and
+    pruning counters are recorded in the frontier after every batch.
+    """
+    worker = worker_name(worker_index)
+    gdrive_service = GDrive(**gdrive_options)
+    frontier = CrawlFrontier(frontier_path, lease_seconds=lease_seconds)
+    folder_count = 0
+
+    try:
+        while True:
+            folder_rows = frontier.claim(
+                worker,
+                gdrive_service.parents_batch_size,
+            )
+            if not folder_rows:
+                if frontier.finished():
+                    break
+                sleep(poll_interval)
+                continue
+
+            folder_count += list_leased_folders(
+                frontier,
+                worker,
+                gdrive_service,
+                folder_rows,
+                recursion,
+                extensions,
+                rules,
+                poll_interval,
+            )
+            frontier.record_stats(
+                worker,
+                worker_stats(gdrive_service, rules),
+            )
+    finally:
+        frontier.close()
+
+    return folder_count
@@ -1,7 +1,18 @@
 from tqdm import tqdm
 from time import sleep
+from time import monotonic
+from threading import Lock
+from threading import BoundedSemaphore
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait as wait_futures
 from pathlib import Path
 from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from json import JSONDecodeError
 from json import load as json_reader
 from json import dump as json_writer
@@ -10,6 +21,13 @@ from googleapiclient.errors import HttpError
 from socket import timeout as SocketTimeoutError
 from googleapiclient.http import MediaFileUpload
 from google.oauth2.credentials import Credentials
+from google.oauth2.service_account import Credentials as \
+    ServiceAccountCredentials
+from TinGen.credentials import CredentialPool
+from TinGen.utils import deserialize_json
+from TinGen.rules import CrawlRules
+from typing import List
+from typing import Optional
 from google.auth.exceptions import TransportError
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -17,6 +35,36 @@ from googleapiclient.discovery import build as google_api_build
 
 
 class GDrive:
+    SCAN_FIELDS = "files(id,name,size,permissionIds),nextPageToken"
+    FOLDER_FIELDS = "files(id,name),nextPageToken"
+    LOOKUP_FIELDS = "files(id,name),nextPageToken"
+    DRIVE_SCAN_FIELDS = "files(id,name,size,permissionIds,mimeType," + \
+        "parents),nextPageToken"
+    HASH_SCAN_FIELDS = "files(id,name,size,permissionIds,md5Checksum)," + \
+        "nextPageToken"
+    DRIVE_HASH_SCAN_FIELDS = "files(id,name,size,permissionIds,mimeType," + \
+        "parents,md5Checksum),nextPageToken"
+    FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+    QUOTA_ERROR_REASONS = (
+        "dailyLimitExceeded",
+        "userRateLimitExceeded",
+        "rateLimitExceeded",
+        "sharingRateLimitExceeded",
+    )
+    RETRYABLE_ERROR_REASONS = (
+        "backendError",
+        "failedPrecondition",
+        "internalError",
+        "domainPolicy",
+        "insufficientFilePermissions",
+        "appNotAuthorizedToFile",
+    )
+    MAXIMUM_QUOTA_RETRIES = 8
+    VERIFY_FIELDS = "id,trashed"
+    VERIFY_BATCH_SIZE = 100
+    MAXIMUM_VERIFY_ROUNDS = 5
+    MAXIMUM_PARENTS_QUERY_LENGTH = 4000
+
     @staticmethod
     def _cred_to_json(
         cred_to_pass
@@ -84,61 +132,147 @@ class GDrive:
         self,
         credentials_path: str,
         token_path: str,
-        headless: bool
+        headless: bool,
+        flat_shared_drives: bool = False,
+        extra_token_paths: Optional[List[str]] = None,
+        service_account_paths: Optional[List[str]] = None,
+        requests_per_second: Optional[float] = None,
+        content_hashes: bool = False,
+        pool_size: int = 10,
+        parents_batch_size: int = 1,
     ) -> None:
-        credentials = GDrive._get_creds(
-            credentials=credentials_path,
-            token=token_path,
-            headless=headless,
+        self.flat_shared_drives = flat_shared_drives
+        self.parents_batch_size = parents_batch_size
+        self.scan_fields = GDrive.SCAN_FIELDS
+        self.drive_scan_fields = GDrive.DRIVE_SCAN_FIELDS
+        if content_hashes:
+            self.scan_fields = GDrive.HASH_SCAN_FIELDS
+            self.drive_scan_fields = GDrive.DRIVE_HASH_SCAN_FIELDS
+        self.drive_trees = {}
+        self.listing_cache = None
+        self.listing_extensions = None
+        self.listing_lock = Lock()
+        self.permission_lock = Lock()
+        pool_credentials = []
+
+        for pool_token_path in [token_path] + (extra_token_paths or []):
+            pool_credentials.append((pool_token_path, GDrive._get_creds(
+                credentials=credentials_path,
+                token=pool_token_path,
+                headless=headless,
+            )))
+
+        for service_account_path in service_account_paths or []:
+            pool_credentials.append((
+                service_account_path,
+                ServiceAccountCredentials.from_service_account_file(
+                    service_account_path,
+                    scopes=["https://www.googleapis.com/auth/drive"],
+                ),
+            ))
+
+        self.credential_pool = CredentialPool(
+            [
+                (name, creds) for (name, creds) in pool_credentials
+                if creds is not None
+            ],
+            requests_per_second=requests_per_second,
+            pool_size=pool_size,
         )
         self.drive_service = google_api_build(
             "drive",
             "v3",
-            credentials=credentials,
+            http=self.credential_pool.members[0].http,
         )
+        self.stats = {
+            "requests": 0,
+            "bytes_received": 0,
+            "bytes_decoded": 0,
+            "gzip_responses": 0,
+        }
+        self.stats_lock = Lock()
+
+    def _record_transfer(
+        self,
+        response,
+        content
+    ):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_decoded"] += len(content or b"")
+            self.stats["bytes_received"] += int(
+                response.get("-wire-length", len(content or b""))
+            )
+            if "-content-encoding" in response:
+                self.stats["gzip_responses"] += 1
+
+    def _prepare_request(
+        self,
+        request
+    ):
+        """Asks for a gzip-encoded response and counts response bytes."""
+        request.headers.update({"accept-encoding": "gzip"})
+        user_agent = request.headers.get("user-agent", "TinGen")
+        if "gzip" not in user_agent:
+            request.headers.update({"user-agent": f"{user_agent} (gzip)"})
+
+        postproc = request.postproc
+
+        def counting_postproc(response, content):
+            self._record_transfer(response, content)
+            return postproc(response, content)
+
+        request.postproc = counting_postproc
 
     def _apicall(
         self,
         request,
         maximum_backoff=32
     ):
+        """Executes the request with a credential from the pool.
+
+        Quota errors bench the credential that hit them and retry with the
+        next free one, other retryable errors back off exponentially.
+        """
         sleep_exponent_count = 0
+        quota_retries = 0
+        self._prepare_request(request)
         while True:
-            success = True
             retry = False
+            credential = self.credential_pool.acquire()
             try:
-                return request.execute()
+                response = request.execute(http=credential.http)
+                self.credential_pool.report_success(credential)
+                return response
             except HttpError as error:
-                success = False
+                self._record_transfer(error.resp, error.content)
                 try:
                     error_details = json_deserialize(
                         error.content.decode("utf-8"),
                     )["error"]
+                    if GDrive._query_too_complex(error_details):
+                        raise error
                     if "errors" in error_details:
-                        if error_details["errors"][0]["reason"] in (
-                            "dailyLimitExceeded",
-                            "userRateLimitExceeded",
-                            "rateLimitExceeded",
-                            "backendError",
-                            "sharingRateLimitExceeded",
-                            "failedPrecondition",
-                            "internalError",
-                            "domainPolicy",
-                            "insufficientFilePermissions",
-                            "appNotAuthorizedToFile"
-                        ):  # IF REQUEST IS RETRYABLE
+                        reason = error_details["errors"][0]["reason"]
+                        if reason in GDrive.QUOTA_ERROR_REASONS:
+                            self.credential_pool.report_quota_exceeded(
+                                credential,
+                            )
+                            quota_retries += 1
+                            if quota_retries < GDrive.MAXIMUM_QUOTA_RETRIES * \
+                                    len(self.credential_pool):
+                                continue
+                            raise Exception("Quota Retry Limit Exceeded.")
+                        if reason in GDrive.RETRYABLE_ERROR_REASONS:
                             retry = True
                     else:
                         raise error
                 except JSONDecodeError:
                     retry = True
-            except (TransportError, SocketTimeoutError, SocketTimeoutError):
-                success = False
+            except (TransportError, SocketTimeoutError):
                 retry = True
-            if success:
-                break
             if retry:
-                sleep_time = 2 ^ sleep_exponent_count
+                sleep_time = 2 ** sleep_exponent_count
                 if sleep_time < maximum_backoff:
                     sleep(sleep_time)
                     sleep_exponent_count += 1
@@ -148,13 +282,30 @@ class GDrive:
             else:
                 raise Exception("Unretryable Error")
 
+    @staticmethod
+    def _query_too_complex(
+        error_details: dict
+    ) -> bool:
+        """Tells whether Drive rejected a query for being too complex"""
+        return "too complex" in error_details.get("message", "").lower()
+
+    @staticmethod
+    def _extension_terms(
+        extensions
+    ) -> str:
+        """Builds a query term matching names with any of the extensions"""
+        return "(" + " or ".join([
+            f"name contains \".{ext}\"" for ext in extensions
+        ]) + ")"
+
     def _ls(
         self,
         folder_id,
-        fields="files(id,name,size,permissionIds),nextPageToken",
-        searchTerms=""
+        fields=SCAN_FIELDS,
+        searchTerms="",
+        page_size=1000
     ):
-        files = []
+        """Yields the folder's children, one page of results at a time"""
         resp = {"nextPageToken": None}
         while "nextPageToken" in resp:
             resp = self._apicall(self.drive_service.files().list(
@@ -164,20 +315,21 @@ class GDrive:
                     "trashed = false",
                 ]),
                 fields=fields,
-                pageSize=1000,
+                pageSize=page_size,
                 supportsAllDrives=True,
                 includeItemsFromAllDrives=True,
                 pageToken=resp["nextPageToken"]
             ))
-            files += resp["files"]
-        return files
+            yield from resp["files"]
 
     def _lsd(
         self,
-        folder_id
+        folder_id,
+        fields=FOLDER_FIELDS
     ):
         return self._ls(
             folder_id,
+            fields=fields,
             searchTerms="mimeType contains " +
             "\"application/vnd.google-apps.folder\""
         )
@@ -185,27 +337,35 @@ class GDrive:
     def _lsf(
         self,
         folder_id,
-        fields="files(id,name,size,permissionIds),nextPageToken"
+        fields=SCAN_FIELDS,
+        extensions=None,
+        page_size=1000
     ):
+        searchTerms = "not mimeType contains " + \
+            "\"application/vnd.google-apps.folder\""
+        if extensions:
+            searchTerms += " and " + GDrive._extension_terms(extensions)
         return self._ls(
             folder_id,
             fields=fields,
-            searchTerms="not mimeType contains " +
-            "\"application/vnd.google-apps.folder\""
+            searchTerms=searchTerms,
+            page_size=page_size
         )
 
     def _lsd_my_drive(
-        self
+        self,
+        fields=FOLDER_FIELDS
     ):
         return self._ls(
             "root",
+            fields=fields,
             searchTerms="mimeType contains " +
             "\"application/vnd.google-apps.folder\""
         )
 
     def _lsf_my_drive(
         self,
-        fields="files(id,name,size,permissionIds),nextPageToken",
+        fields=SCAN_FIELDS,
     ):
         return self._ls(
             "root",
@@ -218,16 +378,23 @@ class GDrive:
         self,
         file_to_check,
     ):
-        shared = False
-        if "permissionIds" in file_to_check:
-            for permissionId in file_to_check["permissionIds"]:
-                if permissionId[-1] == "k" and permissionId[:-1].isnumeric():
-                    self.delete_file_permission(
-                        file_to_check["id"],
-                        permissionId,
-                    )
-                if permissionId == "anyoneWithLink":
-                    shared = True
+        if "permissionIds" not in file_to_check:
+            return False
+
+        permission_ids = file_to_check["permissionIds"]
+        with self.permission_lock:
+            shared = "anyoneWithLink" in permission_ids
+            stale_ids = [
+                permission_id for permission_id in permission_ids
+                if permission_id[-1] == "k" and permission_id[:-1].isnumeric()
+            ]
+            # Claimed IDs are dropped so other threads and cached listings
+            # don't delete them again, the deletes run outside the lock
+            for permission_id in stale_ids:
+                permission_ids.remove(permission_id)
+
+        for permission_id in stale_ids:
+            self.delete_file_permission(file_to_check["id"], permission_id)
         return shared
 
     def delete_file_permission(
@@ -243,34 +410,862 @@ class GDrive:
             )
         )
 
-    def get_all_files_in_folder(
+    def enable_listing_cache(
+        self,
+        extensions=None
+    ):
+        """Lists every folder at most once until `clear_listing_cache`.
+
+        Cached listings are shared by all callers, so they are requested
+        with `extensions`, which has to cover the extensions of every
+        caller, or unfiltered if it is None.
+        """
+        with self.listing_lock:
+            self.listing_cache = {}
+            self.listing_extensions = extensions
+
+    def clear_listing_cache(
+        self
+    ):
+        with self.listing_lock:
+            self.listing_cache = None
+            self.listing_extensions = None
+
+    def _cached_listing(
+        self,
+        listing_key: tuple,
+        list_function
+    ):
+        """Returns the cached result of list_function for the key.
+
+        Concurrent callers asking for the same key wait for the first one
+        instead of listing again.
+        """
+        with self.listing_lock:
+            listing = self.listing_cache.get(listing_key)
+            owner = listing is None
+            if owner:
+                listing = Future()
+                self.listing_cache.update({listing_key: listing})
+
+        if owner:
+            try:
+                listing.set_result(list_function())
+            except BaseException as error:
+                with self.listing_lock:
+                    self.listing_cache.pop(listing_key, None)
+                listing.set_exception(error)
+                raise
+
+        return listing.result()
+
+    def _list_files(
         self,
         folder_id: str,
-        recursion: bool,
-        progress_bar: tqdm
+        extensions=None,
+        page_size=1000
+    ):
+        if self.listing_cache is None:
+            return self._lsf(
+                folder_id,
+                fields=self.scan_fields,
+                extensions=extensions,
+                page_size=page_size
+            )
+        return self._cached_listing(
+            ("files", folder_id),
+            lambda: list(self._lsf(
+                folder_id,
+                fields=self.scan_fields,
+                extensions=self.listing_extensions
+            ))
+        )
+
+    def _list_folders(
+        self,
+        folder_id: str
+    ):
+        if self.listing_cache is None:
+            return self._lsd(folder_id)
+        return self._cached_listing(
+            ("folders", folder_id),
+            lambda: list(self._lsd(folder_id))
+        )
+
+    def get_drive_id(
+        self,
+        folder_id: str
+    ):
+        """Returns the shared drive ID of the folder, None for My Drive"""
+        def lookup_drive_id():
+            return self._apicall(self.drive_service.files().get(
+                fileId=folder_id,
+                fields="driveId",
+                supportsAllDrives=True,
+            )).get("driveId")
+
+        if self.listing_cache is None:
+            return lookup_drive_id()
+        return self._cached_listing(("drive_id", folder_id), lookup_drive_id)
+
+    def _get_drive_tree(
+        self,
+        drive_id: str,
+        extensions=None
     ) -> dict:
-        files = {}
+        """Lists a whole shared drive, grouping its items by parent ID.
 
-        for _file in self._lsf(folder_id):
-            if "size" in _file:
-                files.update({
-                    _file["id"]: {
-                        "size": _file["size"],
-                        "name": _file["name"],
-                        "shared": self.check_file_shared(_file)
-                    }
-                })
+        The listing is kept until `clear_drive_trees` so other scan roots on
+        the same shared drive don't list it again.
+        """
+        tree_key = (drive_id, tuple(extensions or ()))
+        if tree_key in self.drive_trees:
+            return self.drive_trees[tree_key]
+
+        query = "trashed = false"
+        if extensions:
+            query += " and (mimeType = \"" + GDrive.FOLDER_MIME_TYPE + \
+                "\" or " + GDrive._extension_terms(extensions) + ")"
+
+        drive_tree = {}
+        resp = {"nextPageToken": None}
+        while "nextPageToken" in resp:
+            resp = self._apicall(self.drive_service.files().list(
+                q=query,
+                fields=self.drive_scan_fields,
+                pageSize=1000,
+                corpora="drive",
+                driveId=drive_id,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                pageToken=resp["nextPageToken"]
+            ))
+            for _file in resp["files"]:
+                for parent_id in _file.get("parents", []):
+                    drive_tree.setdefault(parent_id, []).append(_file)
+
+        self.drive_trees.update({tree_key: drive_tree})
+        return drive_tree
+
+    def clear_drive_trees(
+        self
+    ):
+        self.drive_trees.clear()
+
+    def _file_details(
+        self,
+        _file: dict
+    ) -> dict:
+        file_details = {
+            "size": _file["size"],
+            "name": _file["name"],
+            "shared": self.check_file_shared(_file)
+        }
+        if "md5Checksum" in _file:
+            file_details.update({"md5": _file["md5Checksum"]})
+        return file_details
+
+    @staticmethod
+    def _capped_page_size(
+        rules: Optional[CrawlRules]
+    ) -> int:
+        """Returns a page size that fetches little past the per-folder cap"""
+        if rules is None or rules.max_files_per_folder is None:
+            return 1000
+        return max(min(rules.max_files_per_folder + 1, 1000), 1)
+
+    def _capped_files(
+        self,
+        files,
+        rules: Optional[CrawlRules]
+    ):
+        """Yields a folder's files up to the rules' per-folder cap"""
+        file_count = 0
+        for _file in files:
+            if "size" not in _file:
+                continue
+            if rules is not None and \
+                    rules.max_files_per_folder is not None and \
+                    file_count >= rules.max_files_per_folder:
+                rules.capped_folders += 1
+                return
+            file_count += 1
+            yield _file
+
+    def _subfolders(
+        self,
+        folders,
+        folder_state: tuple,
+        seen_folder_ids: set,
+        rules: Optional[CrawlRules],
+        calls_per_folder: float
+    ) -> list:
+        """Returns the states of the subfolders that should be walked.
+
+        Listing a folder costs `calls_per_folder` list calls, which are
+        counted as saved for every subfolder the rules skip.
+        """
+        (_, path, depth, included) = folder_state
+        subfolder_states = []
+        for _folder in folders:
+            if _folder["id"] in seen_folder_ids:
+                continue
+            seen_folder_ids.add(_folder["id"])
+            subfolder_path = f"{path}/{_folder.get('name', '')}".lstrip("/")
+            subfolder_included = included
+            if rules is not None:
+                (listed, subfolder_included) = rules.folder_state(
+                    _folder.get("name", ""),
+                    subfolder_path,
+                    depth + 1,
+                    included,
+                )
+                if not listed:
+                    rules.saved_calls += calls_per_folder
+                    continue
+            subfolder_states.append((
+                _folder["id"],
+                subfolder_path,
+                depth + 1,
+                subfolder_included,
+            ))
+        return subfolder_states
+
+    def iter_files_in_drive_folder(
+        self,
+        drive_id: str,
+        folder_id: str,
+        recursion: bool,
+        progress_bar: tqdm,
+        extensions=None,
+        rules: Optional[CrawlRules] = None
+    ):
+        """Yields files below a folder from the flat shared drive listing"""
+        if self.listing_cache is None:
+            drive_tree = self._get_drive_tree(drive_id, extensions)
+        else:
+            drive_tree = self._cached_listing(
+                ("drive", drive_id),
+                lambda: self._get_drive_tree(
+                    drive_id,
+                    self.listing_extensions
+                )
+            )
+        folder_states = [(
+            folder_id,
+            "",
+            0,
+            rules is None or rules.root_included(),
+        )]
+        seen_folder_ids = {folder_id}
+
+        while folder_states:
+            folder_state = folder_states.pop()
+            children = drive_tree.get(folder_state[0], [])
+
+            if folder_state[3]:
+                for _file in self._capped_files(
+                    [
+                        _file for _file in children
+                        if _file.get("mimeType") != GDrive.FOLDER_MIME_TYPE
+                    ],
+                    rules,
+                ):
+                    progress_bar.update(1)
+                    yield (_file["id"], self._file_details(_file))
+
+            if recursion and (
+                rules is None or rules.lists_subfolders(folder_state[2])
+            ):
+                folder_states += reversed(self._subfolders(
+                    [
+                        _file for _file in children
+                        if _file.get("mimeType") == GDrive.FOLDER_MIME_TYPE
+                    ],
+                    folder_state,
+                    seen_folder_ids,
+                    rules,
+                    0,
+                ))
+
+    def _ls_parents(
+        self,
+        folder_ids: list,
+        extensions=None
+    ):
+        """Yields the children of all the folders, listed with one query.
+
+        If Drive finds the query too complex, the folders are listed in two
+        halves instead and later batches are halved as well.
+        """
+        listed = False
+        try:
+            for _file in self._ls_parents_query(folder_ids, extensions):
+                listed = True
+                yield _file
+        except HttpError as error:
+            if listed or len(folder_ids) < 2 or not GDrive._query_too_complex(
+                json_deserialize(error.content.decode("utf-8"))["error"],
+            ):
+                raise
+            self.parents_batch_size = max(len(folder_ids) // 2, 1)
+            print(
+                f"WARNING: Drive rejected a query for {len(folder_ids)} " +
+                "folders as too complex, listing at most " +
+                f"{self.parents_batch_size} per query"
+            )
+            for half_folder_ids in (
+                folder_ids[:len(folder_ids) // 2],
+                folder_ids[len(folder_ids) // 2:],
+            ):
+                yield from self._ls_parents(half_folder_ids, extensions)
+
+    def _ls_parents_query(
+        self,
+        folder_ids: list,
+        extensions=None
+    ):
+        query = "(" + " or ".join([
+            f"\"{folder_id}\" in parents" for folder_id in folder_ids
+        ]) + ") and trashed = false"
+        if extensions:
+            query += " and (mimeType = \"" + GDrive.FOLDER_MIME_TYPE + \
+                "\" or " + GDrive._extension_terms(extensions) + ")"
+
+        resp = {"nextPageToken": None}
+        while "nextPageToken" in resp:
+            resp = self._apicall(self.drive_service.files().list(
+                q=query,
+                fields=self.drive_scan_fields,
+                pageSize=1000,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                pageToken=resp["nextPageToken"]
+            ))
+            yield from resp["files"]
+
+    def _next_parents_batch(
+        self,
+        frontier: deque
+    ) -> list:
+        """Takes as many folders off the frontier as fit in one query"""
+        folder_ids = []
+        query_length = 0
+        while frontier and len(folder_ids) < self.parents_batch_size:
+            clause_length = len(frontier[0]) + len("\"\" in parents or ")
+            if folder_ids and query_length + clause_length > \
+                    GDrive.MAXIMUM_PARENTS_QUERY_LENGTH:
+                break
+            folder_ids.append(frontier.popleft())
+            query_length += clause_length
+        return folder_ids
+
+    def _iter_parents_batch(
+        self,
+        batch_folder_ids: list,
+        folder_states: dict,
+        subfolders: dict,
+        extensions=None,
+        rules: Optional[CrawlRules] = None
+    ):
+        """Yields (parent ID, file) for the files of a batch of folders.
+
+        The folders are listed with one query and split back out by the
+        `parents` field of each child. Subfolders are collected into
+        `subfolders` by parent ID.
+        """
+        for _file in self._ls_parents(batch_folder_ids, extensions):
+            parent_ids = [
+                parent_id for parent_id in _file.get("parents", [])
+                if parent_id in subfolders
+            ]
+            if not parent_ids:
+                continue
+
+            if _file.get("mimeType") == GDrive.FOLDER_MIME_TYPE:
+                for parent_id in parent_ids:
+                    subfolders[parent_id].append(_file)
+                continue
+
+            parent_id = parent_ids[0]
+            if "size" not in _file or not folder_states[parent_id][3]:
+                continue
+
+            yield (parent_id, _file)
+
+    def _iter_capped_folder(
+        self,
+        folder_state: tuple,
+        subfolders: dict,
+        recursion: bool,
+        extensions,
+        rules: CrawlRules
+    ):
+        """Yields (folder ID, file) for a folder with a per-folder file cap.
+
+        Files and subfolders are listed with separate queries, so paging
+        through the files stops once the cap is reached.
+        """
+        folder_id = folder_state[0]
+        if folder_state[3]:
+            for _file in self._capped_files(
+                self._list_files(
+                    folder_id,
+                    extensions=extensions,
+                    page_size=GDrive._capped_page_size(rules)
+                ),
+                rules,
+            ):
+                yield (folder_id, _file)
+
+        if recursion and GDrive._walks_subfolders(folder_state, rules):
+            subfolders[folder_id] += self._list_folders(folder_id)
+
+    @staticmethod
+    def _walks_subfolders(
+        folder_state: tuple,
+        rules: Optional[CrawlRules]
+    ) -> bool:
+        """Checks the rules' maximum depth for a folder listed on its own.
+
+        A folder at the maximum depth saves the call listing its subfolders.
+        """
+        if rules is None or rules.lists_subfolders(folder_state[2]):
+            return True
+        rules.saved_calls += 1
+        return False
+
+    def _walked_subfolders(
+        self,
+        folders,
+        folder_state: tuple,
+        seen_folder_ids: set,
+        rules: Optional[CrawlRules],
+        calls_per_folder: float
+    ) -> list:
+        """Like `_subfolders`, but none below the rules' maximum depth"""
+        if rules is not None and not rules.lists_subfolders(folder_state[2]):
+            rules.saved_calls += calls_per_folder * len([
+                _folder for _folder in folders
+                if _folder["id"] not in seen_folder_ids
+            ])
+            return []
+        return self._subfolders(
+            folders,
+            folder_state,
+            seen_folder_ids,
+            rules,
+            calls_per_folder,
+        )
+
+    def iter_files_in_folders_batched(
+        self,
+        folder_id: str,
+        progress_bar: tqdm,
+        extensions=None,
+        rules: Optional[CrawlRules] = None,
+        deadline: Optional[float] = None
+    ):
+        """Walks the tree breadth first, listing many folders per query.
+
+        Folders waiting on the frontier are OR'ed together into one
+        `in parents` query, and the results are split back out by the
+        `parents` field of each file. Files and subfolders come from the
+        same query. No batch is listed once the deadline has passed.
+        """
+        folder_states = {folder_id: (
+            folder_id,
+            "",
+            0,
+            rules is None or rules.root_included(),
+        )}
+        frontier = deque([folder_id])
+        seen_folder_ids = {folder_id}
+
+        while frontier:
+            if deadline is not None and monotonic() >= deadline:
+                return
+            batch_folder_ids = self._next_parents_batch(frontier)
+            subfolders = {
+                batch_folder_id: [] for batch_folder_id in batch_folder_ids
+            }
+
+            for (_, _file) in self._iter_parents_batch(
+                batch_folder_ids,
+                folder_states,
+                subfolders,
+                extensions,
+                rules,
+            ):
                 progress_bar.update(1)
+                yield (_file["id"], self._file_details(_file))
+
+            for batch_folder_id in batch_folder_ids:
+                for subfolder_state in self._walked_subfolders(
+                    subfolders[batch_folder_id],
+                    folder_states.pop(batch_folder_id),
+                    seen_folder_ids,
+                    rules,
+                    1 / self.parents_batch_size,
+                ):
+                    folder_states.update({subfolder_state[0]: subfolder_state})
+                    frontier.append(subfolder_state[0])
 
-        if recursion:
-            for _folder in self._lsd(folder_id):
-                files.update(self.get_all_files_in_folder(
-                    _folder["id"],
+    def list_folder_states(
+        self,
+        folder_states: list,
+        recursion: bool,
+        extensions=None,
+        rules: Optional[CrawlRules] = None
+    ) -> tuple:
+        """Lists a set of folders, as many per query as fit, for a worker.
+
+        Returns the (parent ID, file ID, details) of the files found and the
+        states of the subfolders to walk next, keyed by their parent ID.
+        With a per-folder file cap, every folder is listed on its own.
+        """
+        states_by_id = {
+            folder_state[0]: folder_state for folder_state in folder_states
+        }
+        frontier = deque(states_by_id)
+        seen_folder_ids = set(states_by_id)
+        files = []
+        subfolder_states = {}
+        capped = rules is not None and rules.max_files_per_folder is not None
+
+        while frontier:
+            if capped:
+                batch_folder_ids = [frontier.popleft()]
+            else:
+                batch_folder_ids = self._next_parents_batch(frontier)
+            subfolders = {
+                batch_folder_id: [] for batch_folder_id in batch_folder_ids
+            }
+
+            if capped:
+                batch_files = self._iter_capped_folder(
+                    states_by_id[batch_folder_ids[0]],
+                    subfolders,
+                    recursion,
+                    extensions,
+                    rules,
+                )
+            else:
+                batch_files = self._iter_parents_batch(
+                    batch_folder_ids,
+                    states_by_id,
+                    subfolders,
+                    extensions,
+                    rules,
+                )
+
+            for (parent_id, _file) in batch_files:
+                files.append(
+                    (parent_id, _file["id"], self._file_details(_file))
+                )
+
+            for batch_folder_id in batch_folder_ids:
+                subfolder_states.update({batch_folder_id: []})
+                if recursion:
+                    subfolder_states.update({
+                        batch_folder_id: self._walked_subfolders(
+                            subfolders[batch_folder_id],
+                            states_by_id[batch_folder_id],
+                            seen_folder_ids,
+                            rules,
+                            2 if capped else 1 / self.parents_batch_size,
+                        )
+                    })
+
+        return (files, subfolder_states)
+
+    def iter_files_in_folder(
+        self,
+        folder_id: str,
+        recursion: bool,
+        progress_bar: tqdm,
+        extensions=None,
+        rules: Optional[CrawlRules] = None,
+        deadline: Optional[float] = None
+    ):
+        """Yields (file ID, details) pairs as each page of files arrives.
+
+        Folders are walked depth first with an explicit stack, so memory use
+        doesn't grow with the depth of the tree. If `extensions` is given,
+        only files with names containing one of them are requested from
+        Drive. Callers should still check the names themselves. Subfolders
+        ruled out by `rules` are never listed, and no folder is listed once
+        the `time.monotonic` deadline has passed.
+
+        Unless the listing cache is enabled or the files per folder are
+        capped, recursive crawls list up to `parents_batch_size` folders per
+        query.
+        """
+        if recursion and self.flat_shared_drives:
+            drive_id = self.get_drive_id(folder_id)
+            if drive_id is not None:
+                yield from self.iter_files_in_drive_folder(
+                    drive_id,
+                    folder_id,
                     recursion,
-                    progress_bar
+                    progress_bar,
+                    extensions,
+                    rules
+                )
+                return
+
+        if recursion and self.parents_batch_size > 1 and \
+                self.listing_cache is None and (
+                    rules is None or rules.max_files_per_folder is None
+                ):
+            yield from self.iter_files_in_folders_batched(
+                folder_id,
+                progress_bar,
+                extensions,
+                rules,
+                deadline
+            )
+            return
+
+        page_size = GDrive._capped_page_size(rules)
+
+        folder_states = [(
+            folder_id,
+            "",
+            0,
+            rules is None or rules.root_included(),
+        )]
+        seen_folder_ids = {folder_id}
+
+        while folder_states:
+            if deadline is not None and monotonic() >= deadline:
+                return
+            folder_state = folder_states.pop()
+
+            if folder_state[3]:
+                for _file in self._capped_files(
+                    self._list_files(
+                        folder_state[0],
+                        extensions=extensions,
+                        page_size=page_size
+                    ),
+                    rules,
+                ):
+                    progress_bar.update(1)
+                    yield (_file["id"], self._file_details(_file))
+
+            if recursion and GDrive._walks_subfolders(folder_state, rules):
+                folder_states += reversed(self._subfolders(
+                    self._list_folders(folder_state[0]),
+                    folder_state,
+                    seen_folder_ids,
+                    rules,
+                    2,
                 ))
 
-        return files
+    def get_all_files_in_folder(
+        self,
+        folder_id: str,
+        recursion: bool,
+        progress_bar: tqdm,
+        extensions=None,
+        rules: Optional[CrawlRules] = None
+    ) -> dict:
+        """Returns the files in a folder, recursing into subfolders if asked"""
+        return dict(self.iter_files_in_folder(
+            folder_id,
+            recursion,
+            progress_bar,
+            extensions,
+            rules
+        ))
+
+    def get_start_page_token(
+        self
+    ) -> str:
+        """Returns the changes page token for the current Drive state"""
+        return self._apicall(
+            self.drive_service.changes().getStartPageToken(
+                supportsAllDrives=True,
+            )
+        )["startPageToken"]
+
+    def get_changes(
+        self,
+        page_token: str
+    ):
+        """Returns changes since page token and the page token to poll next"""
+        changes = []
+        resp = {"nextPageToken": page_token}
+        while "nextPageToken" in resp:
+            resp = self._apicall(self.drive_service.changes().list(
+                pageToken=resp["nextPageToken"],
+                fields="nextPageToken,newStartPageToken," +
+                "changes(fileId,removed,file(parents,mimeType,trashed))",
+                pageSize=1000,
+                spaces="drive",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+            ))
+            changes += resp["changes"]
+        return (changes, resp["newStartPageToken"])
+
+    def get_parents(
+        self,
+        file_id: str
+    ) -> list:
+        return self._apicall(self.drive_service.files().get(
+            fileId=file_id,
+            fields="parents",
+            supportsAllDrives=True,
+        )).get("parents", [])
+
+    def get_modified_times(
+        self,
+        folder_ids: list
+    ) -> dict:
+        """Returns when each folder's contents last changed, as RFC 3339.
+
+        Drive updates the time of a folder when files are added to or
+        removed from it, changes deeper down the tree don't count.
+        """
+        modified_times = {}
+        for folder_id in folder_ids:
+            try:
+                modified_times.update({
+                    folder_id: self._apicall(self.drive_service.files().get(
+                        fileId=folder_id,
+                        fields="modifiedTime",
+                        supportsAllDrives=True,
+                    )).get("modifiedTime", "")
+                })
+            except Exception as error:
+                print(
+                    "WARNING: Unable to get the modified time of " +
+                    f"{folder_id}: {error}"
+                )
+        return modified_times
+
+    @staticmethod
+    def _error_reason(
+        error: HttpError
+    ):
+        try:
+            error_details = json_deserialize(
+                error.content.decode("utf-8"),
+            )["error"]
+            return error_details["errors"][0]["reason"]
+        except (JSONDecodeError, KeyError, IndexError, TypeError):
+            return None
+
+    def _verify_batch(
+        self,
+        file_ids: list
+    ):
+        """Looks up the file IDs with one batch request.
+
+        Returns the status of every file that got a definite answer and the
+        file IDs to try again.
+        """
+        statuses = {}
+        retry_file_ids = []
+        quota_file_ids = []
+        credential = self.credential_pool.acquire()
+
+        def batch_callback(file_id, response, exception):
+            if exception is None:
+                statuses.update({
+                    file_id: "trashed" if response.get("trashed") else "ok"
+                })
+            elif isinstance(exception, HttpError) and \
+                    exception.resp.status == 404:
+                statuses.update({file_id: "missing"})
+            elif isinstance(exception, HttpError) and \
+                    exception.resp.status == 403 and \
+                    GDrive._error_reason(exception) not in \
+                    GDrive.QUOTA_ERROR_REASONS + \
+                    GDrive.RETRYABLE_ERROR_REASONS:
+                statuses.update({file_id: "inaccessible"})
+            else:
+                if isinstance(exception, HttpError) and (
+                    exception.resp.status == 429 or
+                    GDrive._error_reason(exception) in
+                    GDrive.QUOTA_ERROR_REASONS
+                ):
+                    quota_file_ids.append(file_id)
+                retry_file_ids.append(file_id)
+
+        batch = self.drive_service.new_batch_http_request(
+            callback=batch_callback,
+        )
+        for file_id in file_ids:
+            batch.add(
+                self.drive_service.files().get(
+                    fileId=file_id,
+                    fields=GDrive.VERIFY_FIELDS,
+                    supportsAllDrives=True,
+                ),
+                request_id=file_id,
+            )
+
+        try:
+            batch.execute(http=credential.http)
+        except (HttpError, TransportError, SocketTimeoutError):
+            return (statuses, list(file_ids))
+        finally:
+            with self.stats_lock:
+                self.stats["requests"] += 1
+
+        if quota_file_ids:
+            self.credential_pool.report_quota_exceeded(credential)
+        else:
+            self.credential_pool.report_success(credential)
+
+        return (statuses, retry_file_ids)
+
+    def verify_files(
+        self,
+        file_ids: list,
+        progress_bar: tqdm,
+        workers: int = 4
+    ) -> dict:
+        """Checks which file IDs still point at a readable, untrashed file.
+
+        Returns a dict mapping each file ID to "ok", "trashed", "missing",
+        "inaccessible" or, if Drive kept failing, "unknown".
+        """
+        statuses = {}
+        pending_file_ids = list(dict.fromkeys(file_ids))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for verify_round in range(GDrive.MAXIMUM_VERIFY_ROUNDS):
+                if not pending_file_ids:
+                    break
+                if verify_round:
+                    sleep(2 ** verify_round)
+
+                retry_file_ids = []
+                for (batch_statuses, batch_retry_file_ids) in executor.map(
+                    self._verify_batch,
+                    [
+                        pending_file_ids[i:i + GDrive.VERIFY_BATCH_SIZE]
+                        for i in range(
+                            0,
+                            len(pending_file_ids),
+                            GDrive.VERIFY_BATCH_SIZE,
+                        )
+                    ],
+                ):
+                    statuses.update(batch_statuses)
+                    retry_file_ids += batch_retry_file_ids
+                    progress_bar.update(len(batch_statuses))
+                pending_file_ids = retry_file_ids
+
+        for file_id in pending_file_ids:
+            statuses.update({file_id: "unknown"})
+        progress_bar.update(len(pending_file_ids))
+
+        return statuses
 
     def share_file(
         self,
@@ -296,8 +1291,12 @@ class GDrive:
     ):
         existing_file_id = None
 
-        root_files = self._lsf(dest_folder_id) if dest_folder_id else \
-            self._lsf_my_drive()
+        root_files = self._lsf(
+            dest_folder_id,
+            fields=GDrive.LOOKUP_FIELDS,
+        ) if dest_folder_id else self._lsf_my_drive(
+            fields=GDrive.LOOKUP_FIELDS,
+        )
 
         for _file in root_files:
             if _file["name"] == Path(file_path).name:
@@ -352,21 +1351,124 @@ class GDrive:
             )
 
 
+class HostThrottle:
+    """Limits concurrent requests and request spacing per host."""
+
+    def __init__(
+        self,
+        max_concurrent=4,
+        min_interval=0.0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self.hosts = {}
+        self.hosts_lock = Lock()
+
+    def acquire(
+        self,
+        url
+    ):
+        host = urlparse(url).netloc
+        with self.hosts_lock:
+            if host not in self.hosts:
+                self.hosts.update({host: {
+                    "semaphore": BoundedSemaphore(self.max_concurrent),
+                    "lock": Lock(),
+                    "next_request": 0.0,
+                }})
+            host_slot = self.hosts[host]
+
+        host_slot["semaphore"].acquire()
+        with host_slot["lock"]:
+            wait_time = host_slot["next_request"] - monotonic()
+            if wait_time > 0:
+                sleep(wait_time)
+            host_slot["next_request"] = monotonic() + self.min_interval
+        return host_slot
+
+    def release(
+        self,
+        host_slot
+    ):
+        host_slot["semaphore"].release()
+
+    def releasing(
+        self,
+        host_slot,
+        close
+    ):
+        """Wraps a streamed response's close to give the host slot back"""
+        release_once = Lock()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if release_once.acquire(blocking=False):
+                    self.release(host_slot)
+
+        return close_and_release
+
+
 class UGdrive:
+    INIT_DATA_MARKER = b"__initData = "
+    FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
     def __init__(
         self,
-        session_headers={}
+        session_headers={},
+        folder_key_ttl=1800,
+        workers=8,
+        host_concurrency=4,
+        host_interval=0.0,
+        pool_size=None,
+        retries=5,
+        backoff_factor=0.5,
+        timeout=(10, 60),
+        verify=True,
     ):
+        if pool_size is None:
+            pool_size = max(workers, host_concurrency, 10)
+
+        http_adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(429, 500, 502, 503, 504),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+
         self.session = Session()
+        self.session.mount("https://", http_adapter)
+        self.session.mount("http://", http_adapter)
         self.session.headers.clear()
         self.session.cookies.clear()
         self.session.headers.update({
             "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
             "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 11_4_1 like " +
             "Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) " +
             "Version/11.0 Mobile/15E148 Safari/604.1"
         })
         self.session.headers.update(session_headers)
+        self.folder_key_ttl = folder_key_ttl
+        self.folder_keys = {}
+        self.shared_folder_key = None
+        self.workers = workers
+        self.throttle = HostThrottle(host_concurrency, host_interval)
+        self.timeout = timeout
+        self.verify = verify
+        self.stats = {
+            "requests": 0,
+            "bytes_received": 0,
+            "bytes_decoded": 0,
+        }
+        self.stats_lock = Lock()
 
     def make_request(
         self,
@@ -377,32 +1479,67 @@ class UGdrive:
         req_headers = {}
         if options.get("referer", False):
             req_headers.update({"Referer": options.get("referer")})
-        return self.session.request(
-            method,
-            url,
-            headers=req_headers,
-            verify=False,
-            stream=True,
-        )
+        stream = options.get("stream", False)
+        host_slot = self.throttle.acquire(url)
+        try:
+            response = self.session.request(
+                method,
+                url,
+                headers=req_headers,
+                verify=self.verify,
+                stream=stream,
+                timeout=self.timeout,
+            )
+        except BaseException:
+            self.throttle.release(host_slot)
+            raise
 
-    def get_files_in_folder_id(
+        if stream:
+            # The body is still being transferred, keep the host slot
+            # until the caller closes the response
+            response.close = self.throttle.releasing(
+                host_slot,
+                response.close,
+            )
+            return response
+
+        self.throttle.release(host_slot)
+        self._record_transfer(response, len(response.content))
+        return response
+
+    def _record_transfer(
         self,
-        folder_id
+        response,
+        bytes_decoded
     ):
-        pbar = tqdm(desc="Files scanned", unit="file", unit_scale=True)
+        retries = getattr(response.raw, "retries", None)
+        request_count = 1 + (len(retries.history) if retries else 0)
+        with self.stats_lock:
+            self.stats["requests"] += request_count
+            self.stats["bytes_received"] += response.raw.tell()
+            self.stats["bytes_decoded"] += bytes_decoded
+
+    def _ls_folder(
+        self,
+        folder_id,
+        progress_bar=None
+    ):
+        """Lists a folder, returning its files and its subfolder IDs."""
         files = {}
+        subfolder_ids = []
         page_token = None
+        folder_key = self.get_folder_key(folder_id)
+        key_refreshed = False
 
-        # LIMITS TO 100 PAGES MAXIMUM, SHOULD CHANGE THIS LATER
-        for _ in range(100):
+        while True:
             url = "https://clients6.google.com/drive/v2beta/files?" + \
                 "openDrive=false&reason=102&syncType=0&errorRecovery=false" + \
                 f"&q=trashed%20%3D%20false%20and%20%27{folder_id}%27%20in" + \
                 "%20parents&fields=kind%2CnextPageToken%2Citems(kind" + \
-                "%2CfileSize%2Ctitle%2Cid)%2CincompleteSearch&" + \
+                "%2CfileSize%2Ctitle%2Cid%2CmimeType)%2CincompleteSearch&" + \
                 "appDataFilter=NO_APP_DATA&spaces=drive&maxResults=500&" + \
                 "orderBy=folder%2Ctitle_natural%20asc&" + \
-                f"key={self.get_folder_key(folder_id)}"
+                f"key={folder_key}"
 
             if page_token is not None:
                 url = f"{url}&pageToken={page_token}"
@@ -412,11 +1549,36 @@ class UGdrive:
                 url,
                 referer=f"https://drive.google.com/open?id={folder_id}"
             )
-            ls_json = json_deserialize(ls_response.text)
-            pbar.update(len(ls_json["items"]))
+
+            if ls_response.status_code in (400, 401, 403) and \
+                    not key_refreshed:
+                # Cached key was rejected, scrape a fresh one and retry page
+                folder_key = self.get_folder_key(folder_id, refresh=True)
+                key_refreshed = True
+                continue
+
+            if ls_response.status_code in (400, 401, 403):
+                raise RuntimeError(
+                    "Drive rejected the folder key for folder ID " +
+                    f"\"{folder_id}\" with HTTP {ls_response.status_code}."
+                )
+
+            ls_response.raise_for_status()
+            ls_json = deserialize_json(ls_response.content)
+            key_refreshed = False
+
+            if "items" not in ls_json:
+                raise RuntimeError(
+                    f"Unexpected listing for folder ID \"{folder_id}\": " +
+                    str(ls_json.get("error", {}).get("message", ls_json))
+                )
 
             for drive_file in ls_json["items"]:
-                if drive_file["kind"] != "drive#file" and "fileSize" not in \
+                if drive_file.get("mimeType") == UGdrive.FOLDER_MIME_TYPE:
+                    subfolder_ids.append(drive_file["id"])
+                    continue
+
+                if drive_file["kind"] != "drive#file" or "fileSize" not in \
                         drive_file:
                     continue
 
@@ -427,24 +1589,141 @@ class UGdrive:
                     }
                 })
 
+                if progress_bar is not None:
+                    progress_bar.update(1)
+
             if "nextPageToken" not in ls_json:
                 break
 
             page_token = ls_json["nextPageToken"]
 
+        return (files, subfolder_ids)
+
+    def get_files_in_folder_id(
+        self,
+        folder_id
+    ):
+        pbar = tqdm(desc="Files scanned", unit="file", unit_scale=True)
+        files, _ = self._ls_folder(folder_id, pbar)
         pbar.close()
         return files
 
+    def get_all_files_in_folders(
+        self,
+        folder_ids,
+        recursion=True,
+        progress_bar=None
+    ):
+        """Crawls folders concurrently, following subfolders if recursive.
+
+        Folders are listed by a pool of `workers` threads, with requests to
+        each host limited by the instance `HostThrottle`.
+        """
+        files = {}
+        seen_folder_ids = set(folder_ids)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {
+                executor.submit(self._ls_folder, folder_id, progress_bar)
+                for folder_id in seen_folder_ids
+            }
+
+            while pending:
+                done, pending = wait_futures(
+                    pending,
+                    return_when=FIRST_COMPLETED,
+                )
+
+                for future in done:
+                    try:
+                        folder_files, subfolder_ids = future.result()
+                    except Exception:
+                        for pending_future in pending:
+                            pending_future.cancel()
+                        raise
+
+                    files.update(folder_files)
+
+                    if not recursion:
+                        continue
+
+                    for subfolder_id in subfolder_ids:
+                        if subfolder_id in seen_folder_ids:
+                            continue
+                        seen_folder_ids.add(subfolder_id)
+                        pending.add(executor.submit(
+                            self._ls_folder,
+                            subfolder_id,
+                            progress_bar,
+                        ))
+
+        return files
+
     def get_folder_key(
+        self,
+        folder_id,
+        refresh=False
+    ):
+        """Returns the API key used by the Drive web client for a folder.
+
+        Keys are cached per folder for `folder_key_ttl` seconds. The most
+        recently scraped key is also reused for folders that have no key of
+        their own yet, and is only replaced once the API rejects it.
+        """
+        now = monotonic()
+
+        if not refresh:
+            cached_key = self.folder_keys.get(folder_id)
+            if cached_key is None:
+                cached_key = self.shared_folder_key
+            if cached_key is not None and \
+                    now - cached_key[1] < self.folder_key_ttl:
+                return cached_key[0]
+
+        folder_key = (self._scrape_folder_key(folder_id), now)
+        self.folder_keys.update({folder_id: folder_key})
+        self.shared_folder_key = folder_key
+        return folder_key[0]
+
+    def _scrape_folder_key(
         self,
         folder_id
     ):
         response = self.make_request(
             "GET",
-            f"https://drive.google.com/open?id={folder_id}"
+            f"https://drive.google.com/open?id={folder_id}",
+            stream=True,
         )
 
-        start = response.text.index("__initData = ") + len("__initData = ")
-        end = response.text.index(";", start)
-        json_data = json_deserialize(response.text[start:end])
+        # Only read as much of the page as needed to extract __initData
+        page_buffer = b""
+        start = -1
+        end = -1
+        try:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=0x4000):
+                search_from = len(page_buffer)
+                page_buffer += chunk
+                if start == -1:
+                    start = page_buffer.find(
+                        UGdrive.INIT_DATA_MARKER,
+                        max(search_from - len(UGdrive.INIT_DATA_MARKER), 0),
+                    )
+                    if start == -1:
+                        continue
+                    start += len(UGdrive.INIT_DATA_MARKER)
+                    search_from = start
+                end = page_buffer.find(b";", search_from)
+                if end != -1:
+                    break
+        finally:
+            response.close()
+            self._record_transfer(response, len(page_buffer))
+
+        if start == -1 or end == -1:
+            raise RuntimeError(
+                f"Unable to find folder key for folder ID \"{folder_id}\"."
+            )
+
+        json_data = json_deserialize(page_buffer[start:end])
         return json_data[0][9][32][35]  # :nospies:
@@ -0,0 +1,250 @@
+from abc import ABC
+from abc import abstractmethod
+from pathlib import Path
+from queue import Full
+from queue import Queue
+from threading import Event
+from threading import Thread
+from zlib import compressobj as zlib_compressobj
+from TinGen.utils import CompressionFlag
+from TinGen.utils import build_tinfoil_index
+from TinGen.utils import compress_index_buffer
+from TinGen.utils import load_rsa_public_key
+from TinGen.utils import pack_tinfoil_index
+from TinGen.utils import read_vm_buffer
+from TinGen.utils import serialize_json
+from TinGen.utils import write_index_buffer
+
+
+class PipelineStage(ABC):
+    """Runs `process` on a worker thread for every submitted item.
+
+    The queue is bounded, so a producer that outruns the stage blocks until
+    it catches up. Once `process` raises, the stage drops the remaining
+    items and the error is raised in the producer on its next `submit` or
+    on `close`.
+    """
+
+    STOP = object()
+
+    def __init__(
+        self,
+        name: str,
+        max_queued: int = 1024,
+    ):
+        self.name = name
+        self.queue = Queue(maxsize=max_queued)
+        self.error = None
+        self.aborted = Event()
+        self.thread = Thread(target=self.run, name=name, daemon=True)
+
+    def start(
+        self
+    ):
+        self.thread.start()
+        return self
+
+    def run(
+        self
+    ):
+        while True:
+            item = self.queue.get()
+            if item is PipelineStage.STOP:
+                return
+            if self.error is not None or self.aborted.is_set():
+                continue
+            try:
+                self.process(item)
+            except Exception as error:
+                self.error = error
+
+    @abstractmethod
+    def process(
+        self,
+        item
+    ):
+        """Handles one submitted item on the worker thread"""
+
+    def check(
+        self
+    ):
+        if self.error is not None:
+            raise RuntimeError(
+                f"{self.name} failed: {self.error}"
+            ) from self.error
+
+    def submit(
+        self,
+        item
+    ):
+        while True:
+            self.check()
+            try:
+                self.queue.put(item, timeout=1.0)
+                return
+            except Full:
+                continue
+
+    def close(
+        self
+    ):
+        """Waits for the queued items to be processed"""
+        self.queue.put(PipelineStage.STOP)
+        self.thread.join()
+        self.check()
+
+    def abort(
+        self
+    ):
+        """Drops the queued items and stops the worker"""
+        self.aborted.set()
+        self.queue.put(PipelineStage.STOP)
+        self.thread.join()
+
+
+class SerializeStage(PipelineStage):
+    """Serializes index entries as they arrive.
+
+    The entries are written as the start of the index JSON and everything
+    else is appended in `finish`, once the success message is known. zlib
+    compresses incrementally. zstd data is compressed in one frame on
+    `finish` so the frame header keeps carrying the content size.
+    """
+
+    def __init__(
+        self,
+        compression_flag: int,
+        vm_buffer: bytes = b"",
+        max_queued: int = 1024,
+    ):
+        super().__init__("Index serialization", max_queued=max_queued)
+        self.compression_flag = compression_flag
+        self.zlib_ctx = None
+        if compression_flag == CompressionFlag.ZLIB_COMPRESSION:
+            self.zlib_ctx = zlib_compressobj(9)
+        self.chunks = []
+        self.entry_count = 0
+        self.write(vm_buffer + b"{\"files\":[")
+
+    def write(
+        self,
+        data: bytes
+    ):
+        if self.zlib_ctx is not None:
+            data = self.zlib_ctx.compress(data)
+        self.chunks.append(data)
+
+    def process(
+        self,
+        file_entry: dict
+    ):
+        if self.entry_count:
+            self.write(b"," + serialize_json(file_entry))
+        else:
+            self.write(serialize_json(file_entry))
+        self.entry_count += 1
+
+    def finish(
+        self,
+        index_tail: dict
+    ) -> bytes:
+        """Closes the JSON with the remaining index keys and compresses it"""
+        self.close()
+        tail_buffer = serialize_json(index_tail)
+        if tail_buffer == b"{}":
+            self.write(b"]}")
+        else:
+            self.write(b"]," + tail_buffer[1:])
+
+        if self.zlib_ctx is not None:
+            self.chunks.append(self.zlib_ctx.flush())
+            return b"".join(self.chunks)
+
+        return compress_index_buffer(
+            b"".join(self.chunks),
+            self.compression_flag,
+        )
+
+
+class IndexPipeline:
+    """Serializes index entries while the crawl is running.
+
+    Register `file_added` as a file listener of the generator. Nothing is
+    written unless `finish` succeeds, a failed stage stops the crawl on the
+    next added file and `abort` discards the partial results. Once a listed
+    entry is updated, the streamed entries are stale and `finish` serializes
+    the final index instead.
+    """
+
+    def __init__(
+        self,
+        out_path: Path,
+        compression_flag: int,
+        rsa_pub_key_path: Path = None,
+        vm_path: Path = None,
+        max_queued: int = 1024,
+    ):
+        self.out_path = out_path
+        self.compression_flag = compression_flag
+        self.rsa_pub_key_path = rsa_pub_key_path
+        self.vm_path = vm_path
+        self.entries_updated = False
+        self.serialize_stage = SerializeStage(
+            compression_flag,
+            vm_buffer=read_vm_buffer(vm_path),
+            max_queued=max_queued,
+        ).start()
+
+    def file_added(
+        self,
+        file_entry: dict,
+        file_id: str,
+        shared: bool,
+        updated: bool = False
+    ):
+        if updated:
+            self.entries_updated = True
+            self.abort()
+        elif not self.entries_updated:
+            self.serialize_stage.submit(file_entry)
+
+    def finish(
+        self,
+        index: dict
+    ):
+        """Waits for the serialization and writes the index file"""
+        if self.entries_updated:
+            write_index_buffer(
+                build_tinfoil_index(
+                    index,
+                    self.compression_flag,
+                    rsa_pub_key_path=self.rsa_pub_key_path,
+                    vm_path=self.vm_path,
+                ),
+                self.out_path,
+            )
+            return
+
+        try:
+            compressed_buffer = self.serialize_stage.finish({
+                key: value for (key, value) in index.items()
+                if key != "files"
+            })
+        except Exception:
+            self.abort()
+            raise
+
+        write_index_buffer(
+            pack_tinfoil_index(
+                compressed_buffer,
+                self.compression_flag,
+                rsa_pub_key=load_rsa_public_key(self.rsa_pub_key_path),
+            ),
+            self.out_path,
+        )
+
+    def abort(
+        self
+    ):
+        if self.serialize_stage.thread.is_alive():
+            self.serialize_stage.abort()
@@ -0,0 +1,122 @@
+from fnmatch import fnmatchcase
+from typing import List
+from typing import Optional
+
+
+class CrawlRules:
+    """Decides which folders a crawl lists before any call is made.
+
+    Patterns are shell style globs matched against the folder name, or
+    against the folder path relative to the scanned root (e.g.
+    "Games/*/Updates") if they contain a "/". Excludes always win. With
+    includes given, a folder is only listed if it matches one, lies below
+    one that did, or could still lead to a match of a path pattern.
+    """
+
+    def __init__(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        max_depth: Optional[int] = None,
+        max_files_per_folder: Optional[int] = None,
+    ):
+        self.include = include or []
+        self.exclude = exclude or []
+        self.max_depth = max_depth
+        self.max_files_per_folder = max_files_per_folder
+        self.pruned_folders = 0
+        self.capped_folders = 0
+        self.saved_calls = 0.0
+
+    @property
+    def active(
+        self
+    ) -> bool:
+        return bool(self.include or self.exclude) or \
+            self.max_depth is not None or \
+            self.max_files_per_folder is not None
+
+    @staticmethod
+    def _matches(
+        pattern: str,
+        name: str,
+        path: str
+    ) -> bool:
+        if "/" in pattern:
+            return fnmatchcase(path, pattern.strip("/"))
+        return fnmatchcase(name, pattern)
+
+    @staticmethod
+    def _may_lead_to(
+        pattern: str,
+        path: str
+    ) -> bool:
+        """Checks whether folders below the path could match the pattern"""
+        pattern_parts = pattern.strip("/").split("/")
+        path_parts = path.split("/")
+        if "/" not in pattern or "**" in pattern_parts:
+            return True
+        if len(path_parts) >= len(pattern_parts):
+            return False
+        return all(
+            fnmatchcase(path_part, pattern_part)
+            for (path_part, pattern_part) in zip(path_parts, pattern_parts)
+        )
+
+    def root_included(
+        self
+    ) -> bool:
+        """Files directly in a scanned root are kept unless includes exist"""
+        return not self.include
+
+    def lists_subfolders(
+        self,
+        depth: int
+    ) -> bool:
+        """Checks whether subfolders of a folder at the depth may be walked"""
+        return self.max_depth is None or depth < self.max_depth
+
+    def folder_state(
+        self,
+        name: str,
+        path: str,
+        depth: int,
+        parent_included: bool
+    ):
+        """Returns whether to list a subfolder and whether it is included.
+
+        Files of folders that are listed but not included are skipped, the
+        folder is only walked to reach included folders further down.
+        Subfolders below the maximum depth are never asked about, see
+        `lists_subfolders`.
+        """
+        if any(
+            CrawlRules._matches(pattern, name, path)
+            for pattern in self.exclude
+        ):
+            self.pruned_folders += 1
+            return (False, False)
+
+        if parent_included or any(
+            CrawlRules._matches(pattern, name, path)
+            for pattern in self.include
+        ):
+            return (True, True)
+
+        if any(
+            CrawlRules._may_lead_to(pattern, path)
+            for pattern in self.include
+        ):
+            return (True, False)
+
+        self.pruned_folders += 1
+        return (False, False)
+
+    def summary(
+        self
+    ) -> str:
+        msg = "Crawl Pruning\n"
+        msg += f"├─ Folders skipped by patterns: {self.pruned_folders:,}\n"
+        msg += f"├─ Folders capped: {self.capped_folders:,}\n"
+        msg += f"└─ List calls saved: {round(self.saved_calls):,}\n"
+        return msg
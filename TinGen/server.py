@@ -0,0 +1,287 @@
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from TinGen.utils import CompressionFlag
+from TinGen.utils import compress_index_buffer
+from TinGen.utils import load_rsa_public_key
+from TinGen.utils import pack_tinfoil_index
+from TinGen.utils import read_vm_buffer
+from TinGen.utils import serialize_json
+
+
+class IndexVariant:
+    def __init__(
+        self,
+        data: bytes,
+        content_type: str,
+    ):
+        self.data = data
+        self.content_type = content_type
+        self.etag = f"\"{sha256(data).hexdigest()[:32]}\""
+
+
+class IndexRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "TinGen"
+
+    def log_request(
+        self,
+        code="-",
+        size="-"
+    ):
+        pass
+
+    def log_error(
+        self,
+        format,
+        *args
+    ):
+        print(f"WARNING: Index server: {format % args}")
+
+    def do_HEAD(
+        self
+    ):
+        self.send_variant(include_body=False)
+
+    def do_GET(
+        self
+    ):
+        self.send_variant(include_body=True)
+
+    def send_variant(
+        self,
+        include_body: bool
+    ):
+        variant = self.server.index_server.get_variant(
+            self.path.split("?", 1)[0].lstrip("/"),
+        )
+
+        if variant is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.etag_matches(self.headers.get("If-None-Match"), variant):
+            self.send_response(304)
+            self.send_common_headers(variant)
+            self.end_headers()
+            return
+
+        data_size = len(variant.data)
+        byte_range = None
+        if_range = self.headers.get("If-Range")
+        if if_range is None or if_range.strip() == variant.etag:
+            byte_range = self.parse_range(
+                self.headers.get("Range"),
+                data_size,
+            )
+
+        if byte_range == ():
+            self.send_response(416)
+            self.send_common_headers(variant)
+            self.send_header("Content-Range", f"bytes */{data_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if byte_range is None:
+            start, end = (0, data_size - 1)
+            self.send_response(200)
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {start}-{end}/{data_size}",
+            )
+
+        self.send_common_headers(variant)
+        self.send_header("Content-Type", variant.content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        if include_body and data_size:
+            self.wfile.write(memoryview(variant.data)[start:end + 1])
+
+    def send_common_headers(
+        self,
+        variant: IndexVariant
+    ):
+        self.send_header("ETag", variant.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Cache-Control", "no-cache")
+
+    @staticmethod
+    def etag_matches(
+        if_none_match,
+        variant: IndexVariant
+    ) -> bool:
+        if if_none_match is None:
+            return False
+        etags = [etag.strip() for etag in if_none_match.split(",")]
+        return "*" in etags or variant.etag in etags or \
+            f"W/{variant.etag}" in etags
+
+    @staticmethod
+    def parse_range(
+        range_header,
+        data_size: int
+    ):
+        """Parses a single byte range.
+
+        Returns None to serve the whole body, an empty tuple when the range
+        can't be satisfied, or the inclusive (start, end) offsets. Invalid
+        ranges are ignored like RFC 9110 asks, so the whole body is served.
+        """
+        if range_header is None or not range_header.startswith("bytes="):
+            return None
+
+        byte_ranges = range_header[len("bytes="):].split(",")
+        if len(byte_ranges) != 1:
+            return None
+
+        start, separator, end = byte_ranges[0].strip().partition("-")
+        if separator != "-" or not (start or end) or \
+                not all(part.isdigit() for part in (start, end) if part):
+            return None
+
+        if start == "":
+            suffix_length = int(end)
+            if suffix_length == 0:
+                return ()
+            return (max(data_size - suffix_length, 0), data_size - 1)
+
+        start = int(start)
+        if end != "" and int(end) < start:
+            return None
+        if start >= data_size:
+            return ()
+
+        end = int(end) if end != "" else data_size - 1
+        return (start, min(end, data_size - 1))
+
+
+class IndexServer:
+    """Serves prebuilt variants of the latest generated index over HTTP.
+
+    Every variant is compressed and encrypted once in `update`, requests
+    only ever slice the stored bytes. Served zstd variants use the faster
+    `zstd_level`, and payloads of an unchanged index are reused.
+    """
+
+    VARIANT_NAMES = {
+        CompressionFlag.ZSTD_COMPRESSION: "index.zstd.tfl",
+        CompressionFlag.ZLIB_COMPRESSION: "index.zlib.tfl",
+        CompressionFlag.NO_COMPRESSION: "index.plain.tfl",
+    }
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        zstd_level: int = 10,
+    ):
+        self.variants = {}
+        self.zstd_level = zstd_level
+        self.payloads = {}
+        self.httpd = ThreadingHTTPServer((host, port), IndexRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.index_server = self
+
+    def get_variant(
+        self,
+        name: str
+    ):
+        if name == "":
+            name = "index.tfl"
+        return self.variants.get(name)
+
+    def compressed_payload(
+        self,
+        buffer: bytes,
+        compression_flag: int,
+        payloads: dict
+    ) -> bytes:
+        """Compresses the buffer, reusing the payload of the last update"""
+        payload_key = (sha256(buffer).digest(), compression_flag)
+        payload = self.payloads.get(payload_key)
+        if payload is None:
+            payload = compress_index_buffer(
+                buffer,
+                compression_flag,
+                zstd_level=self.zstd_level,
+            )
+        payloads.update({payload_key: payload})
+        return payload
+
+    def update(
+        self,
+        index: dict,
+        compression_flag: int,
+        rsa_pub_key_path: Path = None,
+        vm_path: Path = None,
+    ):
+        """Rebuilds every variant and swaps them in atomically.
+
+        `index.tfl` is built with the given compression and encryption
+        settings, the other variants always exist unencrypted.
+        """
+        octet_stream = "application/octet-stream"
+        json_buffer = serialize_json(index)
+        payloads = {}
+        variants = {
+            "index.json": IndexVariant(json_buffer, "application/json"),
+        }
+
+        for (variant_flag, name) in IndexServer.VARIANT_NAMES.items():
+            variants.update({name: IndexVariant(
+                pack_tinfoil_index(
+                    self.compressed_payload(
+                        json_buffer,
+                        variant_flag,
+                        payloads,
+                    ),
+                    variant_flag,
+                ),
+                octet_stream,
+            )})
+
+        if rsa_pub_key_path is not None and rsa_pub_key_path.is_file():
+            variants.update({"index.enc.tfl": IndexVariant(
+                pack_tinfoil_index(
+                    self.compressed_payload(
+                        read_vm_buffer(vm_path) + json_buffer,
+                        compression_flag,
+                        payloads,
+                    ),
+                    compression_flag,
+                    rsa_pub_key=load_rsa_public_key(rsa_pub_key_path),
+                ),
+                octet_stream,
+            )})
+            variants.update({"index.tfl": variants["index.enc.tfl"]})
+        else:
+            variants.update({
+                "index.tfl": variants[
+                    IndexServer.VARIANT_NAMES[compression_flag]
+                ],
+            })
+
+        self.payloads = payloads
+        self.variants = variants
+
+    def start(
+        self
+    ) -> Thread:
+        """Serves requests from a background thread."""
+        server_thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        server_thread.start()
+        return server_thread
+
+    def serve_forever(
+        self
+    ):
+        self.httpd.serve_forever()
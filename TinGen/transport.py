@@ -0,0 +1,76 @@
+from google.auth.exceptions import TransportError
+from google.auth.transport.requests import AuthorizedSession
+from httplib2 import Response as HttpResponse
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+
+class SessionHttp:
+    """httplib2 compatible HTTP object backed by a pooled requests session.
+
+    A single instance can be shared between threads. Connections are kept
+    alive and reused, with up to `pool_size` connections per host.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        pool_size: int = 10,
+        timeout: tuple = (10.0, 60.0),
+    ):
+        self.credentials = credentials
+        self.timeout = timeout
+        self.session = AuthorizedSession(credentials)
+        self.session.headers.update({"connection": "keep-alive"})
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=5,
+        connection_type=None
+    ):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        try:
+            response = self.session.request(
+                method,
+                uri,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                allow_redirects=redirections > 0,
+            )
+            content = response.content
+        except RequestException as error:
+            raise TransportError(error) from error
+
+        response_info = {
+            key.lower(): value for (key, value) in response.headers.items()
+        }
+        # Like httplib2, mark bodies that were already decoded
+        if "content-encoding" in response_info:
+            response_info.update({
+                "-content-encoding": response_info.pop("content-encoding"),
+            })
+        response_info.update({
+            "status": str(response.status_code),
+            "reason": response.reason,
+            "-wire-length": str(response.raw.tell()),
+        })
+
+        return (HttpResponse(response_info), content)
+
+    def close(
+        self
+    ):
+        self.session.close()
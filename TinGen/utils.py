@@ -4,6 +4,7 @@ from Crypto.Cipher.AES import new as new_aes_ctx
 from Crypto.Cipher.PKCS1_OAEP import new as new_pkcs1_oaep_ctx
 from Crypto.Hash import SHA256
 from Crypto.PublicKey.RSA import import_key as import_rsa_key
+from concurrent.futures import ProcessPoolExecutor
 from enum import IntEnum
 from json import dumps as json_serialize
 from json import loads as json_deserialize
@@ -35,6 +36,54 @@ if not zstandard_found:
         raise ImportError('Unable to find any compatiable zstandard library!')
 
 
+orjson_found = False
+
+try:
+    from orjson import dumps as orjson_serialize
+    from orjson import loads as orjson_deserialize
+    orjson_found = True
+except ImportError:
+    pass
+
+
+def serialize_json(obj) -> bytes:
+    """Serializes to compact JSON, using orjson when installed.
+
+    Non-ASCII characters are escaped like the json module does by default.
+    For an index only the `files` list goes through orjson, the remaining
+    keys like the success message are small and serialized with json.
+    """
+    if not orjson_found:
+        return json_serialize(obj, separators=(",", ":")).encode()
+
+    if isinstance(obj, dict) and "files" in obj:
+        files_buffer = serialize_json(obj["files"])
+        tail_buffer = json_serialize(
+            {
+                key: value for (key, value) in obj.items()
+                if key != "files"
+            },
+            separators=(",", ":"),
+        ).encode()
+        if tail_buffer == b"{}":
+            return b"{\"files\":" + files_buffer + b"}"
+        return b"{\"files\":" + files_buffer + b"," + tail_buffer[1:]
+
+    json_buffer = orjson_serialize(obj)
+    if json_buffer.isascii():
+        return json_buffer
+
+    return json_serialize(obj, separators=(",", ":")).encode()
+
+
+def deserialize_json(buffer):
+    """Parses JSON from bytes or str, using orjson when installed."""
+    if orjson_found:
+        return orjson_deserialize(buffer)
+
+    return json_deserialize(buffer)
+
+
 class CompressionFlag(IntEnum):
     ZLIB_COMPRESSION = 0x0E
     ZSTD_COMPRESSION = 0x0D
@@ -46,60 +95,68 @@ class EncryptionFlag(IntEnum):
     NO_ENCRYPT = 0x00
 
 
-def create_tinfoil_index(
-    index_to_write: dict,
-    out_path: Path,
-    compression_flag: int,
-    rsa_pub_key_path: Path = None,
-    vm_path: Path = None
-):
-    to_compress_buffer = b""
-
-    if vm_path is not None and vm_path.is_file():
-        to_compress_buffer += b"\x13\x37\xB0\x0B"
-        vm_buffer = b""
-
-        with open(vm_path, "rb") as vm_stream:
-            vm_buffer += vm_stream.read()
+def read_vm_buffer(vm_path: Path = None) -> bytes:
+    """Returns the VM header and VM to prepend to the index JSON."""
+    if vm_path is None or not vm_path.is_file():
+        return b""
 
-        to_compress_buffer += len(vm_buffer).to_bytes(4, "little")
-        to_compress_buffer += vm_buffer
+    with open(vm_path, "rb") as vm_stream:
+        vm_buffer = vm_stream.read()
 
-    to_compress_buffer += bytes(json_serialize(index_to_write).encode())
+    return b"\x13\x37\xB0\x0B" + len(vm_buffer).to_bytes(4, "little") + \
+        vm_buffer
 
-    to_write_buffer = b""
-    session_key = b""
 
+def compress_index_buffer(
+    to_compress_buffer: bytes,
+    compression_flag: int,
+    zstd_level: int = 22
+) -> bytes:
     if compression_flag == CompressionFlag.ZSTD_COMPRESSION:
         if zstandard_found:
-            to_write_buffer += ZstdCompressor(level=22).compress(
+            return ZstdCompressor(level=zstd_level).compress(
                 to_compress_buffer
             )
         elif zstd_found:
-            to_write_buffer += ZSTD_compress(to_compress_buffer, level=22)
+            return ZSTD_compress(to_compress_buffer, level=zstd_level)
 
     elif compression_flag == CompressionFlag.ZLIB_COMPRESSION:
-        to_write_buffer += zlib_compress(to_compress_buffer, 9)
+        return zlib_compress(to_compress_buffer, 9)
 
     elif compression_flag == CompressionFlag.NO_COMPRESSION:
-        to_write_buffer += to_compress_buffer
+        return to_compress_buffer
+
+    raise NotImplementedError(
+        "Compression method supplied is not implemented yet."
+    )
+
+
+def load_rsa_public_key(rsa_pub_key_path: Path = None):
+    if rsa_pub_key_path is None or not rsa_pub_key_path.is_file():
+        return None
+
+    with open(rsa_pub_key_path) as rsa_pub_key_stream:
+        return import_rsa_key(rsa_pub_key_stream.read())
 
-    else:
-        raise NotImplementedError(
-            "Compression method supplied is not implemented yet."
-        )
 
-    data_size = len(to_write_buffer)
+def pack_tinfoil_index(
+    compressed_buffer: bytes,
+    compression_flag: int,
+    rsa_pub_key=None
+) -> bytes:
+    """Pads, optionally encrypts and adds the header to compressed data."""
+    data_size = len(compressed_buffer)
+    session_key = b""
     flag = None
-    to_write_buffer += (b"\x00" * (0x10 - (data_size % 0x10)))
+    to_write_buffer = compressed_buffer + \
+        (b"\x00" * (0x10 - (data_size % 0x10)))
 
-    if rsa_pub_key_path is not None and rsa_pub_key_path.is_file():
+    if rsa_pub_key is not None:
         def rand_aes_key_generator() -> bytes:
             return randint(0, 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF).to_bytes(
                 0x10, byteorder="big"
             )
 
-        rsa_pub_key = import_rsa_key(open(rsa_pub_key_path).read())
         rand_aes_key = rand_aes_key_generator()
 
         pkcs1_oaep_ctx = new_pkcs1_oaep_ctx(
@@ -116,17 +173,125 @@ def create_tinfoil_index(
         session_key += b"\x00" * 0x100
         flag = compression_flag | EncryptionFlag.NO_ENCRYPT
 
+    return b"".join((
+        b"TINFOIL",
+        flag.to_bytes(1, byteorder="little"),
+        session_key,
+        data_size.to_bytes(8, "little"),
+        to_write_buffer,
+    ))
+
+
+def build_tinfoil_index(
+    index_to_write: dict,
+    compression_flag: int,
+    rsa_pub_key_path: Path = None,
+    vm_path: Path = None
+) -> bytes:
+    to_compress_buffer = read_vm_buffer(vm_path) + \
+        serialize_json(index_to_write)
+
+    return pack_tinfoil_index(
+        compress_index_buffer(to_compress_buffer, compression_flag),
+        compression_flag,
+        rsa_pub_key=load_rsa_public_key(rsa_pub_key_path),
+    )
+
+
+def write_index_buffer(
+    index_buffer: bytes,
+    out_path: Path
+):
     Path(out_path.parent).mkdir(parents=True, exist_ok=True)
 
     with open(out_path, "wb") as out_stream:
-        out_stream.write(b"TINFOIL")
-        out_stream.write(flag.to_bytes(1, byteorder="little"))
-        out_stream.write(session_key)
-        out_stream.write(data_size.to_bytes(8, "little"))
-        out_stream.write(to_write_buffer)
+        out_stream.write(index_buffer)
+
+
+def create_tinfoil_index(
+    index_to_write: dict,
+    out_path: Path,
+    compression_flag: int,
+    rsa_pub_key_path: Path = None,
+    vm_path: Path = None
+):
+    write_index_buffer(
+        build_tinfoil_index(
+            index_to_write,
+            compression_flag,
+            rsa_pub_key_path=rsa_pub_key_path,
+            vm_path=vm_path,
+        ),
+        out_path,
+    )
+
+
+def create_tinfoil_indexes(
+    index_to_write: dict,
+    outputs: list,
+    rsa_pub_key_path: Path = None,
+    vm_path: Path = None,
+    max_workers: int = None
+):
+    """Writes several variants of one index.
+
+    `outputs` holds `(out_path, compression_flag, encrypt)` tuples, with a
+    compression flag of None writing plain JSON. The index is serialized
+    and the RSA key imported once. Every distinct compression job runs once
+    in a process pool, and the variants are encrypted from its results.
+    """
+    json_buffer = serialize_json(index_to_write)
+    vm_buffer = b""
+    rsa_pub_key = None
+
+    if any(encrypt for (_, _, encrypt) in outputs):
+        vm_buffer = read_vm_buffer(vm_path)
+        rsa_pub_key = load_rsa_public_key(rsa_pub_key_path)
+
+    # The VM is only prepended to encrypted variants
+    payloads = {False: json_buffer, True: vm_buffer + json_buffer}
+
+    def job_key(compression_flag, encrypt):
+        return (compression_flag, encrypt and bool(vm_buffer))
+
+    compress_jobs = {
+        job_key(compression_flag, encrypt)
+        for (_, compression_flag, encrypt) in outputs
+        if compression_flag not in (None, CompressionFlag.NO_COMPRESSION)
+    }
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        compressed_futures = {
+            (compression_flag, with_vm): executor.submit(
+                compress_index_buffer,
+                payloads[with_vm],
+                compression_flag,
+            )
+            for (compression_flag, with_vm) in compress_jobs
+        }
+
+        for (out_path, compression_flag, encrypt) in outputs:
+            if compression_flag is None:
+                write_index_buffer(json_buffer, out_path)
+                continue
+
+            output_job_key = job_key(compression_flag, encrypt)
+            compressed_buffer = compressed_futures[output_job_key].result() \
+                if output_job_key in compressed_futures \
+                else payloads[output_job_key[1]]
+
+            write_index_buffer(
+                pack_tinfoil_index(
+                    compressed_buffer,
+                    compression_flag,
+                    rsa_pub_key=rsa_pub_key if encrypt else None,
+                ),
+                out_path,
+            )
 
 
 def read_index(index_path: Path, rsa_priv_key_path: Path = None) -> dict:
+    """Reads a Tinfoil index, or a plain JSON index, back into a dict."""
     if index_path is None or not index_path.is_file():
         raise RuntimeError(
             f"Unable to read non-existant index file \"{index_path}\""
@@ -139,7 +304,14 @@ def read_index(index_path: Path, rsa_priv_key_path: Path = None) -> dict:
     to_read_buffer = None
 
     with open(index_path, "rb") as index_stream:
-        magic = str(index_stream.read(7))
+        magic = index_stream.read(7).decode("latin-1")
+
+        if magic.lstrip().startswith("{"):
+            index_stream.seek(0)
+            try:
+                return deserialize_json(index_stream.read())
+            except JSONDecodeError:
+                raise RuntimeError("Unable to deserialize index data.")
 
         if magic != "TINFOIL":
             raise RuntimeError(
@@ -160,7 +332,7 @@ def read_index(index_path: Path, rsa_priv_key_path: Path = None) -> dict:
 
         compression_flag = flags & 0x0F
 
-        if compression_flag not in CompressionFlag:
+        if compression_flag not in tuple(CompressionFlag):
             raise RuntimeError(
                 "Unimplemented compression method encountered while reading " +
                 "index header."
@@ -197,13 +369,34 @@ def read_index(index_path: Path, rsa_priv_key_path: Path = None) -> dict:
     elif compression_flag == CompressionFlag.NO_COMPRESSION:
         to_read_buffer = to_read_buffer[:data_size]
 
+    # Encrypted indexes may start with the VM
+    if to_read_buffer[:4] == b"\x13\x37\xB0\x0B":
+        vm_size = int.from_bytes(to_read_buffer[4:8], byteorder="little")
+        to_read_buffer = to_read_buffer[8 + vm_size:]
+
     try:
-        return json_deserialize(to_read_buffer)
+        return deserialize_json(to_read_buffer)
 
     except JSONDecodeError:
         raise RuntimeError("Unable to deserialize index data.")
 
 
+def index_entry_file_id(file_entry: dict) -> str:
+    """Returns the Drive file ID of an index entry, or its URL otherwise."""
+    url = file_entry["url"]
+    if url.startswith("gdrive:"):
+        return url[len("gdrive:"):].split("#", 1)[0]
+    return url
+
+
+def file_extension(file_name: str) -> str:
+    """Returns the lowercase extension of a file name, or "" without one."""
+    name_parts = file_name.rsplit(".", 1)
+    if len(name_parts) < 2:
+        return ""
+    return name_parts[1].lower()
+
+
 def format_bytes(size: int, nround: int = 2) -> Tuple[int, Union[float, int]]:
     power = 2**10
     n = 0
@@ -0,0 +1,52 @@
+from json import JSONDecodeError
+from json import dump as json_writer
+from json import load as json_reader
+from pathlib import Path
+from time import time
+
+
+def load_verify_cache(
+    cache_path: Path
+) -> dict:
+    """Loads the file IDs verified earlier and when they were checked"""
+    if cache_path is None or not cache_path.is_file():
+        return {}
+
+    with open(cache_path, "r") as cache_fp:
+        try:
+            return json_reader(cache_fp)
+        except JSONDecodeError:
+            print(f"WARNING: {cache_path} is not a valid JSON file.")
+            return {}
+
+
+def save_verify_cache(
+    cache_path: Path,
+    verify_cache: dict,
+    max_age: float,
+):
+    """Saves the verify cache, leaving out entries older than max_age"""
+    oldest_checked = time() - max_age
+    cache_path.parent.resolve().mkdir(parents=True, exist_ok=True)
+    with open(cache_path, "w") as cache_fp:
+        json_writer(
+            {
+                file_id: checked
+                for (file_id, checked) in verify_cache.items()
+                if checked >= oldest_checked
+            },
+            cache_fp,
+        )
+
+
+def unverified_file_ids(
+    file_ids: list,
+    verify_cache: dict,
+    max_age: float,
+) -> list:
+    """Returns the file IDs that weren't verified in the last max_age"""
+    oldest_checked = time() - max_age
+    return [
+        file_id for file_id in dict.fromkeys(file_ids)
+        if verify_cache.get(file_id, 0) < oldest_checked
+    ]
@@ -0,0 +1,277 @@
+from threading import Event
+from TinGen.diff import index_fingerprint
+from TinGen.rules import CrawlRules
+import signal
+
+
+class IndexWatcher:
+    """Keeps a TinGen instance warm and republishes its index on change.
+
+    `load_config` returns the parsed command line options and is called
+    again on SIGHUP. `publish` receives the generator and the options and
+    is only called when the index content or the options changed.
+    """
+
+    FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+    RESCAN_OPTIONS = (
+        "recursion",
+        "add_non_nsw_files",
+        "extensions",
+        "include_folders",
+        "exclude_folders",
+        "max_depth",
+        "max_files_per_folder",
+    )
+    MAX_ANCESTRY_DEPTH = 64
+
+    def __init__(
+        self,
+        generator,
+        load_config,
+        publish,
+        min_interval: float = 60.0,
+        max_interval: float = 900.0,
+    ):
+        self.generator = generator
+        self.load_config = load_config
+        self.publish = publish
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.config = None
+        self.page_token = None
+        self.folder_roots = {}
+        self.published_fingerprint = None
+        self.wake_event = Event()
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def request_reload(
+        self,
+        *_
+    ):
+        self.reload_requested = True
+        self.wake_event.set()
+
+    def request_stop(
+        self,
+        *_
+    ):
+        self.stop_requested = True
+        self.wake_event.set()
+
+    def run(
+        self
+    ):
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        self.config = self.load_config()
+        self.apply_index_settings()
+        self.page_token = self.generator.gdrive_service.get_start_page_token()
+        self.rescan(self.config.folder_ids)
+        self.publish_if_changed(force=True)
+
+        while not self.stop_requested:
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+            if self.stop_requested:
+                break
+
+            try:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                else:
+                    self.poll()
+            except Exception as error:
+                print(f"WARNING: Watch iteration failed: {error}")
+                self.interval = min(self.interval * 2, self.max_interval)
+
+    def apply_index_settings(
+        self
+    ):
+        self.generator.configure_index(
+            self.config.tinfoil_min_ver,
+            theme_blacklist=self.config.theme_blacklist,
+            theme_whitelist=self.config.theme_whitelist,
+            theme_error=self.config.theme_error,
+        )
+        crawl_rules = CrawlRules(
+            include=self.config.include_folders,
+            exclude=self.config.exclude_folders,
+            max_depth=self.config.max_depth,
+            max_files_per_folder=self.config.max_files_per_folder,
+        )
+        self.generator.crawl_rules = crawl_rules if crawl_rules.active \
+            else None
+
+    def rescan(
+        self,
+        folder_ids: list
+    ):
+        if folder_ids:
+            print(f"Scanning {len(folder_ids)} folder(s)")
+            self.generator.rescan_folders(
+                folder_ids,
+                self.config.recursion,
+                self.config.add_non_nsw_files,
+                extensions=self.config.extensions,
+            )
+
+        self.generator.rebuild_index(
+            self.config.add_nsw_files_without_title_id,
+            self.config.add_non_nsw_files,
+            extensions=self.config.extensions,
+        )
+
+    def publish_if_changed(
+        self,
+        force: bool = False
+    ):
+        fingerprint = index_fingerprint(self.generator.index)
+        if not force and fingerprint == self.published_fingerprint:
+            print("Index unchanged, skipping publish")
+            return
+
+        self.publish(self.generator, self.config)
+        self.published_fingerprint = fingerprint
+
+    def reload(
+        self
+    ):
+        print("Reloading configuration")
+        old_config = self.config
+        try:
+            self.config = self.load_config()
+        except (Exception, SystemExit) as error:
+            print(f"WARNING: Keeping old configuration: {error}")
+            return
+
+        self.folder_roots.clear()
+        self.apply_index_settings()
+
+        new_folder_ids = self.config.folder_ids
+        self.generator.drop_folders([
+            folder_id for folder_id in old_config.folder_ids
+            if folder_id not in new_folder_ids
+        ])
+
+        if any(
+            getattr(self.config, option) != getattr(old_config, option)
+            for option in IndexWatcher.RESCAN_OPTIONS
+        ):
+            self.rescan(new_folder_ids)
+        else:
+            self.rescan([
+                folder_id for folder_id in new_folder_ids
+                if folder_id not in self.generator.folder_files
+            ])
+
+        self.publish_if_changed(force=vars(self.config) != vars(old_config))
+        self.interval = self.min_interval
+
+    def poll(
+        self
+    ):
+        changes, self.page_token = self.generator.gdrive_service.get_changes(
+            self.page_token,
+        )
+        affected_roots = self.affected_roots(changes)
+
+        if not affected_roots:
+            self.interval = min(self.interval * 2, self.max_interval)
+            return
+
+        print(f"Changes detected in {len(affected_roots)} folder(s)")
+        self.rescan(affected_roots)
+        self.publish_if_changed()
+        self.interval = self.min_interval
+
+    def affected_roots(
+        self,
+        changes: list
+    ) -> list:
+        """Maps Drive changes to the scanned root folders they touch"""
+        root_ids = set(self.config.folder_ids)
+        affected = set()
+
+        for change in changes:
+            file_id = change["fileId"]
+            changed_file = change.get("file", {})
+
+            if file_id in root_ids:
+                affected.add(file_id)
+                continue
+
+            # Files that were removed or moved away from a scanned folder
+            for (root_id, files) in self.generator.folder_files.items():
+                if file_id in files:
+                    affected.add(root_id)
+
+            if changed_file.get("mimeType") == IndexWatcher.FOLDER_MIME_TYPE:
+                old_root_id = self.folder_roots.get(file_id)
+                if old_root_id is not None:
+                    affected.add(old_root_id)
+                # The folder may have been moved, taking cached descendants
+                # along with it
+                self.folder_roots.clear()
+
+            for parent_id in changed_file.get("parents", []):
+                root_id = self.find_root(parent_id, root_ids)
+                if root_id is not None:
+                    affected.add(root_id)
+
+        return [
+            folder_id for folder_id in self.config.folder_ids
+            if folder_id in affected
+        ]
+
+    def find_root(
+        self,
+        folder_id: str,
+        root_ids: set
+    ):
+        """Walks up the folder ancestry until a scanned root is found.
+
+        Walked folders are cached along with their root, or None if they lie
+        outside of every root. Any folder change clears the cache, so folders
+        moved into a root are walked again.
+        """
+        walked_folder_ids = []
+        root_id = None
+        current_id = folder_id
+        cacheable = True
+
+        for _ in range(IndexWatcher.MAX_ANCESTRY_DEPTH):
+            if current_id in root_ids:
+                root_id = current_id
+                break
+
+            if current_id in self.folder_roots:
+                root_id = self.folder_roots[current_id]
+                break
+
+            walked_folder_ids.append(current_id)
+
+            try:
+                parent_ids = self.generator.gdrive_service.get_parents(
+                    current_id,
+                )
+            except Exception:
+                # Not known to be outside of every root, walk it again later
+                parent_ids = []
+                cacheable = False
+
+            if not parent_ids:
+                break
+
+            current_id = parent_ids[0]
+
+        if root_id is not None or cacheable:
+            for walked_folder_id in walked_folder_ids:
+                self.folder_roots.update({walked_folder_id: root_id})
+
+        return root_id
@@ -0,0 +1,46 @@
+import pytest
+from TinGen.budget import coverage_summary
+from TinGen.budget import load_root_entries
+from TinGen.budget import order_folders
+from TinGen.budget import save_root_entries
+
+
+@pytest.mark.parametrize("priorities,modified_times,expected", [
+    (None, None, ["a", "b", "c"]),
+    (["c", "x"], None, ["c", "a", "b"]),
+    (None, {"a": "2020", "b": "2022", "c": "2021"}, ["b", "c", "a"]),
+    (["a"], {"b": "2020", "c": "2021"}, ["a", "c", "b"]),
+])
+def test_order_folders(priorities, modified_times, expected):
+    assert order_folders(
+        ["a", "b", "c", "a"],
+        priorities=priorities,
+        modified_times=modified_times,
+    ) == expected
+
+
+def test_root_entries_round_trip(tmp_path):
+    state_path = tmp_path / "state" / "index.tfl.roots.json"
+    root_entries = {"a": [{"url": "gdrive:x#X.nsp", "size": 1}]}
+    save_root_entries(state_path, root_entries)
+
+    assert load_root_entries(state_path) == root_entries
+    assert load_root_entries(tmp_path / "missing.json") == {}
+
+
+def test_invalid_root_entries_are_ignored(tmp_path):
+    state_path = tmp_path / "index.tfl.roots.json"
+    state_path.write_text("{")
+    assert load_root_entries(state_path) == {}
+
+
+def test_coverage_summary():
+    summary = coverage_summary(
+        {"a": "complete", "b": "partial", "c": "unreached"},
+        {"a": [{}, {}], "b": [{}]},
+        merged_entries=3,
+    )
+    assert "Complete: 1 of 3 folders (2 files)" in summary
+    assert "Partial: 1 of 3 folders (1 files)" in summary
+    assert "Unreached: 1 of 3 folders (0 files)" in summary
+    assert "Kept from previous run: 3 files" in summary
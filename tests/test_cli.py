@@ -0,0 +1,268 @@
+from collections import Counter
+from importlib.util import module_from_spec
+from importlib.util import spec_from_file_location
+from json import dumps as json_serialize
+from pathlib import Path
+import pytest
+from threading import Lock
+from time import sleep
+from TinGen.gdrive import GDrive
+from TinGen.utils import index_entry_file_id
+from TinGen.utils import read_index
+
+CLI_PATH = Path(__file__).resolve().parent.parent / "TinGen.py"
+
+
+@pytest.fixture(scope="module")
+def cli():
+    spec = spec_from_file_location("tingen_cli", CLI_PATH)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_extensions_are_normalized(cli):
+    args = cli.build_parser().parse_args(
+        ["folder", "--extensions", ".NSP", "nsz"],
+    )
+    assert args.extensions == ["nsp", "nsz"]
+
+
+@pytest.mark.parametrize("option,config", [
+    ("--jobs", [{"index_file": "a.tfl", "extensions": [".NSZ"]}]),
+    ("--targets", [{"index_file": "a.tfl", "extensions": [".NSZ"]}]),
+])
+def test_option_sets_override_command_line(cli, tmp_path, option, config):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json_serialize(config))
+    args = cli.parse_args(
+        ["folder", "--extensions", "nsp", option, str(config_path)],
+    )
+
+    [option_set] = getattr(args, option[2:])
+    assert option_set.index_file == "a.tfl"
+    assert option_set.extensions == ["nsz"]
+    assert option_set.folder_ids == ["folder"]
+
+
+@pytest.mark.parametrize("option,config", [
+    ("--jobs", []),
+    ("--jobs", [{"extensions": ["nsp"]}]),
+    ("--jobs", [{"index_file": "a.tfl", "watch": True}]),
+    ("--targets", [{"index_file": "a.tfl", "token": "token.json"}]),
+])
+def test_invalid_option_sets_are_rejected(cli, tmp_path, option, config):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json_serialize(config))
+    with pytest.raises(SystemExit):
+        cli.parse_args(["folder", option, str(config_path)])
+
+
+def test_parents_batch_size(cli):
+    assert cli.parse_args(["folder"]).parents_batch_size == 1
+    with pytest.raises(SystemExit):
+        cli.parse_args(["folder", "--parents-batch-size", "0"])
+
+
+class FakeGenerator:
+    def __init__(
+        self
+    ):
+        self.scan_coverage = {}
+
+    def index_generator(
+        self,
+        folder_ids,
+        recursion,
+        add_nsw_files_without_title_id,
+        add_non_nsw_files,
+        extensions=None,
+        deadline=None
+    ):
+        self.scan_coverage.update({
+            folder_id: "complete" for folder_id in folder_ids
+        })
+
+    def entries_by_root(
+        self
+    ):
+        return {"root": [{"url": "gdrive:a#A.nsp", "size": 1}]}
+
+
+def test_root_entries_are_only_saved_when_asked(cli, tmp_path, capsys):
+    index_path = tmp_path / "index.tfl"
+    args = cli.parse_args(["root", "--index-file", str(index_path)])
+    cli.generate_index(FakeGenerator(), args)
+
+    assert not Path(f"{index_path}.roots.json").exists()
+    assert "Crawl Coverage" not in capsys.readouterr().out
+
+    state_path = tmp_path / "roots.json"
+    args = cli.parse_args([
+        "root",
+        "--index-file",
+        str(index_path),
+        "--coverage-state",
+        str(state_path),
+    ])
+    cli.generate_index(FakeGenerator(), args)
+
+    assert cli.load_root_entries(state_path) == \
+        FakeGenerator().entries_by_root()
+    assert "Crawl Coverage" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("options,config", [
+    (["--time-budget", "60"], None),
+    ([], [{"index_file": "a.tfl", "time_budget": 60}]),
+])
+def test_time_budget_rejects_flat_shared_drives(
+    cli,
+    tmp_path,
+    options,
+    config,
+):
+    if config is not None:
+        config_path = tmp_path / "jobs.json"
+        config_path.write_text(json_serialize(config))
+        options = options + ["--jobs", str(config_path)]
+    with pytest.raises(SystemExit):
+        cli.parse_args(["folder", "--flat-shared-drive"] + options)
+
+
+class FakeIndex:
+    def __init__(
+        self
+    ):
+        self.index = {"files": [{"url": "gdrive:a#A.nsp", "size": 1}]}
+
+    def reset_success_message(
+        self
+    ):
+        self.index.pop("success", None)
+
+
+def test_skip_unchanged_writes_new_outputs(cli, tmp_path):
+    index_path = tmp_path / "index.tfl"
+    json_path = tmp_path / "index.json"
+    zlib_path = tmp_path / "index.zlib.tfl"
+    options = [
+        "root",
+        "--index-file",
+        str(index_path),
+        "--skip-unchanged",
+        "--no-compress",
+        "--output",
+        f"{json_path},json",
+    ]
+    cli.publish_index(FakeIndex(), cli.parse_args(options))
+    assert json_path.is_file()
+
+    options += ["--output", f"{zlib_path},zlib"]
+    cli.publish_index(FakeIndex(), cli.parse_args(options))
+    assert zlib_path.is_file()
+
+    zlib_path.unlink()
+    cli.publish_index(FakeIndex(), cli.parse_args(options))
+    assert zlib_path.is_file()
+
+
+JOB_TREE = {
+    "a": [],
+    "b": [],
+    "shared": ["sub"],
+    "sub": [],
+    "bad": [],
+}
+
+
+def job_drive(failing_folder_id=None):
+    """Builds a GDrive listing JOB_TREE that counts the listing calls"""
+    gdrive = GDrive.__new__(GDrive)
+    gdrive.listing_lock = Lock()
+    gdrive.listing_cache = None
+    gdrive.listing_extensions = None
+    gdrive.flat_shared_drives = False
+    gdrive.parents_batch_size = 1
+    gdrive.scan_fields = GDrive.SCAN_FIELDS
+    gdrive.permission_lock = Lock()
+    gdrive.listed = Counter()
+
+    def lsf(folder_id, fields=None, extensions=None, page_size=1000):
+        gdrive.listed.update([folder_id])
+        # Gives the other job time to ask for the same folder
+        sleep(0.2)
+        if folder_id == failing_folder_id:
+            raise RuntimeError(f"Unable to list {folder_id}")
+        return [{
+            "id": f"{folder_id}-file",
+            "name": f"{folder_id}.nsp",
+            "size": "1",
+        }]
+
+    def lsd(folder_id):
+        return [
+            {"id": subfolder_id, "name": subfolder_id}
+            for subfolder_id in JOB_TREE[folder_id]
+        ]
+
+    gdrive._lsf = lsf
+    gdrive._lsd = lsd
+    return gdrive
+
+
+def job_args(cli, tmp_path, folder_ids_by_job):
+    jobs_path = tmp_path / "jobs.json"
+    jobs_path.write_text(json_serialize([
+        {
+            "index_file": str(tmp_path / f"{job_name}.json"),
+            "folder_ids": folder_ids,
+        }
+        for (job_name, folder_ids) in folder_ids_by_job.items()
+    ]))
+    return cli.parse_args([
+        "unused",
+        "--jobs",
+        str(jobs_path),
+        "--no-compress",
+        "--add-nsw-files-without-title-id",
+    ])
+
+
+def test_jobs_list_overlapping_folders_once(cli, tmp_path):
+    gdrive = job_drive()
+    cli.run_jobs(gdrive, job_args(cli, tmp_path, {
+        "first": ["a", "shared"],
+        "second": ["b", "shared"],
+    }))
+
+    assert gdrive.listed == Counter(["a", "b", "shared", "sub"])
+    assert gdrive.listing_cache is None
+    assert not list(tmp_path.glob("*.roots.json"))
+    for (job_name, folder_ids) in (
+        ("first", ["a", "shared", "sub"]),
+        ("second", ["b", "shared", "sub"]),
+    ):
+        index = read_index(tmp_path / f"{job_name}.json")
+        assert sorted(
+            index_entry_file_id(file_entry) for file_entry in index["files"]
+        ) == [f"{folder_id}-file" for folder_id in folder_ids]
+
+
+def test_failed_listing_is_raised_to_every_job(cli, tmp_path, capsys):
+    gdrive = job_drive(failing_folder_id="bad")
+    with pytest.raises(RuntimeError, match="2 of 2 jobs failed"):
+        cli.run_jobs(gdrive, job_args(cli, tmp_path, {
+            "first": ["bad"],
+            "second": ["bad"],
+        }))
+
+    assert gdrive.listed == Counter(["bad"])
+    assert capsys.readouterr().out.count("Unable to list bad") == 2
+
+    # The failed listing isn't cached, so the next caller lists again
+    gdrive.enable_listing_cache(None)
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="Unable to list bad"):
+            gdrive._list_files("bad")
+    assert gdrive.listed == Counter({"bad": 3})
@@ -0,0 +1,78 @@
+from datetime import datetime
+from datetime import timedelta
+from google.auth.credentials import Credentials as BaseCredentials
+from google.oauth2.credentials import Credentials
+import pytest
+from threading import Thread
+from time import sleep
+from TinGen.credentials import CredentialPool
+from TinGen.credentials import LockedCredentials
+
+
+def pooled(count):
+    return [
+        (f"token-{number}", Credentials(f"access-{number}"))
+        for number in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count,requests_per_second,interval", [
+    (1, None, 0.0),
+    (2, None, 0.1),
+    (1, 5.0, 0.2),
+    (2, 0, 0.0),
+])
+def test_request_interval(count, requests_per_second, interval):
+    credential_pool = CredentialPool(
+        pooled(count),
+        requests_per_second=requests_per_second,
+    )
+    assert credential_pool.request_interval == pytest.approx(interval)
+
+
+def test_pool_needs_a_credential():
+    with pytest.raises(RuntimeError):
+        CredentialPool([])
+
+
+class SlowCredentials(Credentials):
+    def __init__(self):
+        super().__init__(None)
+        self.refresh_count = 0
+
+    def refresh(self, request):
+        sleep(0.05)
+        self.refresh_count += 1
+        self.token = f"access-{self.refresh_count}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+def test_concurrent_requests_refresh_once():
+    wrapped = SlowCredentials()
+    credentials = LockedCredentials(wrapped)
+    headers = [{} for _ in range(8)]
+    threads = [
+        Thread(
+            target=credentials.before_request,
+            args=(None, "GET", "https://example.com", request_headers),
+        )
+        for request_headers in headers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wrapped.refresh_count == 1
+    assert isinstance(credentials, BaseCredentials)
+    assert {
+        request_headers["authorization"] for request_headers in headers
+    } == {"Bearer access-1"}
+
+
+def test_acquire_leaves_refresh_to_the_transport():
+    wrapped = SlowCredentials()
+    credential_pool = CredentialPool([("token", wrapped)])
+
+    assert credential_pool.acquire().credentials.credentials is wrapped
+    assert wrapped.refresh_count == 0
@@ -0,0 +1,71 @@
+from TinGen.diff import diff_index_entries
+from TinGen.diff import index_fingerprint
+from TinGen.diff import load_index_state
+from TinGen.diff import load_previous_index_state
+from TinGen.diff import save_index_state
+from TinGen.utils import CompressionFlag
+from TinGen.utils import create_tinfoil_index
+
+OLD_ENTRIES = [
+    {"url": "gdrive:a#A.nsp", "size": 1},
+    {"url": "gdrive:b#B.nsp", "size": 2},
+    {"url": "gdrive:c#C.nsp", "size": 3},
+]
+NEW_ENTRIES = [
+    {"url": "gdrive:b#B.nsp", "size": 2},
+    {"url": "gdrive:c#C2.nsp", "size": 4},
+    {"url": "gdrive:d#D.nsp", "size": 5},
+]
+
+
+def test_diff_index_entries():
+    index_diff = diff_index_entries(OLD_ENTRIES, NEW_ENTRIES)
+
+    assert index_diff.changed
+    assert index_diff.added == [{"url": "gdrive:d#D.nsp", "size": 5}]
+    assert index_diff.removed == [{"url": "gdrive:a#A.nsp", "size": 1}]
+    assert index_diff.resized == [(OLD_ENTRIES[2], NEW_ENTRIES[1])]
+    assert "Added: 1" in index_diff.summary()
+    assert not diff_index_entries(OLD_ENTRIES, OLD_ENTRIES).changed
+
+
+def test_index_fingerprint_ignores_order_and_success():
+    fingerprint = index_fingerprint({"files": OLD_ENTRIES, "success": "1"})
+
+    assert fingerprint == index_fingerprint({
+        "files": list(reversed(OLD_ENTRIES)),
+        "success": "2",
+    })
+    assert fingerprint != index_fingerprint({"files": NEW_ENTRIES})
+    assert fingerprint != index_fingerprint(
+        {"files": OLD_ENTRIES},
+        extra="zlib",
+    )
+
+
+def test_index_state_round_trip(tmp_path):
+    state_path = tmp_path / "index.tfl.state.json"
+    save_index_state(state_path, "fingerprint", OLD_ENTRIES)
+
+    assert load_index_state(state_path) == {
+        "fingerprint": "fingerprint",
+        "files": OLD_ENTRIES,
+    }
+
+
+def test_previous_state_falls_back_to_index(tmp_path):
+    index_path = tmp_path / "index.tfl"
+    create_tinfoil_index(
+        {"files": OLD_ENTRIES},
+        index_path,
+        CompressionFlag.ZSTD_COMPRESSION,
+    )
+
+    assert load_previous_index_state(
+        tmp_path / "missing.json",
+        index_path,
+    ) == {"fingerprint": None, "files": OLD_ENTRIES}
+    assert load_previous_index_state(tmp_path / "missing.json") == {
+        "fingerprint": None,
+        "files": [],
+    }
@@ -0,0 +1,136 @@
+import pytest
+from TinGen import frontier as frontier_module
+from TinGen.frontier import CrawlFrontier
+from TinGen.frontier import list_leased_folders
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    crawl_frontier = CrawlFrontier(tmp_path / "frontier.db")
+    yield crawl_frontier
+    crawl_frontier.close()
+
+
+def file_details(name):
+    return {"name": name, "size": "1", "shared": False}
+
+
+def test_claim_complete_and_collect(frontier):
+    frontier.seed(["root"])
+    [folder_row] = frontier.claim("w1", 10)
+    assert folder_row == ("root", "root", "", 0, 1)
+    assert frontier.claim("w2", 10) == []
+
+    assert frontier.complete(
+        "w1",
+        [folder_row],
+        [("root", "a", file_details("A.nsp"))],
+        {"root": [("sub", "Sub", 1, True)]},
+    ) == 1
+    assert frontier.claim("w2", 10) == [("sub", "root", "Sub", 1, 1)]
+    assert not frontier.finished()
+    assert list(frontier.iter_root_files("root")) == [
+        ("a", {"size": 1, "name": "A.nsp", "shared": False}),
+    ]
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    frontier = CrawlFrontier(tmp_path / "frontier.db", lease_seconds=-1.0)
+    frontier.seed(["root"])
+    folder_rows = frontier.claim("w1", 1)
+
+    assert frontier.claim("w2", 1) == folder_rows
+    assert frontier.complete("w1", folder_rows, [], {}) == 0
+    assert frontier.complete("w2", folder_rows, [], {}) == 1
+    assert frontier.finished()
+    frontier.close()
+
+
+def test_release_gives_up_after_maximum_attempts(frontier):
+    frontier.seed(["root"])
+    for _ in range(CrawlFrontier.MAXIMUM_ATTEMPTS):
+        folder_rows = frontier.claim("w1", 1)
+        assert folder_rows
+        frontier.release("w1", folder_rows, "Broken")
+
+    assert frontier.finished()
+    assert frontier.failed_folders() == [("root", "Broken")]
+
+
+def test_prioritized_roots_are_claimed_first(frontier):
+    frontier.seed(["b", "a"], prioritized=True)
+    [b_row] = frontier.claim("w1", 1)
+    frontier.complete("w1", [b_row], [], {"b": [("b1", "B1", 1, True)]})
+
+    assert [row[0] for row in frontier.claim("w1", 2)] == ["b1", "a"]
+
+
+def test_unprioritized_roots_are_claimed_by_depth(frontier):
+    frontier.seed(["b", "a"])
+    [b_row] = frontier.claim("w1", 1)
+    frontier.complete("w1", [b_row], [], {"b": [("b1", "B1", 1, True)]})
+
+    assert [row[0] for row in frontier.claim("w1", 2)] == ["a", "b1"]
+
+
+def test_worker_stats_are_summed(frontier):
+    frontier.seed(["root"])
+    frontier.record_stats("w1", {"requests": 2, "pruned_folders": 1})
+    frontier.record_stats("w1", {"requests": 3, "pruned_folders": 1})
+    frontier.record_stats("w2", {"requests": 4})
+
+    assert frontier.stats() == {"requests": 7, "pruned_folders": 1}
+
+
+class FailingDrive:
+    def __init__(
+        self,
+        broken_folder_id
+    ):
+        self.broken_folder_id = broken_folder_id
+        self.batches = []
+
+    def list_folder_states(
+        self,
+        folder_states,
+        recursion,
+        extensions=None,
+        rules=None
+    ):
+        folder_ids = [folder_state[0] for folder_state in folder_states]
+        self.batches.append(folder_ids)
+        if self.broken_folder_id in folder_ids:
+            raise RuntimeError("Broken folder")
+        return (
+            [
+                (folder_id, f"{folder_id}-file", file_details("X.nsp"))
+                for folder_id in folder_ids
+            ],
+            {folder_id: [] for folder_id in folder_ids},
+        )
+
+
+def test_failed_batch_is_bisected(frontier, monkeypatch):
+    monkeypatch.setattr(frontier_module, "sleep", lambda seconds: None)
+    frontier.seed(["a", "b", "c", "d"])
+    gdrive_service = FailingDrive("c")
+
+    assert list_leased_folders(
+        frontier,
+        "w1",
+        gdrive_service,
+        frontier.claim("w1", 4),
+    ) == 3
+    assert gdrive_service.batches == [
+        ["a", "b", "c", "d"],
+        ["a", "b"],
+        ["c", "d"],
+        ["c"],
+        ["d"],
+    ]
+    assert frontier.counts() == {
+        "pending": 1,
+        "leased": 0,
+        "done": 3,
+        "failed": 0,
+    }
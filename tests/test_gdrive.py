@@ -0,0 +1,495 @@
+from httplib2 import Response as HttpResponse
+from itertools import chain
+from itertools import repeat
+from googleapiclient.errors import HttpError
+import pytest
+from re import findall
+from threading import Lock
+from TinGen.gdrive import GDrive
+from TinGen.rules import CrawlRules
+
+FOLDER = GDrive.FOLDER_MIME_TYPE
+
+
+class FakeFiles:
+    def list(
+        self,
+        **request
+    ):
+        return request
+
+    def get(
+        self,
+        **request
+    ):
+        return request
+
+
+class FakeService:
+    def files(
+        self
+    ):
+        return FakeFiles()
+
+
+class Progress:
+    def update(
+        self,
+        count
+    ):
+        pass
+
+
+def listing_drive(
+    tree,
+    parents_batch_size=1,
+    max_parents=None,
+    error_message=b"The query is too complex.",
+):
+    """Builds a GDrive listing `tree`, a dict of folder ID to children"""
+    gdrive = GDrive.__new__(GDrive)
+    gdrive.parents_batch_size = parents_batch_size
+    gdrive.scan_fields = GDrive.SCAN_FIELDS
+    gdrive.drive_scan_fields = GDrive.DRIVE_SCAN_FIELDS
+    gdrive.listing_cache = None
+    gdrive.flat_shared_drives = False
+    gdrive.permission_lock = Lock()
+    gdrive.drive_service = FakeService()
+    gdrive.queries = []
+
+    def apicall(request):
+        query = request["q"]
+        parent_ids = findall(r"\"([^\"]+)\" in parents", query)
+        gdrive.queries.append((parent_ids, request["pageToken"]))
+        if max_parents is not None and len(parent_ids) > max_parents:
+            raise HttpError(
+                HttpResponse({"status": 400}),
+                b'{"error": {"code": 400, "message": "' + error_message +
+                b'"}}',
+            )
+        children = [
+            dict(child, parents=[parent_id])
+            for parent_id in parent_ids
+            for child in tree.get(parent_id, [])
+            if ("not mimeType" not in query or child["mimeType"] != FOLDER)
+            and ("mimeType contains" not in query or "not mimeType" in query
+                 or child["mimeType"] == FOLDER)
+        ]
+        start = request["pageToken"] or 0
+        page_end = start + request["pageSize"]
+        response = {"files": children[start:page_end]}
+        if page_end < len(children):
+            response.update({"nextPageToken": page_end})
+        return response
+
+    gdrive._apicall = apicall
+    return gdrive
+
+
+def folder(folder_id):
+    return {"id": folder_id, "name": folder_id, "mimeType": FOLDER}
+
+
+def files(prefix, count):
+    return [
+        {
+            "id": f"{prefix}{number}",
+            "name": f"{prefix}{number}.nsp",
+            "size": "1",
+            "mimeType": "application/octet-stream",
+        }
+        for number in range(count)
+    ]
+
+
+TREE = {
+    "root": [folder("a"), folder("b"), folder("c"), folder("d")] +
+    files("r", 3),
+    "a": files("a", 5),
+    "b": files("b", 5),
+    "c": files("c", 5),
+    "d": files("d", 5),
+}
+
+
+def permission_drive():
+    gdrive = GDrive.__new__(GDrive)
+    gdrive.permission_lock = Lock()
+    gdrive.deleted = []
+
+    def delete_file_permission(file_id, permission_id):
+        assert not gdrive.permission_lock.locked()
+        gdrive.deleted.append((file_id, permission_id))
+
+    gdrive.delete_file_permission = delete_file_permission
+    return gdrive
+
+
+def test_check_file_shared_deletes_stale_permissions_unlocked():
+    gdrive = permission_drive()
+    _file = {"id": "a", "permissionIds": ["123k", "anyoneWithLink", "me"]}
+
+    assert gdrive.check_file_shared(_file)
+    assert gdrive.deleted == [("a", "123k")]
+    assert _file["permissionIds"] == ["anyoneWithLink", "me"]
+
+    assert gdrive.check_file_shared(_file)
+    assert gdrive.deleted == [("a", "123k")]
+
+
+def test_check_file_shared_without_permissions():
+    gdrive = permission_drive()
+    assert not gdrive.check_file_shared({"id": "a"})
+    assert not gdrive.check_file_shared({"id": "a", "permissionIds": ["me"]})
+
+
+def test_too_complex_batches_are_halved():
+    gdrive = listing_drive(TREE, parents_batch_size=4, max_parents=2)
+    listed = list(gdrive.iter_files_in_folder("root", True, Progress()))
+
+    assert len(listed) == 23
+    assert gdrive.parents_batch_size == 2
+    assert [parent_ids for (parent_ids, _) in gdrive.queries] == [
+        ["root"],
+        ["a", "b", "c", "d"],
+        ["a", "b"],
+        ["c", "d"],
+    ]
+
+
+def test_other_errors_are_not_retried_in_halves():
+    gdrive = listing_drive(
+        TREE,
+        parents_batch_size=4,
+        max_parents=2,
+        error_message=b"Invalid Value",
+    )
+    with pytest.raises(HttpError):
+        list(gdrive._ls_parents(["a", "b", "c"]))
+
+
+@pytest.mark.parametrize("parents_batch_size", [1, 4])
+def test_capped_folders_stop_paging(parents_batch_size):
+    gdrive = listing_drive(TREE, parents_batch_size=parents_batch_size)
+    rules = CrawlRules(max_files_per_folder=2)
+    listed = list(gdrive.iter_files_in_folder(
+        "root",
+        True,
+        Progress(),
+        rules=rules,
+    ))
+
+    assert len(listed) == 10
+    assert rules.capped_folders == 5
+    assert all(page_token is None for (_, page_token) in gdrive.queries)
+
+
+@pytest.mark.parametrize("parents_batch_size,rules,queries,saved_calls", [
+    (1, CrawlRules(exclude=["a", "b"]), 6, 4),
+    (4, CrawlRules(exclude=["a", "b"]), 2, 0.5),
+    (1, CrawlRules(max_depth=0), 1, 1),
+    (4, CrawlRules(max_depth=0), 1, 1),
+    (1, CrawlRules(max_depth=1), 6, 4),
+    (4, CrawlRules(max_depth=1), 2, 0),
+])
+def test_skipped_folders_count_saved_calls(
+    parents_batch_size,
+    rules,
+    queries,
+    saved_calls,
+):
+    gdrive = listing_drive(TREE, parents_batch_size=parents_batch_size)
+    list(gdrive.iter_files_in_folder("root", True, Progress(), rules=rules))
+
+    assert len(gdrive.queries) == queries
+    assert rules.saved_calls == saved_calls
+
+
+def test_capped_folder_states_stop_paging():
+    gdrive = listing_drive(TREE, parents_batch_size=4)
+    rules = CrawlRules(max_files_per_folder=2)
+    (listed, subfolder_states) = gdrive.list_folder_states(
+        [("root", "", 0, True)],
+        True,
+        rules=rules,
+    )
+
+    assert len(listed) == 2
+    assert [state[0] for state in subfolder_states["root"]] == \
+        ["a", "b", "c", "d"]
+    assert all(page_token is None for (_, page_token) in gdrive.queries)
+
+
+@pytest.mark.parametrize("parents_batch_size", [1, 4])
+def test_walk_stops_at_deadline(monkeypatch, parents_batch_size):
+    gdrive = listing_drive(TREE, parents_batch_size=parents_batch_size)
+    times = chain([0.0], repeat(10.0))
+    monkeypatch.setattr("TinGen.gdrive.monotonic", lambda: next(times))
+    listed = list(gdrive.iter_files_in_folder(
+        "root",
+        True,
+        Progress(),
+        deadline=5.0,
+    ))
+
+    assert [file_id for (file_id, _) in listed] == ["r0", "r1", "r2"]
+    assert all(parent_ids == ["root"] for (parent_ids, _) in gdrive.queries)
+
+
+def flat_drive(tree, drive_folder_ids, page_size=4):
+    """Builds a GDrive on a shared drive holding `drive_folder_ids`"""
+    gdrive = listing_drive(tree)
+    gdrive.flat_shared_drives = True
+    gdrive.drive_trees = {}
+    gdrive.drive_queries = []
+    items = [
+        dict(child, parents=[parent_id])
+        for (parent_id, children) in tree.items()
+        for child in children
+    ]
+    folder_apicall = gdrive._apicall
+
+    def apicall(request):
+        if "fileId" in request:
+            if request["fileId"] in drive_folder_ids:
+                return {"driveId": "drive"}
+            return {}
+        if request.get("corpora") != "drive":
+            return folder_apicall(request)
+        query = request["q"]
+        gdrive.drive_queries.append(query)
+        extensions = findall(r"name contains \"\.(\w+)\"", query)
+        listed_items = [
+            item for item in items
+            if not extensions or item["mimeType"] == FOLDER or any(
+                item["name"].endswith(f".{ext}") for ext in extensions
+            )
+        ]
+        start = request["pageToken"] or 0
+        page_end = start + page_size
+        response = {"files": listed_items[start:page_end]}
+        if page_end < len(listed_items):
+            response.update({"nextPageToken": page_end})
+        return response
+
+    gdrive._apicall = apicall
+    return gdrive
+
+
+DRIVE_TREE = {
+    "root": [folder("a"), folder("b")] + files("r", 2),
+    "a": [folder("a-sub")] + files("a", 2),
+    "a-sub": files("s", 2) + [{
+        "id": "x",
+        "name": "x.xci",
+        "size": "1",
+        "mimeType": "application/octet-stream",
+    }],
+    "b": files("b", 2),
+}
+
+
+def listed_ids(listed):
+    return sorted(file_id for (file_id, _) in listed)
+
+
+def test_flat_listing_walks_subtree_of_one_drive_listing():
+    gdrive = flat_drive(DRIVE_TREE, {"root", "a"})
+
+    assert listed_ids(gdrive.iter_files_in_folder("a", True, Progress())) \
+        == ["a0", "a1", "s0", "s1", "x"]
+    assert listed_ids(
+        gdrive.iter_files_in_folder("root", True, Progress())
+    ) == ["a0", "a1", "b0", "b1", "r0", "r1", "s0", "s1", "x"]
+    assert gdrive.drive_queries == ["trashed = false"] * 3
+
+
+def test_flat_listing_without_recursion_lists_per_folder():
+    gdrive = flat_drive(DRIVE_TREE, {"root"})
+
+    assert listed_ids(
+        gdrive.iter_files_in_folder("root", False, Progress())
+    ) == ["r0", "r1"]
+    assert gdrive.drive_queries == []
+    assert [parent_ids for (parent_ids, _) in gdrive.queries] == [["root"]]
+
+
+def test_flat_listing_applies_rules():
+    gdrive = flat_drive(DRIVE_TREE, {"root"})
+    rules = CrawlRules(exclude=["a-sub"])
+
+    assert listed_ids(gdrive.iter_files_in_folder(
+        "root",
+        True,
+        Progress(),
+        rules=rules,
+    )) == ["a0", "a1", "b0", "b1", "r0", "r1"]
+    assert rules.pruned_folders == 1
+    assert rules.saved_calls == 0
+
+    assert listed_ids(gdrive.iter_files_in_folder(
+        "root",
+        True,
+        Progress(),
+        rules=CrawlRules(max_depth=1),
+    )) == ["a0", "a1", "b0", "b1", "r0", "r1"]
+
+
+def test_flat_listing_filters_extensions_in_query():
+    gdrive = flat_drive(DRIVE_TREE, {"root"})
+
+    assert listed_ids(gdrive.iter_files_in_folder(
+        "root",
+        True,
+        Progress(),
+        extensions=["nsp"],
+    )) == ["a0", "a1", "b0", "b1", "r0", "r1", "s0", "s1"]
+    assert "name contains \".nsp\"" in gdrive.drive_queries[0]
+
+    gdrive.clear_drive_trees()
+    list(gdrive.iter_files_in_folder("root", True, Progress()))
+    assert gdrive.drive_queries[-1] == "trashed = false"
+
+
+def http_error(status, reason):
+    return HttpError(
+        HttpResponse({"status": status}),
+        b'{"error": {"code": ' + str(status).encode() +
+        b', "errors": [{"reason": "' + reason.encode() + b'"}]}}',
+    )
+
+
+class FakeBatch:
+    def __init__(
+        self,
+        outcomes,
+        callback
+    ):
+        self.outcomes = outcomes
+        self.callback = callback
+        self.file_ids = []
+
+    def add(
+        self,
+        request,
+        request_id
+    ):
+        assert request["fileId"] == request_id
+        self.file_ids.append(request_id)
+
+    def execute(
+        self,
+        http
+    ):
+        for file_id in self.file_ids:
+            outcome = self.outcomes[file_id]
+            if isinstance(outcome, HttpError):
+                self.callback(file_id, None, outcome)
+            else:
+                self.callback(file_id, outcome, None)
+
+
+class FakeBatchService(FakeService):
+    def __init__(
+        self,
+        outcomes
+    ):
+        self.outcomes = outcomes
+        self.batches = []
+
+    def new_batch_http_request(
+        self,
+        callback
+    ):
+        self.batches.append(FakeBatch(self.outcomes, callback))
+        return self.batches[-1]
+
+
+class FakePool:
+    def __init__(
+        self
+    ):
+        self.reports = []
+
+    def acquire(
+        self
+    ):
+        return self
+
+    @property
+    def http(
+        self
+    ):
+        return None
+
+    def report_success(
+        self,
+        member
+    ):
+        self.reports.append("success")
+
+    def report_quota_exceeded(
+        self,
+        member
+    ):
+        self.reports.append("quota")
+
+
+def verify_drive(outcomes):
+    gdrive = GDrive.__new__(GDrive)
+    gdrive.drive_service = FakeBatchService(outcomes)
+    gdrive.credential_pool = FakePool()
+    gdrive.stats_lock = Lock()
+    gdrive.stats = {"requests": 0}
+    return gdrive
+
+
+VERIFY_OUTCOMES = {
+    "ok": {"id": "ok", "trashed": False},
+    "trashed": {"id": "trashed", "trashed": True},
+    "missing": http_error(404, "notFound"),
+    "inaccessible": http_error(403, "forbidden"),
+    "quota": http_error(403, "userRateLimitExceeded"),
+    "backend": http_error(500, "backendError"),
+}
+
+
+def test_verify_batch_sorts_out_answers_and_retries():
+    gdrive = verify_drive(VERIFY_OUTCOMES)
+
+    assert gdrive._verify_batch(list(VERIFY_OUTCOMES)) == (
+        {
+            "ok": "ok",
+            "trashed": "trashed",
+            "missing": "missing",
+            "inaccessible": "inaccessible",
+        },
+        ["quota", "backend"],
+    )
+    assert gdrive.credential_pool.reports == ["quota"]
+    assert gdrive.stats["requests"] == 1
+
+    gdrive._verify_batch(["ok", "missing"])
+    assert gdrive.credential_pool.reports == ["quota", "success"]
+
+
+def test_verify_files_gives_up_on_failing_files(monkeypatch):
+    monkeypatch.setattr("TinGen.gdrive.sleep", lambda seconds: None)
+    gdrive = verify_drive(VERIFY_OUTCOMES)
+
+    assert gdrive.verify_files(
+        list(VERIFY_OUTCOMES) + ["ok"],
+        Progress(),
+        workers=2,
+    ) == {
+        "ok": "ok",
+        "trashed": "trashed",
+        "missing": "missing",
+        "inaccessible": "inaccessible",
+        "quota": "unknown",
+        "backend": "unknown",
+    }
+    assert [
+        batch.file_ids for batch in gdrive.drive_service.batches
+    ] == [list(VERIFY_OUTCOMES)] + \
+        [["quota", "backend"]] * (GDrive.MAXIMUM_VERIFY_ROUNDS - 1)
@@ -0,0 +1,301 @@
+import pytest
+from TinGen import TinGen
+from TinGen.verify import load_verify_cache
+from TinGen.utils import index_entry_file_id
+
+
+class FakeDrive:
+    def __init__(
+        self,
+        listings=None,
+        statuses=None
+    ):
+        self.listings = listings or {}
+        self.statuses = statuses or {}
+        self.verified_file_ids = []
+
+    def iter_files_in_folder(
+        self,
+        folder_id,
+        recursion,
+        progress_bar,
+        extensions=None,
+        rules=None,
+        deadline=None
+    ):
+        yield from self.listings.get(folder_id, [])
+
+    def verify_files(
+        self,
+        file_ids,
+        progress_bar,
+        workers=4
+    ):
+        self.verified_file_ids += file_ids
+        return {
+            file_id: self.statuses.get(file_id, "ok") for file_id in file_ids
+        }
+
+
+def generator(listings=None, **options):
+    return TinGen(
+        None,
+        None,
+        True,
+        "13.0",
+        gdrive_service=FakeDrive(listings),
+        **options
+    )
+
+
+def test_filter_pushdown_is_opt_in():
+    assert generator().scan_extensions(False) is None
+    assert generator(filter_pushdown=True).scan_extensions(
+        False,
+        ["nsp"],
+    ) == ["nsp"]
+    assert generator(filter_pushdown=True).scan_extensions(True) is None
+
+
+def scanned(file_id, name, size, shared=False, md5=None):
+    file_details = {"name": name, "size": size, "shared": shared}
+    if md5 is not None:
+        file_details.update({"md5": md5})
+    return (file_id, file_details)
+
+
+def test_better_ranked_copy_takes_over_entry():
+    tingen = generator(
+        {
+            "root-b": [scanned("b", "Game.nsp", 10, md5="m")],
+            "root-a": [scanned("a", "Game.nsz", 10, shared=True, md5="m")],
+        },
+        dedup_content=True,
+        preferred_roots=["root-a"],
+    )
+    tingen.index_generator(["root-b", "root-a"], True, True, False)
+
+    assert tingen.index["files"] == [{"url": "gdrive:a#Game.nsz", "size": 10}]
+    assert tingen.content_duplicates == 1
+    assert tingen.files_shared_status == {"a": True}
+    assert tingen.file_roots["a"] == "root-a"
+    assert tingen.title_ext_infos["nsp"] == {"count": 0, "size": 0}
+    assert tingen.title_ext_infos["nsz"] == {"count": 1, "size": 10}
+
+
+def test_set_index_files_keeps_content_keys_of_kept_files():
+    tingen = generator(
+        {
+            "root": [
+                scanned("a", "A.nsp", 1, md5="m1"),
+                scanned("b", "B.nsp", 2, md5="m2"),
+            ],
+        },
+        dedup_content=True,
+    )
+    tingen.index_generator(["root"], True, True, False)
+
+    tingen.set_index_files([
+        dict(file_entry) for file_entry in tingen.index["files"][1:]
+    ])
+
+    assert list(tingen.content_entries) == [("m2", 2)]
+
+
+def test_rescanned_file_updates_its_entry():
+    tingen = generator({
+        "old": [scanned("a", "Game.nsp", 10)],
+        "new": [scanned("a", "Game.nsz", 4, shared=True)],
+    })
+    events = []
+    tingen.file_listeners.append(
+        lambda file_entry, file_id, shared, updated=False: events.append(
+            (dict(file_entry), file_id, shared, updated)
+        )
+    )
+    tingen.index_generator(["old", "new"], True, True, False)
+
+    assert tingen.index["files"] == [{"url": "gdrive:a#Game.nsz", "size": 4}]
+    assert tingen.title_ext_infos["nsp"] == {"count": 0, "size": 0}
+    assert tingen.title_ext_infos["nsz"] == {"count": 1, "size": 4}
+    assert tingen.files_shared_status == {"a": True}
+    assert tingen.file_roots == {"a": "new"}
+    assert events == [
+        ({"url": "gdrive:a#Game.nsp", "size": 10}, "a", False, False),
+        ({"url": "gdrive:a#Game.nsz", "size": 4}, "a", True, True),
+    ]
+
+
+def test_unchanged_rescan_is_not_reported():
+    tingen = generator({"root": [scanned("a", "Game.nsp", 10)]})
+    events = []
+    tingen.file_listeners.append(
+        lambda *args, **kwargs: events.append(kwargs["updated"])
+    )
+    tingen.index_generator(["root", "root"], True, True, False)
+
+    assert events == [False]
+    assert tingen.title_ext_infos["nsp"] == {"count": 1, "size": 10}
+
+
+def test_read_index_merges_by_file_id(tmp_path):
+    index_path = tmp_path / "index.json"
+    previous = generator({
+        "root": [scanned("a", "A.nsp", 1), scanned("b", "B.xci", 2)],
+    })
+    previous.index_generator(["root"], True, True, False)
+    previous.write_index_to_file(index_path)
+
+    tingen = generator({"root": [scanned("b", "B2.xci", 3)]})
+    tingen.read_index(index_path)
+    tingen.index_generator(["root"], True, True, False)
+
+    assert tingen.index["files"] == [
+        {"url": "gdrive:a#A.nsp", "size": 1},
+        {"url": "gdrive:b#B2.xci", "size": 3},
+    ]
+    assert tingen.title_ext_infos["nsp"] == {"count": 1, "size": 1}
+    assert tingen.title_ext_infos["xci"] == {"count": 1, "size": 3}
+
+
+def test_extensions_match_the_whole_extension():
+    tingen = generator({
+        "root": [
+            scanned("a", "A.NSP", 1),
+            scanned("b", "B.tnsp", 2),
+            scanned("c", "C.xci", 3),
+        ],
+    })
+    tingen.scan_folder("root", None, True, True, False, extensions=["nsp"])
+
+    assert tingen.index["files"] == [{"url": "gdrive:a#A.NSP", "size": 1}]
+    assert tingen.title_ext_infos["nsp"] == {"count": 1, "size": 1}
+
+
+def test_scan_ending_after_deadline_is_partial(monkeypatch):
+    tingen = generator({"root": [scanned("a", "A.nsp", 1)]})
+    times = iter([0.0, 0.0, 10.0])
+    monkeypatch.setattr("TinGen.monotonic", lambda: next(times))
+    tingen.scan_folder("root", None, True, True, False, deadline=5.0)
+
+    assert tingen.scan_coverage == {"root": "partial"}
+    assert len(tingen.index["files"]) == 1
+
+
+def test_merge_unfinished_roots_keeps_scanned_entries():
+    tingen = generator({"root": [scanned("a", "A.nsp", 5)]})
+    tingen.scan_folder("root", None, True, True, False)
+    tingen.scan_coverage.update({"root": "partial", "other": "unreached"})
+
+    merged_entries = tingen.merge_unfinished_roots({
+        "root": [
+            {"url": "gdrive:a#Old.nsp", "size": 1},
+            {"url": "gdrive:b#B.nsp", "size": 2},
+        ],
+        "other": [{"url": "gdrive:c#C.xci", "size": 3}],
+    })
+
+    assert merged_entries == 2
+    assert tingen.index["files"] == [
+        {"url": "gdrive:a#A.nsp", "size": 5},
+        {"url": "gdrive:b#B.nsp", "size": 2},
+        {"url": "gdrive:c#C.xci", "size": 3},
+    ]
+    assert tingen.entries_by_root()["other"] == [
+        {"url": "gdrive:c#C.xci", "size": 3},
+    ]
+    assert tingen.title_ext_infos["nsp"] == {"count": 2, "size": 7}
+
+
+def title_entry(file_id, name, size=1):
+    return {
+        "url": f"gdrive:{file_id}#{name.replace(' ', '%20')}",
+        "size": size,
+    }
+
+
+VERSIONED_ENTRIES = [
+    title_entry("base", "Game [0100000000010000][v0].nsp", 10),
+    title_entry("u1", "Game [0100000000010800][v65536].nsp", 2),
+    title_entry("u2", "Game [0100000000010800][v131072].nsp", 3),
+    title_entry("u3", "Game [0100000000010800][v196608].nsz", 4),
+    title_entry("d1", "DLC [0100000000011001][v0].nsp", 5),
+    title_entry("d2", "DLC [0100000000011001][v65536].nsp", 6),
+    title_entry("d3", "DLC [0100000000011002][v0].nsp", 7),
+    title_entry("plain", "Game [0100000000010800].nsp", 8),
+    title_entry("other", "Homebrew.nsp", 9),
+]
+
+
+@pytest.mark.parametrize("keep_versions,kept_ids", [
+    (1, ["base", "u3", "d2", "d3", "plain", "other"]),
+    (2, ["base", "u2", "u3", "d1", "d2", "d3", "plain", "other"]),
+])
+def test_collapse_versions(keep_versions, kept_ids):
+    tingen = generator()
+    tingen.set_index_files([dict(entry) for entry in VERSIONED_ENTRIES])
+    tingen.collapse_versions(keep_versions=keep_versions)
+
+    kept_entries = [
+        entry for entry in VERSIONED_ENTRIES
+        if index_entry_file_id(entry) in kept_ids
+    ]
+    assert tingen.index["files"] == kept_entries
+    assert list(tingen.index_file_entries) == kept_ids
+    for ext in ("nsp", "nsz"):
+        ext_entries = [
+            entry for entry in kept_entries if entry["url"].endswith(ext)
+        ]
+        assert tingen.title_ext_infos[ext] == {
+            "count": len(ext_entries),
+            "size": sum(entry["size"] for entry in ext_entries),
+        }
+
+
+VERIFY_STATUSES = {
+    "b": "missing",
+    "c": "inaccessible",
+    "d": "unknown",
+    "e": "trashed",
+}
+
+
+@pytest.mark.parametrize("remove", [True, False])
+def test_prune_dead_files(tmp_path, remove):
+    tingen = generator()
+    tingen.gdrive_service.statuses = VERIFY_STATUSES
+    entries = [
+        title_entry(file_id, f"{file_id}.nsp") for file_id in "abcde"
+    ] + [{"url": "https://example.com/f.nsp", "size": 1}]
+    tingen.set_index_files([dict(entry) for entry in entries])
+    tingen.recount_title_ext_infos()
+    cache_path = tmp_path / "index.tfl.verify.json"
+
+    dead_entries = tingen.prune_dead_files(
+        cache_path=cache_path,
+        remove=remove,
+    )
+
+    assert dead_entries == [
+        (entries[1], "missing"),
+        (entries[2], "inaccessible"),
+        (entries[4], "trashed"),
+    ]
+    assert tingen.gdrive_service.verified_file_ids == list("abcde")
+    assert list(load_verify_cache(cache_path)) == ["a"]
+    kept_file_ids = "ad" if remove else "abcde"
+    assert [
+        index_entry_file_id(file_entry)
+        for file_entry in tingen.index["files"]
+    ] == list(kept_file_ids) + ["https://example.com/f.nsp"]
+    assert tingen.title_ext_infos["nsp"]["count"] == len(kept_file_ids) + 1
+
+    # Files verified as ok are skipped until their cache entry expires
+    del tingen.gdrive_service.verified_file_ids[:]
+    tingen.prune_dead_files(cache_path=cache_path, remove=remove)
+    assert tingen.gdrive_service.verified_file_ids == \
+        list(kept_file_ids.replace("a", ""))
+
+    del tingen.gdrive_service.verified_file_ids[:]
+    tingen.prune_dead_files(cache_path=cache_path, max_age=0, remove=remove)
+    assert tingen.gdrive_service.verified_file_ids == list(kept_file_ids)
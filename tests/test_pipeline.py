@@ -0,0 +1,56 @@
+import pytest
+from TinGen.pipeline import IndexPipeline
+from TinGen.pipeline import PipelineStage
+from TinGen.utils import CompressionFlag
+from TinGen.utils import read_index
+
+ENTRIES = [
+    {"url": "gdrive:a#a.nsp", "size": 1},
+    {"url": "gdrive:b#b.xci", "size": 2},
+]
+
+
+def test_pipeline_stage_is_abstract():
+    with pytest.raises(TypeError):
+        PipelineStage("Stage")
+
+
+@pytest.mark.parametrize("compression_flag", [
+    CompressionFlag.ZSTD_COMPRESSION,
+    CompressionFlag.ZLIB_COMPRESSION,
+    CompressionFlag.NO_COMPRESSION,
+])
+def test_pipeline_round_trip(tmp_path, compression_flag):
+    index_path = tmp_path / "index.tfl"
+    pipeline = IndexPipeline(index_path, compression_flag)
+    for file_entry in ENTRIES:
+        pipeline.file_added(file_entry, file_entry["url"][7:8], False)
+    pipeline.finish({"files": ENTRIES, "success": "Hello"})
+
+    assert read_index(index_path) == {"files": ENTRIES, "success": "Hello"}
+
+
+def test_pipeline_failure_writes_nothing(tmp_path):
+    index_path = tmp_path / "index.tfl"
+    pipeline = IndexPipeline(index_path, CompressionFlag.ZSTD_COMPRESSION)
+    pipeline.file_added({"url": object()}, "a", False)
+
+    with pytest.raises(RuntimeError):
+        pipeline.finish({"files": []})
+    assert not index_path.exists()
+
+
+def test_pipeline_writes_final_index_after_update(tmp_path):
+    index_path = tmp_path / "index.tfl"
+    pipeline = IndexPipeline(index_path, CompressionFlag.ZSTD_COMPRESSION)
+    pipeline.file_added({"url": "gdrive:a#a.nsp", "size": 1}, "a", False)
+    pipeline.file_added(
+        {"url": "gdrive:a#a.nsz", "size": 2},
+        "a",
+        False,
+        updated=True,
+    )
+    index = {"files": [{"url": "gdrive:a#a.nsz", "size": 2}]}
+    pipeline.finish(index)
+
+    assert read_index(index_path) == index
@@ -0,0 +1,69 @@
+from TinGen.rules import CrawlRules
+
+
+def test_inactive_without_rules():
+    assert not CrawlRules().active
+    assert CrawlRules(max_depth=0).active
+
+
+def test_excludes_win_over_includes():
+    rules = CrawlRules(include=["Games"], exclude=["Games"])
+
+    assert rules.folder_state("Games", "Games", 1, True) == (False, False)
+    assert rules.pruned_folders == 1
+
+
+def test_name_patterns_include_whole_subtrees():
+    rules = CrawlRules(include=["Base*"])
+
+    assert not rules.root_included()
+    assert rules.folder_state("Base Games", "Base Games", 1, False) == \
+        (True, True)
+    assert rules.folder_state("Misc", "Base Games/Misc", 2, True) == \
+        (True, True)
+    # Name patterns may still match further down
+    assert rules.folder_state("Misc", "Misc", 1, False) == (True, False)
+
+
+def test_path_patterns_only_walk_towards_matches():
+    rules = CrawlRules(include=["Games/*/Updates"])
+
+    assert rules.folder_state("Games", "Games", 1, False) == (True, False)
+    assert rules.folder_state("Zelda", "Games/Zelda", 2, False) == \
+        (True, False)
+    assert rules.folder_state(
+        "Updates",
+        "Games/Zelda/Updates",
+        3,
+        False,
+    ) == (True, True)
+    assert rules.folder_state("DLC", "Games/Zelda/DLC", 3, False) == \
+        (False, False)
+    assert rules.folder_state("Other", "Other", 1, False) == (False, False)
+
+
+def test_recursive_path_patterns_keep_walking():
+    rules = CrawlRules(include=["Games/**"])
+
+    assert rules.folder_state("Deep", "Other/Deep", 2, False) == \
+        (True, False)
+
+
+def test_max_depth_limits_subfolder_listing():
+    rules = CrawlRules(max_depth=1)
+
+    assert rules.lists_subfolders(0)
+    assert not rules.lists_subfolders(1)
+
+
+def test_summary_reports_folder_counts():
+    rules = CrawlRules(exclude=["Skip"])
+    rules.folder_state("Skip", "Skip", 1, True)
+    rules.capped_folders = 2
+    rules.saved_calls = 3.4
+
+    summary = rules.summary()
+
+    assert "skipped by patterns: 1" in summary
+    assert "capped: 2" in summary
+    assert "calls saved: 3\n" in summary
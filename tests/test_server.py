@@ -0,0 +1,92 @@
+from http.client import HTTPConnection
+import pytest
+from TinGen.server import IndexRequestHandler
+from TinGen.server import IndexServer
+from TinGen.utils import CompressionFlag
+from TinGen.utils import read_index
+
+INDEX = {"files": [{"url": "gdrive:a#a.nsp", "size": 1}], "version": "13"}
+
+
+@pytest.mark.parametrize("range_header,expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=100-", ()),
+    ("bytes=-0", ()),
+    ("bytes=9-5", None),
+    ("bytes=a-5", None),
+    ("bytes=5", None),
+    ("bytes=-", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_parse_range(range_header, expected):
+    assert IndexRequestHandler.parse_range(range_header, 100) == expected
+
+
+@pytest.fixture
+def server():
+    index_server = IndexServer("127.0.0.1", 0)
+    index_server.update(INDEX, CompressionFlag.ZSTD_COMPRESSION)
+    index_server.start()
+    yield index_server
+    index_server.httpd.shutdown()
+    index_server.httpd.server_close()
+
+
+def get(index_server, path, headers=None):
+    connection = HTTPConnection(*index_server.httpd.server_address)
+    connection.request("GET", path, headers=headers or {})
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return (response, body)
+
+
+def test_served_index_reads_back(server, tmp_path):
+    (response, body) = get(server, "/index.tfl")
+    assert response.status == 200
+
+    index_path = tmp_path / "index.tfl"
+    index_path.write_bytes(body)
+    assert read_index(index_path) == INDEX
+
+
+def test_etag_and_ranges(server):
+    (response, body) = get(server, "/index.json")
+    etag = response.getheader("ETag")
+
+    (response, _) = get(server, "/index.json", {"If-None-Match": etag})
+    assert response.status == 304
+
+    (response, part) = get(server, "/index.json", {"Range": "bytes=0-4"})
+    assert response.status == 206
+    assert part == body[:5]
+
+    (response, full) = get(server, "/index.json", {"Range": "bytes=9-5"})
+    assert response.status == 200
+    assert full == body
+
+    (response, _) = get(server, "/index.json", {"Range": "bytes=9999-"})
+    assert response.status == 416
+
+
+def test_unchanged_index_reuses_payloads(monkeypatch):
+    index_server = IndexServer("127.0.0.1", 0)
+    index_server.update(INDEX, CompressionFlag.ZSTD_COMPRESSION)
+    payloads = dict(index_server.payloads)
+    compressed = []
+    monkeypatch.setattr(
+        "TinGen.server.compress_index_buffer",
+        lambda *args, **kwargs: compressed.append(args),
+    )
+
+    index_server.update(INDEX, CompressionFlag.ZSTD_COMPRESSION)
+
+    assert compressed == []
+    assert index_server.payloads == payloads
+    index_server.httpd.server_close()
@@ -0,0 +1,184 @@
+import pytest
+from time import sleep
+from TinGen.gdrive import UGdrive
+
+
+class FakeResponse:
+    def __init__(
+        self,
+        status_code,
+        content
+    ):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(
+        self
+    ):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def listing_drive(responses):
+    ugdrive = UGdrive()
+    keys = iter(["key-1", "key-2", "key-3"])
+    ugdrive.get_folder_key = lambda folder_id, refresh=False: next(keys)
+    ugdrive.make_request = lambda method, url, **options: responses.pop(0)
+    return ugdrive
+
+
+def test_ls_folder_retries_rejected_key_once():
+    ugdrive = listing_drive([
+        FakeResponse(403, b"{}"),
+        FakeResponse(200, b"{\"items\": [{\"kind\": \"drive#file\", " +
+                     b"\"id\": \"a\", \"title\": \"a.nsp\", " +
+                     b"\"fileSize\": \"5\"}]}"),
+    ])
+
+    (files, subfolder_ids) = ugdrive._ls_folder("folder")
+
+    assert files == {"a": {"name": "a.nsp", "size": 5}}
+    assert subfolder_ids == []
+
+
+def test_ls_folder_raises_when_refreshed_key_is_rejected():
+    ugdrive = listing_drive([
+        FakeResponse(403, b"{}"),
+        FakeResponse(403, b"{\"error\": {\"message\": \"bad key\"}}"),
+    ])
+
+    with pytest.raises(RuntimeError, match="rejected the folder key"):
+        ugdrive._ls_folder("folder")
+
+
+def test_ls_folder_raises_on_listing_without_items():
+    ugdrive = listing_drive([
+        FakeResponse(200, b"{\"error\": {\"message\": \"bad request\"}}"),
+    ])
+
+    with pytest.raises(RuntimeError, match="bad request"):
+        ugdrive._ls_folder("folder")
+
+
+class StreamedResponse:
+    def __init__(
+        self
+    ):
+        self.closed = 0
+
+    def close(
+        self
+    ):
+        self.closed += 1
+
+
+def test_streamed_response_holds_host_slot_until_closed():
+    ugdrive = UGdrive(host_concurrency=1)
+    response = StreamedResponse()
+    ugdrive.session.request = lambda *args, **kwargs: response
+
+    streamed = ugdrive.make_request("GET", "https://host/a", stream=True)
+    host_slot = ugdrive.throttle.hosts["host"]
+    assert not host_slot["semaphore"].acquire(blocking=False)
+
+    streamed.close()
+    streamed.close()
+    assert response.closed == 2
+    # Closing twice gives the slot back only once
+    assert host_slot["semaphore"].acquire(blocking=False)
+    assert not host_slot["semaphore"].acquire(blocking=False)
+
+
+def test_failed_request_releases_host_slot():
+    ugdrive = UGdrive(host_concurrency=1)
+
+    def failing_request(*args, **kwargs):
+        raise ConnectionError("unreachable")
+
+    ugdrive.session.request = failing_request
+    with pytest.raises(ConnectionError):
+        ugdrive.make_request("GET", "https://host/a", stream=True)
+
+    assert ugdrive.throttle.hosts["host"]["semaphore"].acquire(
+        blocking=False
+    )
+
+
+class ErrorPageResponse(StreamedResponse):
+    status_code = 404
+
+    class raw:
+        retries = None
+
+        @staticmethod
+        def tell():
+            return 0
+
+    def raise_for_status(
+        self
+    ):
+        raise RuntimeError("HTTP 404")
+
+
+def test_scrape_folder_key_closes_response_on_http_error():
+    ugdrive = UGdrive()
+    response = ErrorPageResponse()
+    ugdrive.session.request = lambda *args, **kwargs: response
+
+    with pytest.raises(RuntimeError, match="404"):
+        ugdrive._scrape_folder_key("folder")
+
+    assert response.closed == 1
+    assert ugdrive.stats["requests"] == 1
+
+
+UGDRIVE_TREE = {
+    "root": ({"r": {"name": "R.nsp"}}, ["a", "b"]),
+    "a": ({"a": {"name": "A.nsp"}}, ["b", "root"]),
+    "b": ({"b": {"name": "B.nsp"}}, ["c"]),
+    "c": ({"c": {"name": "C.nsp"}}, []),
+}
+
+
+def crawling_drive(tree, broken_folder_id=None, workers=8):
+    ugdrive = UGdrive(workers=workers)
+    ugdrive.listed = []
+
+    def ls_folder(folder_id, progress_bar=None):
+        ugdrive.listed.append(folder_id)
+        if folder_id == broken_folder_id:
+            raise RuntimeError(f"Unable to list {folder_id}")
+        if folder_id == "slow":
+            sleep(0.2)
+        return tree[folder_id]
+
+    ugdrive._ls_folder = ls_folder
+    return ugdrive
+
+
+def test_crawl_lists_every_folder_once():
+    ugdrive = crawling_drive(UGDRIVE_TREE)
+    files = ugdrive.get_all_files_in_folders(["root", "a"])
+
+    assert sorted(files) == ["a", "b", "c", "r"]
+    assert sorted(ugdrive.listed) == ["a", "b", "c", "root"]
+
+
+def test_crawl_without_recursion_lists_given_folders():
+    ugdrive = crawling_drive(UGDRIVE_TREE)
+    files = ugdrive.get_all_files_in_folders(["root"], recursion=False)
+
+    assert files == {"r": {"name": "R.nsp"}}
+    assert ugdrive.listed == ["root"]
+
+
+def test_crawl_error_cancels_queued_folders():
+    tree = {
+        "root": ({}, ["broken", "slow", "c", "d", "e"]),
+        "slow": ({}, []),
+    }
+    ugdrive = crawling_drive(tree, broken_folder_id="broken", workers=1)
+    with pytest.raises(RuntimeError, match="Unable to list broken"):
+        ugdrive.get_all_files_in_folders(["root"])
+    assert ugdrive.listed[:2] == ["root", "broken"]
+    assert not {"c", "d", "e"} & set(ugdrive.listed)
@@ -0,0 +1,103 @@
+from Crypto.PublicKey.RSA import generate as generate_rsa_key
+from json import dumps as json_serialize
+from json import loads as json_deserialize
+import pytest
+from TinGen import utils
+from TinGen.utils import CompressionFlag
+from TinGen.utils import create_tinfoil_indexes
+from TinGen.utils import file_extension
+from TinGen.utils import read_index
+from TinGen.utils import serialize_json
+
+INDEX = {
+    "files": [
+        {"url": "gdrive:a#Pok%C3%A9mon.nsp", "size": 5},
+        {"url": "gdrive:b#b.nsz", "size": 7},
+    ],
+    "success": "Café ✓",
+    "version": "13.0",
+}
+
+
+@pytest.mark.parametrize("orjson_found", [True, False])
+def test_serialize_json_escapes_non_ascii(monkeypatch, orjson_found):
+    if orjson_found and not utils.orjson_found:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(utils, "orjson_found", orjson_found)
+
+    json_buffer = serialize_json(INDEX)
+
+    assert json_buffer.isascii()
+    assert json_buffer == json_serialize(
+        INDEX,
+        separators=(",", ":"),
+    ).encode()
+    assert json_deserialize(json_buffer) == INDEX
+
+
+def test_serialize_json_uses_orjson_for_files_only(monkeypatch):
+    if not utils.orjson_found:
+        pytest.skip("orjson is not installed")
+    serialized_objs = []
+
+    def orjson_serialize(obj):
+        serialized_objs.append(obj)
+        return json_serialize(obj, separators=(",", ":")).encode()
+
+    monkeypatch.setattr(utils, "orjson_serialize", orjson_serialize)
+
+    assert json_deserialize(serialize_json(INDEX)) == INDEX
+    assert serialized_objs == [INDEX["files"]]
+
+
+@pytest.mark.parametrize("file_name,extension", [
+    ("Game.nsp", "nsp"),
+    ("Game.v1.NSZ", "nsz"),
+    ("Game.tnsp", "tnsp"),
+    ("Game.7z", "7z"),
+    ("Game", ""),
+])
+def test_file_extension(file_name, extension):
+    assert file_extension(file_name) == extension
+
+
+@pytest.fixture(scope="module")
+def rsa_key_paths(tmp_path_factory):
+    key_dir = tmp_path_factory.mktemp("keys")
+    rsa_key = generate_rsa_key(2048)
+    (key_dir / "private.pem").write_bytes(rsa_key.export_key())
+    (key_dir / "public.pem").write_bytes(rsa_key.publickey().export_key())
+    return (key_dir / "public.pem", key_dir / "private.pem")
+
+
+def test_index_variants_round_trip(tmp_path, rsa_key_paths):
+    (public_key_path, private_key_path) = rsa_key_paths
+    outputs = [
+        (tmp_path / "index.json", None, False),
+        (tmp_path / "index.tfl", CompressionFlag.ZSTD_COMPRESSION, False),
+        (tmp_path / "zlib.tfl", CompressionFlag.ZLIB_COMPRESSION, False),
+        (tmp_path / "plain.tfl", CompressionFlag.NO_COMPRESSION, False),
+        (tmp_path / "enc.tfl", CompressionFlag.ZSTD_COMPRESSION, True),
+    ]
+    create_tinfoil_indexes(
+        INDEX,
+        outputs,
+        rsa_pub_key_path=public_key_path,
+        max_workers=1,
+    )
+
+    for (out_path, _, _) in outputs:
+        assert read_index(out_path, private_key_path) == INDEX
+
+
+def test_encrypted_index_needs_private_key(tmp_path, rsa_key_paths):
+    index_path = tmp_path / "enc.tfl"
+    create_tinfoil_indexes(
+        INDEX,
+        [(index_path, CompressionFlag.ZLIB_COMPRESSION, True)],
+        rsa_pub_key_path=rsa_key_paths[0],
+        max_workers=1,
+    )
+
+    with pytest.raises(RuntimeError):
+        read_index(index_path)
@@ -0,0 +1,36 @@
+from time import time
+from TinGen.verify import load_verify_cache
+from TinGen.verify import save_verify_cache
+from TinGen.verify import unverified_file_ids
+
+
+def test_verify_cache_drops_expired_entries(tmp_path):
+    cache_path = tmp_path / "cache" / "index.tfl.verify.json"
+    now = time()
+    save_verify_cache(
+        cache_path,
+        {"fresh": now - 10, "stale": now - 1000},
+        100,
+    )
+
+    assert load_verify_cache(cache_path) == {"fresh": now - 10}
+    assert load_verify_cache(tmp_path / "missing.json") == {}
+
+
+def test_unverified_file_ids_skip_recent_checks():
+    now = time()
+    verify_cache = {"fresh": now - 10, "stale": now - 1000}
+
+    assert unverified_file_ids(
+        ["new", "fresh", "stale", "new"],
+        verify_cache,
+        100,
+    ) == ["new", "stale"]
+
+
+def test_invalid_verify_cache_is_ignored(tmp_path, capsys):
+    cache_path = tmp_path / "index.tfl.verify.json"
+    cache_path.write_text("{")
+
+    assert load_verify_cache(cache_path) == {}
+    assert "not a valid JSON file" in capsys.readouterr().out
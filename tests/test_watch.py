@@ -0,0 +1,130 @@
+from argparse import Namespace
+from TinGen.watch import IndexWatcher
+
+FOLDER = IndexWatcher.FOLDER_MIME_TYPE
+
+
+class FakeDrive:
+    def __init__(
+        self,
+        parents
+    ):
+        self.parents = parents
+        self.calls = 0
+
+    def get_parents(
+        self,
+        file_id
+    ):
+        self.calls += 1
+        return self.parents.get(file_id, [])
+
+
+class FakeGenerator:
+    def __init__(
+        self,
+        parents
+    ):
+        self.gdrive_service = FakeDrive(parents)
+        self.folder_files = {"root-a": {"file-1": {}}, "root-b": {}}
+
+
+def watcher(parents):
+    index_watcher = IndexWatcher(FakeGenerator(parents), None, None)
+    index_watcher.config = Namespace(folder_ids=["root-a", "root-b"])
+    return index_watcher
+
+
+def file_change(file_id, parents):
+    return {"fileId": file_id, "file": {"parents": parents}}
+
+
+def folder_change(folder_id, parents):
+    return {
+        "fileId": folder_id,
+        "file": {"mimeType": FOLDER, "parents": parents},
+    }
+
+
+def test_changes_map_to_roots_through_ancestry():
+    index_watcher = watcher({"sub": ["mid"], "mid": ["root-b"]})
+
+    assert index_watcher.affected_roots([
+        file_change("new", ["sub"]),
+    ]) == ["root-b"]
+    assert index_watcher.folder_roots == {"sub": "root-b", "mid": "root-b"}
+
+    calls = index_watcher.generator.gdrive_service.calls
+    index_watcher.affected_roots([file_change("other", ["sub"])])
+    assert index_watcher.generator.gdrive_service.calls == calls
+
+
+def test_removed_file_maps_to_its_old_root():
+    index_watcher = watcher({})
+
+    assert index_watcher.affected_roots([
+        {"fileId": "file-1", "removed": True},
+    ]) == ["root-a"]
+
+
+def test_subtree_moved_into_root_is_picked_up():
+    parents = {"outside": ["elsewhere"], "child": ["outside"]}
+    index_watcher = watcher(parents)
+
+    assert index_watcher.affected_roots([
+        file_change("new", ["child"]),
+    ]) == []
+
+    parents.update({"outside": ["root-a"]})
+    assert index_watcher.affected_roots([
+        folder_change("outside", ["root-a"]),
+    ]) == ["root-a"]
+    assert index_watcher.affected_roots([
+        file_change("newer", ["child"]),
+    ]) == ["root-a"]
+
+
+def test_subtree_moved_between_roots_updates_both():
+    parents = {"moved": ["root-a"], "child": ["moved"]}
+    index_watcher = watcher(parents)
+
+    assert index_watcher.affected_roots([
+        file_change("new", ["child"]),
+    ]) == ["root-a"]
+
+    parents.update({"moved": ["root-b"]})
+    assert index_watcher.affected_roots([
+        folder_change("moved", ["root-b"]),
+    ]) == ["root-a", "root-b"]
+    assert index_watcher.affected_roots([
+        file_change("newer", ["child"]),
+    ]) == ["root-b"]
+
+
+def test_folders_outside_roots_are_cached_until_a_folder_changes():
+    index_watcher = watcher({"elsewhere": ["my-drive"]})
+    gdrive_service = index_watcher.generator.gdrive_service
+
+    assert index_watcher.affected_roots([
+        file_change("new", ["elsewhere"]),
+    ]) == []
+    calls = gdrive_service.calls
+    index_watcher.affected_roots([file_change("other", ["elsewhere"])])
+    assert gdrive_service.calls == calls
+
+    gdrive_service.parents.update({"elsewhere": ["root-a"]})
+    assert index_watcher.affected_roots([
+        folder_change("elsewhere", ["root-a"]),
+        file_change("moved", ["elsewhere"]),
+    ]) == ["root-a"]
+
+
+def test_failed_ancestry_lookups_are_not_cached():
+    index_watcher = watcher({})
+
+    def get_parents(file_id):
+        raise RuntimeError("Unavailable")
+
+    index_watcher.generator.gdrive_service.get_parents = get_parents
+    index_watcher.affected_roots([file_change("new", ["sub"])])
+    assert index_watcher.folder_roots == {}